@@ -1,7 +1,7 @@
 # 导入操作系统接口模块，用于处理文件路径和环境变量
 # 用于正则表达式匹配和处理字符串
-# 用于JSON数据的序列化和反序列化
-import json
+# 用于在线程中运行阻塞操作
+import asyncio
 # 导入日志模块，用于记录程序运行时的信息
 import logging
 import re
@@ -19,23 +19,37 @@ from typing import Optional
 
 # 用于运行FastAPI应用
 import uvicorn
-from concurrent_log_handler import ConcurrentRotatingFileHandler
 # 用于创建Web应用和处理HTTP异常
 from fastapi import FastAPI, HTTPException, Depends
 # 用于返回JSON和流式响应
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from langgraph.graph import StateGraph
 # 导入Pydantic的基类和字段定义工具
 from pydantic import BaseModel, Field
 
+from graph.advanced_agent.state import graph_input_formpt
+from tools.mcp.mcp_server import close_session_manager
+from utils.llm_cache import PostgresLLMCache, set_llm_cache
+from utils.llm_clients import aclose_http_clients
+from utils.log_utils import configure_logger
+from utils.memory_writer import get_memory_writer
+from utils.hooks import emit
+from utils.usage import start_request_usage, usage_accounting
+from utils.instrumentation import install_metrics_hooks
+from utils.metrics import registry
+from utils.tracing import get_tracer, install_tracing
+from utils.semantic_cache import SemanticCache, get_semantic_cache, set_semantic_cache
+from utils.sse import ChunkCoalescer, ChunkEncoder
+from utils.tool_idempotency import PostgresToolResultStore, set_tool_result_store
+from utils.transcript import PostgresTranscriptStore, set_transcript_store
 # 从自定义的库中引入函数
 from utils.agent_utils import (
-    create_graph,
+    create_async_graph,
     save_graph_visualization,
     get_llm,
     get_tools,
     Config,
-    ConnectionPool,
+    create_async_connection_pool,
     ConnectionPoolError,
     monitor_connection_pool,
 )
@@ -49,26 +63,18 @@ from utils.agent_utils import (
 
 
 # # 设置日志基本配置，级别为DEBUG或INFO
-logger = logging.getLogger(__name__)
-# 设置日志器级别为DEBUG
-logger.setLevel(logging.DEBUG)
+# 日志经共享的处理器写入 Config.LOG_FILE，默认由后台线程写出，不阻塞请求
+logger = configure_logger(logging.getLogger(__name__), logging.DEBUG)
 # logger.setLevel(logging.INFO)
-logger.handlers = []  # 清空默认处理器
-# 使用ConcurrentRotatingFileHandler
-handler = ConcurrentRotatingFileHandler(
-    # 日志文件
-    Config.LOG_FILE,
-    # 日志文件最大允许大小为5MB，达到上限后触发轮转
-    maxBytes=Config.MAX_BYTES,
-    # 在轮转时，最多保留3个历史日志文件
-    backupCount=Config.BACKUP_COUNT
-)
-# 设置处理器级别为DEBUG
-handler.setLevel(logging.DEBUG)
-handler.setFormatter(logging.Formatter(
-    "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-))
-logger.addHandler(handler)
+
+# 订阅节点、LLM、工具和请求事件，统计结果通过 /metrics 导出
+install_metrics_hooks()
+# 按配置启用追踪，span 写入 Config.TRACING_FILE
+install_tracing()
+
+# 全局状态图及工具配置，在 lifespan 中初始化
+graph = None
+tool_config = None
 
 
 # 定义消息类，用于封装API接口返回数据
@@ -78,10 +84,24 @@ class Message(BaseModel):
     content: str
 
 
+# 定义StreamOptions类，include_usage 为true时流式响应在结束块之后发送本次请求的用量
+class StreamOptions(BaseModel):
+    include_usage: Optional[bool] = False
+
+
 # 定义ChatCompletionRequest类
 class ChatCompletionRequest(BaseModel):
     messages: List[Message]
     stream: Optional[bool] = False
+    stream_options: Optional[StreamOptions] = None
+    userId: Optional[str] = None
+    conversationId: Optional[str] = None
+
+
+# 定义ResumeRequest类，继续运行 userId@@conversationId 线程中被中断的对话
+class ResumeRequest(BaseModel):
+    stream: Optional[bool] = False
+    stream_options: Optional[StreamOptions] = None
     userId: Optional[str] = None
     conversationId: Optional[str] = None
 
@@ -93,12 +113,20 @@ class ChatCompletionResponseChoice(BaseModel):
     finish_reason: Optional[str] = None
 
 
+# 定义Usage类，本次请求所有LLM调用的token用量之和，命中缓存的调用不计入
+class Usage(BaseModel):
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+
+
 # 定义ChatCompletionResponse类
 class ChatCompletionResponse(BaseModel):
     id: str = Field(default_factory=lambda: f"chatcmpl-{uuid.uuid4().hex}")
     object: str = "chat.completion"
     created: int = Field(default_factory=lambda: int(time.time()))
     choices: List[ChatCompletionResponseChoice]
+    usage: Usage = Field(default_factory=Usage)
     system_fingerprint: Optional[str] = None
 
 
@@ -165,21 +193,13 @@ async def lifespan(app: FastAPI):
         # 获取工具列表，基于嵌入模型
         tools = get_tools(llm_embedding)
 
-        # 定义数据库连接参数：自动提交、无预准备阈值、5秒超时
-        connection_kwargs = {"autocommit": True, "prepare_threshold": 0, "connect_timeout": 5}
-        # 创建数据库连接池：最大20个连接，最小2个活跃连接，超时10秒
-        db_connection_pool = ConnectionPool(
-            conninfo=Config.DB_URI,
-            max_size=20,
-            min_size=2,
-            kwargs=connection_kwargs,
-            timeout=10
-        )
+        # 按 Config 创建异步数据库连接池，检查点、存储及各类缓存共享该连接池
+        db_connection_pool = create_async_connection_pool()
 
         # 尝试打开数据库连接池
         try:
             # 打开连接池以启用数据库连接
-            db_connection_pool.open()
+            await db_connection_pool.open()
             # 记录连接池初始化成功的日志（INFO 级别）
             logger.info("Database connection pool initialized")
             # 记录详细调试日志（DEBUG 级别）
@@ -195,14 +215,36 @@ async def lifespan(app: FastAPI):
 
         # 尝试创建状态图
         try:
-            # 使用数据库连接池和模型创建状态图
-            graph = create_graph(db_connection_pool, llm_chat, llm_embedding, tool_config)
+            # 使用异步数据库连接池和模型创建状态图
+            graph = await create_async_graph(db_connection_pool, llm_chat, llm_embedding, tool_config)
         except ConnectionPoolError as e:
             # 记录状态图创建失败的错误日志
             logger.error(f"Graph creation failed: {e}")
             # 退出程序，返回状态码 1
             sys.exit(1)
 
+        # 使用Postgres保存对话记录时，复用同一个异步连接池
+        if Config.TRANSCRIPT_BACKEND == "postgres":
+            transcript_store = PostgresTranscriptStore(db_connection_pool)
+            await transcript_store.setup()
+            set_transcript_store(transcript_store)
+
+        # 语义答案缓存复用状态图的 PostgresStore 向量索引
+        if Config.SEMANTIC_CACHE_ENABLED:
+            set_semantic_cache(SemanticCache(graph.store))
+
+        # 启用Postgres响应缓存时，同样复用该连接池
+        if Config.LLM_CACHE_ENABLED and Config.LLM_CACHE_BACKEND == "postgres":
+            llm_cache = PostgresLLMCache(db_connection_pool)
+            await llm_cache.setup()
+            set_llm_cache(llm_cache)
+
+        # 工具调用结果记录在Postgres中，进程重启后恢复运行也不会重复执行已成功的工具调用
+        if Config.TOOL_IDEMPOTENCY_ENABLED:
+            tool_result_store = PostgresToolResultStore(db_connection_pool)
+            await tool_result_store.setup()
+            set_tool_result_store(tool_result_store)
+
         # 保存状态图的可视化表示
         save_graph_visualization(graph)
 
@@ -219,10 +261,20 @@ async def lifespan(app: FastAPI):
 
     # yield 表示应用运行期间，初始化完成后进入运行状态
     yield
+    # 关闭常驻的MCP会话
+    await close_session_manager()
+    # 等待后台队列中的记忆写入完成
+    if not await asyncio.to_thread(get_memory_writer().flush, 10):
+        logger.warning("Pending memories were not written before shutdown")
+    # 写出尚未导出的 span
+    if get_tracer() is not None:
+        await asyncio.to_thread(get_tracer().exporter.flush)
+    # 关闭LLM和Embedding共享的HTTP连接池
+    await aclose_http_clients()
     # 检查并关闭数据库连接池（清理资源）
     if db_connection_pool and not db_connection_pool.closed:
         # 关闭连接池
-        db_connection_pool.close()
+        await db_connection_pool.close()
         # 记录连接池关闭的日志
         logger.info("Database connection pool closed")
     # 记录服务关闭的日志
@@ -233,31 +285,90 @@ async def lifespan(app: FastAPI):
 app = FastAPI(lifespan=lifespan)
 
 
+# 格式化最终答案并构造非流式响应对象
+def build_chat_response(content, usage=None):
+    """
+    格式化最终答案并构造非流式响应。
+
+    Args:
+        content (str): 最终答案，为空时返回默认提示。
+        usage (RequestUsage): 本次请求的LLM用量，为None时（如命中语义缓存）用量为0。
+
+    Returns:
+        JSONResponse: 包含格式化响应的 JSON 响应对象。
+    """
+    # 格式化响应内容，若无内容则返回默认值
+    formatted_response = str(format_response(content)) if content else "No response generated"
+    # 记录格式化后的响应日志
+    logger.info(f"Results for Formatting: {formatted_response}")
+
+    # 构造返回给客户端的响应对象
+    try:
+        response = ChatCompletionResponse(
+            choices=[
+                ChatCompletionResponseChoice(
+                    index=0,
+                    message=Message(role="assistant", content=formatted_response),
+                    finish_reason="stop"
+                )
+            ],
+            usage=Usage(**usage.to_openai()) if usage is not None else Usage()
+        )
+    except Exception as resp_error:
+        # 捕获并记录构造响应对象时的异常
+        logger.error(f"Error creating response object: {resp_error}")
+        # 构造错误响应对象
+        response = ChatCompletionResponse(
+            choices=[
+                ChatCompletionResponseChoice(
+                    index=0,
+                    message=Message(role="assistant", content="Error generating response"),
+                    finish_reason="error"
+                )
+            ]
+        )
+
+    # 记录发送给客户端的响应内容日志
+    logger.info(f"Send response content: \n{response}")
+    # 返回 JSON 格式的响应对象
+    return JSONResponse(content=response.model_dump())
+
+
 # 处理非流式响应的异步函数，生成并返回完整的响应内容
-async def handle_non_stream_response(user_input, graph, config):
+async def handle_non_stream_response(user_input, graph, config, request_start=None, cache_answer=False):
     """
     处理非流式响应的异步函数，生成并返回完整的响应内容。
 
     Args:
-        user_input (str): 用户输入的内容。
+        user_input (dict): 由用户输入构造的 graph 输入状态，为None时从线程最后的检查点继续运行。
         graph: 图对象，用于处理消息流。
-        tool_config: 工具配置对象，包含可用工具的名称和定义。
         config (dict): 配置参数，包含线程和用户标识。
+        request_start (float): 请求开始的 time.perf_counter() 时间，用于统计请求耗时。
+        cache_answer (bool): 是否将完整的最终报告写入语义缓存，只用于单轮请求，见 is_single_turn。
 
     Returns:
         JSONResponse: 包含格式化响应的 JSON 响应对象。
     """
+    request_start = request_start or time.perf_counter()
+    # 统计本次请求的LLM用量，graph 中的节点共享该对象并据此检查请求预算
+    usage = start_request_usage(config["configurable"]["user_id"])
     # 初始化 content 变量，用于存储最终响应内容
     content = None
+    # report_node 生成的最终报告，只有它可以写入语义缓存
+    final_report = None
+    error = False
     try:
-        # 启动 graph.stream 处理用户输入，生成事件流
-        events = graph.stream(user_input, config)
+        # 启动 graph.astream 处理用户输入，生成事件流，等待LLM和工具时让出事件循环
+        events = graph.astream(user_input, config, durability=Config.CHECKPOINT_DURABILITY)
         # 遍历事件流中的每个事件
-        for event in events:
-            # 遍历事件中的所有值
-            for value in event.values():
+        async for event in events:
+            # 遍历事件中的所有节点及其状态更新
+            for node_name, value in event.items():
+                if node_name == "report_node" and isinstance(value, dict) and value.get("final_report") is not None:
+                    final_report = getattr(value["final_report"], "content", value["final_report"])
                 # 检查事件值是否包含有效消息列表
-                if "messages" not in value or not isinstance(value["messages"], list):
+                if value is None or "messages" not in value or not isinstance(value["messages"], list) \
+                        or not value["messages"]:
                     # 记录警告日志，跳过无效消息
                     logger.warning("No valid messages in response")
                     continue
@@ -297,55 +408,73 @@ async def handle_non_stream_response(user_input, graph, config):
     except ValueError as ve:
         # 捕获并记录值错误
         logger.error(f"Value error in response processing: {ve}")
+        error = True
     except Exception as e:
         # 捕获并记录其他未预期的异常
         logger.error(f"Error processing response: {e}")
+        error = True
 
-    # 格式化响应内容，若无内容则返回默认值
-    formatted_response = str(format_response(content)) if content else "No response generated"
-    # 记录格式化后的响应日志
-    logger.info(f"Results for Formatting: {formatted_response}")
+    # 缓存完整执行得到的最终报告，相似的问题可直接返回
+    semantic_cache = get_semantic_cache()
+    if isinstance(final_report, str) and final_report and semantic_cache and cache_answer \
+            and is_complete_answer(error, usage):
+        await semantic_cache.aupdate(user_input["user_message"], final_report, config["configurable"]["user_id"])
 
-    # 构造返回给客户端的响应对象
-    try:
-        response = ChatCompletionResponse(
-            choices=[
-                ChatCompletionResponseChoice(
-                    index=0,
-                    message=Message(role="assistant", content=formatted_response),
-                    finish_reason="stop"
-                )
-            ]
-        )
-    except Exception as resp_error:
-        # 捕获并记录构造响应对象时的异常
-        logger.error(f"Error creating response object: {resp_error}")
-        # 构造错误响应对象
-        response = ChatCompletionResponse(
-            choices=[
-                ChatCompletionResponseChoice(
-                    index=0,
-                    message=Message(role="assistant", content="Error generating response"),
-                    finish_reason="error"
-                )
-            ]
-        )
+    response = build_chat_response(content, usage)
+    emit_request_usage(usage)
+    emit("request_end", stream=False, cached=False, elapsed=time.perf_counter() - request_start, error=error)
+    return response
 
-    # 记录发送给客户端的响应内容日志
-    logger.info(f"Send response content: \n{response}")
-    # 返回 JSON 格式的响应对象
-    return JSONResponse(content=response.model_dump())
+
+# 将节点的状态更新转换为流式进度事件
+def build_progress_event(node_name, update, plan=None):
+    """
+    将 graph 节点的状态更新转换为进度事件。
+
+    Args:
+        node_name (str): 产生更新的节点名称。
+        update (dict): 节点返回的状态更新。
+        plan (dict): 最近一次的计划，用于查找STEP标题。
+
+    Returns:
+        tuple: (进度事件，没有对应事件时为None, 更新后的最近计划)
+    """
+    if not isinstance(update, dict):
+        return None, plan
+    if node_name in ("create_planner_node", "update_planner_node") and update.get("plan"):
+        plan = update["plan"]
+        steps = plan.get("steps", [])
+        event = {
+            "stage": "plan_created" if node_name == "create_planner_node" else "plan_updated",
+            "goal": plan.get("goal", ""),
+            "completed": sum(1 for step in steps if step.get("status") == "completed"),
+            "total": len(steps),
+        }
+        if node_name == "create_planner_node":
+            event["steps"] = [{"id": step.get("id"), "title": step.get("title")} for step in steps]
+        return event, plan
+    if node_name == "execute_node" and update.get("step_results"):
+        titles = {step.get("id"): step.get("title") for step in (plan or {}).get("steps", [])}
+        step_id = next(iter(update["step_results"]))
+        return {"stage": "step_completed", "step_id": step_id, "title": titles.get(step_id, "")}, plan
+    if node_name == "report_node":
+        return {"stage": "report_completed"}, plan
+    return None, plan
 
 
 # 处理流式响应的异步函数，生成并返回流式数据
-async def handle_stream_response(user_input, graph, config):
+async def handle_stream_response(user_input, graph, config, request_start=None, include_usage=False,
+                                 cache_answer=False):
     """
     处理流式响应的异步函数，生成并返回流式数据。
 
     Args:
-        user_input (str): 用户输入的内容。
+        user_input (dict): 由用户输入构造的 graph 输入状态，为None时从线程最后的检查点继续运行。
         graph: 图对象，用于处理消息流。
         config (dict): 配置参数，包含线程和用户标识。
+        request_start (float): 请求开始的 time.perf_counter() 时间，用于统计首个数据块和请求耗时。
+        include_usage (bool): 是否在结束块之后发送本次请求的用量数据块。
+        cache_answer (bool): 是否将完整的最终报告写入语义缓存，只用于单轮请求，见 is_single_turn。
 
     Returns:
         StreamingResponse: 流式响应对象，媒体类型为 text/event-stream。
@@ -356,50 +485,129 @@ async def handle_stream_response(user_input, graph, config):
         内部异步生成器函数，用于产生流式响应数据。
 
         Yields:
-            str: 流式数据块，格式为 SSE (Server-Sent Events)。
+            bytes: 流式数据块，格式为 SSE (Server-Sent Events)。
 
         Raises:
             Exception: 流生成过程中可能抛出的异常。
         """
+        error = False
+        # 生成器在响应任务中运行，在这里开始统计，graph 的节点继承该上下文
+        usage = start_request_usage(config["configurable"]["user_id"])
         try:
-            # 生成唯一的 chunk ID
-            chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
-            # 调用 graph.stream 获取消息流
-            stream_data = graph.stream(
+            # 生成唯一的 chunk ID，数据块的前缀和后缀只生成一次
+            encoder = ChunkEncoder(f"chatcmpl-{uuid.uuid4().hex}")
+            # 合并过小的token增量，减少每帧的序列化和发送开销
+            coalescer = ChunkCoalescer(Config.STREAM_COALESCE_CHARS, Config.STREAM_COALESCE_MS / 1000)
+            # 收集最终报告的内容，流结束后写入语义缓存
+            report_chunks = []
+            # report_node 是否正常结束，以及是否有数据块处理失败，两者都满足条件时报告才会写入语义缓存
+            report_done = False
+            chunk_error_seen = False
+            frames = 0
+            # 最近一次的计划，用于在进度事件中补充STEP标题
+            plan = None
+            # 先发送角色信息，客户端可以立即确认连接可用
+            yield encoder.role()
+            # 同时订阅 messages（LLM逐token输出）和 updates（节点完成后的状态更新）
+            stream_data = graph.astream(
                 user_input,
                 config,
-                stream_mode="messages"
+                stream_mode=["messages", "updates"],
+                # 每步结束前写入检查点，中断后可以通过 /v1/chat/resume 从最后完成的一步继续
+                durability=Config.CHECKPOINT_DURABILITY
             )
             # 遍历消息流中的每个数据块
-            for message_chunk, metadata in stream_data:
+            async for mode, data in stream_data:
                 try:
+                    if mode == "updates":
+                        report_done = report_done or "report_node" in data
+                        if not Config.STREAM_PROGRESS_EVENTS:
+                            continue
+                        for node_name, update in data.items():
+                            event, plan = build_progress_event(node_name, update, plan)
+                            if event is not None:
+                                # 进度事件使用单独的SSE事件类型，只读取 data 的客户端会忽略
+                                yield encoder.event("progress", event)
+                        continue
+                    message_chunk, metadata = data
                     # 获取当前节点名称
                     node_name = metadata.get("langgraph_node") if metadata else None
-                    # 仅处理 report 节点
+                    # 仅转发 report 节点的输出，计划和执行阶段的LLM输出只作为进度事件
                     if node_name in ["report_node"]:
                         # 获取消息内容，默认空字符串
                         chunk = getattr(message_chunk, 'content', '')
-                        # 记录流式数据块日志
-                        logger.info(f"Streaming chunk from {node_name}: {chunk}")
-                        # 产出流式数据块
-                        yield f"data: {json.dumps({'id': chunk_id, 'object': 'chat.completion.chunk', 'created': int(time.time()), 'choices': [{'index': 0, 'delta': {'content': chunk}, 'finish_reason': None}]})}\n\n"
+                        if not chunk:
+                            continue
+                        if not report_chunks:
+                            emit("first_token", elapsed=time.perf_counter() - start)
+                        report_chunks.append(chunk)
+                        text = coalescer.add(chunk)
+                        if text is not None:
+                            frames += 1
+                            # 产出流式数据块
+                            yield encoder.content(text)
                 except Exception as chunk_error:
                     # 记录单个数据块处理异常
                     logger.error(f"Error processing stream chunk: {chunk_error}")
+                    chunk_error_seen = True
                     continue
 
+            text = coalescer.flush()
+            if text is not None:
+                frames += 1
+                yield encoder.content(text)
+            # 每个请求只记录一次汇总日志，不在逐token的路径上同步写日志
+            logger.debug(f"Streamed {len(report_chunks)} report chunks in {frames} frames")
+
+            semantic_cache = get_semantic_cache()
+            if report_chunks and report_done and semantic_cache and cache_answer \
+                    and is_complete_answer(chunk_error_seen, usage):
+                await semantic_cache.aupdate(user_input["user_message"], "".join(report_chunks),
+                                             config["configurable"]["user_id"])
+
             # 产出流结束标记
-            yield f"data: {json.dumps({'id': chunk_id, 'object': 'chat.completion.chunk', 'created': int(time.time()), 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})}\n\n"
+            yield encoder.stop()
+            if include_usage:
+                yield encoder.usage(usage.to_openai())
         except Exception as stream_error:
             # 记录流生成过程中的异常
             logger.error(f"Stream generation error: {stream_error}")
+            error = True
             # 产出错误提示
-            yield f"data: {json.dumps({'error': 'Stream processing failed'})}\n\n"
+            yield ChunkEncoder.error("Stream processing failed")
+        finally:
+            emit_request_usage(usage)
+            emit("request_end", stream=True, cached=False, elapsed=time.perf_counter() - start, error=error)
+
+    start = request_start or time.perf_counter()
 
     # 返回流式响应对象
     return StreamingResponse(generate_stream(), media_type="text/event-stream")
 
 
+# 以流式格式返回语义缓存命中的答案
+async def handle_cached_stream_response(content, include_usage=False):
+    """
+    将缓存的答案作为单个数据块返回，格式与 handle_stream_response 一致。
+
+    Args:
+        content (str): 缓存的最终答案。
+        include_usage (bool): 是否在结束块之后发送用量数据块，命中缓存时用量为0。
+
+    Returns:
+        StreamingResponse: 流式响应对象，媒体类型为 text/event-stream。
+    """
+
+    async def generate_stream():
+        encoder = ChunkEncoder(f"chatcmpl-{uuid.uuid4().hex}")
+        yield encoder.content(content)
+        yield encoder.stop()
+        if include_usage:
+            yield encoder.usage(Usage().model_dump())
+
+    return StreamingResponse(generate_stream(), media_type="text/event-stream")
+
+
 # 依赖注入函数，用于获取 graph
 async def get_dependencies() -> StateGraph:
     """
@@ -416,6 +624,66 @@ async def get_dependencies() -> StateGraph:
     return graph
 
 
+@app.get("/metrics")
+async def metrics():
+    """以 Prometheus 文本格式导出服务指标"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/v1/usage/{user_id}")
+async def user_usage(user_id: str):
+    """查询用户自服务启动以来累计的LLM用量（按用户的用量不作为 /metrics 的标签导出）"""
+    usage = usage_accounting.get_user_usage(user_id)
+    if usage is None:
+        raise HTTPException(status_code=404, detail=f"No usage recorded for user {user_id}")
+    return JSONResponse(content={"user_id": user_id, **usage})
+
+
+def build_run_config(request) -> dict:
+    """定义运行时配置，包含线程ID、用户ID及graph的最大超步数，使用默认值防止未定义"""
+    return {
+        "configurable": {
+            "thread_id": f"{getattr(request, 'userId', 'unknown')}@@{getattr(request, 'conversationId', 'default')}",
+            "user_id": getattr(request, 'userId', 'unknown')
+        },
+        "recursion_limit": Config.GRAPH_RECURSION_LIMIT
+    }
+
+
+def include_usage(request) -> bool:
+    """流式请求是否要求在结束块之后返回用量（OpenAI 的 stream_options.include_usage）"""
+    return bool(request.stream_options and request.stream_options.include_usage)
+
+
+def is_complete_answer(error, usage) -> bool:
+    """
+    最终报告是否基于完整的执行：没有出错，也没有STEP、计划更新或报告因执行上限、截止时间或预算提前结束。
+    只有完整的报告可以写入语义缓存，部分结果和超时时代替报告的STEP结果不会作为相似问题的答案。
+    """
+    return not error and not usage.cut_short
+
+
+async def is_single_turn(request, graph, config) -> bool:
+    """
+    请求是否为单轮对话：请求中除系统提示外没有之前的消息，线程中也没有之前的对话。
+    语义缓存只按问题文本匹配，"继续"、"再详细一点" 这类追问的答案取决于上下文，不能使用或写入缓存。
+    """
+    if any(message.role != "system" for message in request.messages[:-1]):
+        return False
+    try:
+        state = await graph.aget_state(config)
+    except Exception as e:
+        logger.warning(f"Failed to read thread state for the semantic cache: {e}")
+        return False
+    return not state.values.get("messages")
+
+
+def emit_request_usage(usage) -> None:
+    """触发 request_usage 事件，按请求统计用量"""
+    emit("request_usage", user_id=usage.user_id, input_tokens=usage.input_tokens,
+         output_tokens=usage.output_tokens, calls=usage.calls, exhausted=usage.exhausted() is not None)
+
+
 @app.post("/v1/chat/completions")
 async def chat_completions(request: ChatCompletionRequest, dependencies: StateGraph = Depends(get_dependencies)):
     """接收来自前端的请求数据进行业务的处理。
@@ -426,31 +694,82 @@ async def chat_completions(request: ChatCompletionRequest, dependencies: StateGr
     Returns:
         标准的Python字典。
     """
+    request_start = time.perf_counter()
+    emit("request_start", stream=bool(request.stream))
     try:
-        graph, tool_config = dependencies
+        graph = dependencies
         # 检查request是否有效
         if not request.messages or not request.messages[-1].content:
             logger.error("Invalid request: Empty or invalid messages")
             raise HTTPException(status_code=400, detail="Messages cannot be empty or invalid")
         user_input = request.messages[-1].content
         logger.info(f"The user's user_input is: {user_input}")
-
-        # 定义运行时配置，包含线程ID和用户ID，使用默认值防止未定义
-        config = {
-            "configurable": {
-                "thread_id": f"{getattr(request, 'userId', 'unknown')}@@{getattr(request, 'conversationId', 'default')}",
-                "user_id": getattr(request, 'userId', 'unknown')
-            }
-        }
+        # 构造advanced agent的输入状态
+        graph_input = graph_input_formpt(user_input)
+
+        config = build_run_config(request)
+
+        # 语义缓存命中时跳过计划和执行流程，只用于没有上文的单轮请求
+        semantic_cache = get_semantic_cache()
+        cache_answer = semantic_cache is not None and await is_single_turn(request, graph, config)
+        if cache_answer:
+            cached = await semantic_cache.alookup(user_input, config["configurable"]["user_id"])
+            if cached is not None:
+                emit("request_end", stream=request.stream, cached=True,
+                     elapsed=time.perf_counter() - request_start, error=False)
+                if request.stream:
+                    return await handle_cached_stream_response(cached, include_usage(request))
+                return build_chat_response(cached)
 
         # 调用流式输出
         if request.stream:
-            return await handle_stream_response(user_input, graph, config)
+            return await handle_stream_response(graph_input, graph, config, request_start, include_usage(request),
+                                                cache_answer)
         # 调用非流式输出
-        return await handle_non_stream_response(user_input, graph, tool_config, config)
+        return await handle_non_stream_response(graph_input, graph, config, request_start, cache_answer)
 
     except Exception as e:
         logger.error(f"Error handling chat completion:\n\n {str(e)}")
+        emit("request_end", stream=bool(request.stream), cached=False,
+             elapsed=time.perf_counter() - request_start, error=True)
+        if isinstance(e, HTTPException):
+            raise
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/v1/chat/resume")
+async def chat_resume(request: ResumeRequest, dependencies: StateGraph = Depends(get_dependencies)):
+    """从线程最后完成的一步继续运行被中断的对话（超时、断开连接或进程重启）。
+
+    已完成的STEP从检查点恢复，不会重新执行；中断时正在执行的STEP重新运行，
+    其中已成功的工具调用按幂等键返回记录的结果。
+
+    Args:
+        request: 请求参数。
+
+    Returns:
+        与 /v1/chat/completions 相同格式的响应。
+    """
+    request_start = time.perf_counter()
+    emit("request_start", stream=bool(request.stream))
+    try:
+        graph = dependencies
+        config = build_run_config(request)
+        state = await graph.aget_state(config)
+        if not state.next:
+            raise HTTPException(status_code=409, detail="Nothing to resume for this conversation")
+        logger.info(f"Resuming thread {config['configurable']['thread_id']} at {state.next}")
+
+        if request.stream:
+            return await handle_stream_response(None, graph, config, request_start, include_usage(request))
+        return await handle_non_stream_response(None, graph, config, request_start)
+
+    except Exception as e:
+        logger.error(f"Error resuming chat completion:\n\n {str(e)}")
+        emit("request_end", stream=bool(request.stream), cached=False,
+             elapsed=time.perf_counter() - request_start, error=True)
+        if isinstance(e, HTTPException):
+            raise
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -0,0 +1,123 @@
+"""
+检查点写入量基准测试：同一线程连续进行多轮对话，统计每个检查点（每步）写入 checkpoint_blobs 的字节数
+
+  - full:       AsyncPostgresSaver 的方式，每个有新版本的通道写入完整的序列化值
+  - compacted:  CompactingAsyncPostgresSaver 的方式，列表通道只写入新元素内容和哈希列表
+
+默认使用记录写入内容的内存检查点，不需要数据库；指定 --postgres 时分别使用两种检查点保存类
+连接 Config.DB_URI 运行，并输出各检查点表的实际大小（会先删除基准测试线程的已有数据）。
+
+运行方式（在项目根目录，需存在 config.yaml）：
+
+    python -m benchmarks.bench_checkpoint_bytes --turns 5 --width 4
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+
+from langchain_mcp_adapters.client import MultiServerMCPClient
+from langgraph.checkpoint.memory import InMemorySaver
+
+import tools.mcp.mcp_server as mcp_server
+
+# 节点模块导入时会实例化ChatOpenAI，提供占位密钥即可，基准测试不会真正调用
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+# 在导入节点模块之前替换MCP配置为空，基准测试不连接任何MCP Server
+mcp_server.get_all_mcp = lambda: MultiServerMCPClient({})
+
+from benchmarks.stubs import StubChatModel  # noqa: E402
+from graph.advanced_agent import nodes  # noqa: E402
+from graph.advanced_agent.graph import get_graph_builder  # noqa: E402
+from graph.advanced_agent.state import graph_input_formpt  # noqa: E402
+from utils.checkpointer import CompactingAsyncPostgresSaver, dump_compacted, rows_size  # noqa: E402
+from utils.db_pool import InstrumentedAsyncPostgresSaver, create_async_connection_pool  # noqa: E402
+
+TABLES = ("checkpoints", "checkpoint_blobs", "checkpoint_writes", "checkpoint_content")
+
+
+class RecordingSaver(InMemorySaver):
+    """按两种方式计算每个检查点写入 checkpoint_blobs 的字节数"""
+
+    def __init__(self):
+        super().__init__()
+        self.steps = []
+        self._known = set()
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        values = {k: v for k, v in checkpoint["channel_values"].items()
+                  if not (v is None or isinstance(v, (str, int, float, bool)))}
+        versions = {k: v for k, v in new_versions.items() if k in values}
+        full_rows = [(thread_id, checkpoint_ns, k, str(v), *self.serde.dumps_typed(values[k]))
+                     for k, v in versions.items()]
+        blob_rows, content_rows = dump_compacted(self.serde, thread_id, checkpoint_ns, values, versions, self._known)
+        self._known.update(row[1] for row in content_rows)
+        self.steps.append((rows_size(full_rows), rows_size(blob_rows) + rows_size(content_rows)))
+        return super().put(config, checkpoint, metadata, new_versions)
+
+
+async def run_turns(graph, turns: int, thread_id: str, recorder: RecordingSaver = None):
+    config = {"configurable": {"thread_id": thread_id, "user_id": "bench"}, "recursion_limit": 200}
+    for turn in range(turns):
+        start = len(recorder.steps) if recorder else 0
+        await graph.ainvoke(graph_input_formpt(f"turn {turn}: analyse the report"), config)
+        if recorder:
+            steps = recorder.steps[start:]
+            full = [s[0] for s in steps]
+            compacted = [s[1] for s in steps]
+            print(f"{turn + 1:>5} {len(steps):>6} {statistics.mean(full):>14,.0f} {statistics.mean(compacted):>16,.0f} "
+                  f"{sum(full) / max(sum(compacted), 1):>7.1f}x")
+
+
+async def run_postgres(turns: int):
+    pool = create_async_connection_pool("bench")
+    await pool.open()
+    try:
+        # 创建包括 checkpoint_content 在内的全部表
+        await CompactingAsyncPostgresSaver(pool).setup()
+        for name, saver_class in (("full", InstrumentedAsyncPostgresSaver),
+                                  ("compacted", CompactingAsyncPostgresSaver)):
+            saver = saver_class(pool)
+            thread_id = f"bench-checkpoint-{name}"
+            await saver.adelete_thread(thread_id)
+            async with pool.connection() as conn:
+                await conn.execute("DELETE FROM checkpoint_content WHERE thread_id = %s", (thread_id,))
+            graph = get_graph_builder().compile(checkpointer=saver)
+            await run_turns(graph, turns, thread_id)
+            async with pool.connection() as conn:
+                sizes = []
+                for table in TABLES:
+                    cur = await conn.execute(
+                        f"SELECT count(*), coalesce(sum(pg_column_size(t.*)), 0) FROM {table} t WHERE thread_id = %s",
+                        (thread_id,))
+                    sizes.append(await cur.fetchone())
+            print(f"{name:>10} " + " ".join(f"{rows:>8} {size / 1024:>9.0f}" for rows, size in sizes))
+    finally:
+        await pool.close()
+
+
+async def main(turns: int, width: int, tokens: int, postgres: bool):
+    logging.disable(logging.WARNING)
+    nodes.set_llm(StubChatModel(latency=0, plan_width=width, report_tokens=tokens))
+    print(f"turns={turns}, plan width={width}, report tokens={tokens}")
+    if postgres:
+        print(f"{'saver':>10} " + " ".join(f"{table[11:] or table:>8} {'KB':>9}" for table in TABLES))
+        await run_postgres(turns)
+        return
+    recorder = RecordingSaver()
+    graph = get_graph_builder().compile(checkpointer=recorder)
+    print(f"{'turn':>5} {'steps':>6} {'full(B/step)':>14} {'compacted(B/step)':>16} {'ratio':>8}")
+    await run_turns(graph, turns, "bench", recorder)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=5, help="同一线程的对话轮数")
+    parser.add_argument("--width", type=int, default=4, help="计划的STEP数量")
+    parser.add_argument("--tokens", type=int, default=200, help="最终报告的token数量")
+    parser.add_argument("--postgres", action="store_true", help="连接 Config.DB_URI 比较实际的表大小")
+    args = parser.parse_args()
+    asyncio.run(main(args.turns, args.width, args.tokens, args.postgres))
@@ -0,0 +1,81 @@
+"""
+/v1/chat/completions 并发负载基准测试。
+
+使用桩模型替换真实LLM，分别在 1、8、64 个并发客户端下请求接口，输出 requests/sec。
+运行方式（在项目根目录，需存在 config.yaml）：
+
+    python -m benchmarks.bench_concurrency --latency 0.05 --rounds 4
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+import httpx
+
+from langchain_mcp_adapters.client import MultiServerMCPClient
+
+import tools.mcp.mcp_server as mcp_server
+
+# 节点模块导入时会实例化ChatOpenAI，提供占位密钥即可，基准测试不会真正调用
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+# 在导入节点模块之前替换MCP配置为空，基准测试不连接任何MCP Server
+mcp_server.get_all_mcp = lambda: MultiServerMCPClient({})
+
+import backend  # noqa: E402
+from benchmarks.stubs import StubChatModel  # noqa: E402
+from graph.advanced_agent import nodes  # noqa: E402
+from graph.advanced_agent.graph import build_graph_with_memory  # noqa: E402
+from utils.transcript import NullTranscriptStore, set_transcript_store  # noqa: E402
+
+# 基准测试不写入对话记录文件
+set_transcript_store(NullTranscriptStore())
+
+
+async def run_level(client: httpx.AsyncClient, concurrency: int, rounds: int) -> float:
+    """以指定并发数发送 concurrency * rounds 个请求，返回 requests/sec"""
+    total = concurrency * rounds
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(i)
+
+    async def worker(worker_id: int):
+        while not queue.empty():
+            i = queue.get_nowait()
+            payload = {
+                "messages": [{"role": "user", "content": f"bench request {i}"}],
+                "stream": False,
+                "userId": f"bench-{worker_id}",
+                "conversationId": str(i),
+            }
+            response = await client.post("/v1/chat/completions", json=payload)
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(concurrency)))
+    return total / (time.perf_counter() - start)
+
+
+async def main(latency: float, rounds: int):
+    # 基准测试只关心吞吐量，关闭WARNING及以下级别的日志
+    logging.disable(logging.WARNING)
+    nodes.set_llm(StubChatModel(latency=latency))
+    backend.graph = build_graph_with_memory()
+    # 每个请求包含 create_planner / execute / update_planner / report 四次LLM调用
+    serial_rps = 1 / (latency * 4)
+    transport = httpx.ASGITransport(app=backend.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        print(f"stub latency={latency}s, serial upper bound={serial_rps:.2f} req/s")
+        print(f"{'clients':>8} {'requests':>9} {'req/s':>10} {'speedup':>8}")
+        for concurrency in (1, 8, 64):
+            rps = await run_level(client, concurrency, rounds)
+            print(f"{concurrency:>8} {concurrency * rounds:>9} {rps:>10.2f} {rps / serial_rps:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.05, help="桩模型单次调用延迟（秒）")
+    parser.add_argument("--rounds", type=int, default=4, help="每个并发客户端发送的请求数")
+    args = parser.parse_args()
+    asyncio.run(main(args.latency, args.rounds))
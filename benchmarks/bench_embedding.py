@@ -0,0 +1,76 @@
+"""
+记忆检索延迟基准测试：并发调用 store_memory，对比直接使用Embedding模型与 BatchedEmbeddings 的 p50/p99 延迟。
+
+桩Embedding模型每次接口调用有固定延迟并限制并发数，问题从较小的问题池中随机抽取以模拟重复提问。
+
+运行方式（在项目根目录，需存在 config.yaml）：
+
+    python -m benchmarks.bench_embedding --requests 400 --concurrency 32
+"""
+import argparse
+import logging
+import os
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.messages import HumanMessage
+from langgraph.store.memory import InMemoryStore
+
+# 导入 agent_utils 时会初始化工具和模型配置，提供占位密钥即可，基准测试不会真正调用
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+
+from benchmarks.stubs import StubEmbeddings  # noqa: E402
+from utils.agent_utils import store_memory  # noqa: E402
+from utils.embedding_batcher import BatchedEmbeddings  # noqa: E402
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def run(embeddings, questions, concurrency):
+    store = InMemoryStore(index={"dims": 16, "embed": embeddings})
+    config = {"configurable": {"user_id": "bench"}}
+
+    def lookup(question):
+        start = time.perf_counter()
+        store_memory(HumanMessage(content=question), config, store)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(lookup, questions))
+    return latencies, time.perf_counter() - start
+
+
+def main(requests, concurrency, distinct, latency):
+    logging.disable(logging.WARNING)
+    rng = random.Random(0)
+    questions = [f"question {rng.randrange(distinct)}" for _ in range(requests)]
+    print(f"requests={requests}, concurrency={concurrency}, distinct questions={distinct}, "
+          f"stub latency={latency}s")
+    print(f"{'mode':>8} {'p50(ms)':>9} {'p99(ms)':>9} {'total(s)':>9} {'api calls':>10}")
+    for mode in ("direct", "batched"):
+        stub = StubEmbeddings(latency=latency)
+        embeddings = stub if mode == "direct" else BatchedEmbeddings(stub)
+        latencies, total = run(embeddings, questions, concurrency)
+        print(f"{mode:>8} {percentile(latencies, 0.5) * 1000:9.1f} {percentile(latencies, 0.99) * 1000:9.1f} "
+              f"{total:9.2f} {stub.calls:10d}")
+        if mode == "batched":
+            metrics = embeddings.get_metrics()
+            print(f"avg batch size={metrics['avg_batch_size']:.1f}, max batch size={metrics['max_batch_size']}, "
+                  f"cache hit rate={metrics['cache_hit_rate']:.1%}, "
+                  f"mean latency={statistics.mean(latencies) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400, help="store_memory 调用次数")
+    parser.add_argument("--concurrency", type=int, default=32, help="并发线程数")
+    parser.add_argument("--distinct", type=int, default=100, help="问题池大小")
+    parser.add_argument("--latency", type=float, default=0.03, help="桩Embedding单次接口调用延迟（秒）")
+    args = parser.parse_args()
+    main(args.requests, args.concurrency, args.distinct, args.latency)
@@ -0,0 +1,155 @@
+"""
+LLM HTTP连接池基准测试：本地启动模拟 OpenAI 接口的 HTTPS 服务，对比 ChatOpenAI 的两种用法
+
+  - per call: 每次调用新建 ChatOpenAI 和 HTTP 客户端（旧的 initialize_llm 每次调用都重新创建客户端），
+              每次调用都要重新建立TCP连接和TLS握手
+  - shared:   utils.llm_clients 的方式，所有调用共享同一个连接池，复用 keep-alive 连接
+
+服务前面有一个转发代理，每个方向的数据延迟 --rtt 的一半，模拟到模型服务的网络往返时间。
+证书由 openssl 命令临时生成。HTTP/2 需要安装 h2，模拟服务（uvicorn）只支持 HTTP/1.1。
+
+运行方式（在项目根目录，需存在 config.yaml）：
+
+    python -m benchmarks.bench_llm_http --calls 200 --concurrency 8 --rtt 20
+"""
+import argparse
+import asyncio
+import logging
+import os
+import ssl
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI
+from langchain_openai import ChatOpenAI
+
+from utils.llm_clients import create_async_http_client, http_metrics
+
+SERVER_PORT = 18443
+PROXY_PORT = 18444
+
+
+def create_app(server_ms: float) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(body: dict):
+        await asyncio.sleep(server_ms / 1000)
+        return {
+            "id": "chatcmpl-bench", "object": "chat.completion", "created": int(time.time()), "model": body["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 1, "total_tokens": 11},
+        }
+
+    return app
+
+
+async def _relay(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, delay: float):
+    try:
+        while data := await reader.read(65536):
+            await asyncio.sleep(delay)
+            writer.write(data)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def _proxy(client_reader, client_writer, delay: float):
+    server_reader, server_writer = await asyncio.open_connection("127.0.0.1", SERVER_PORT)
+    await asyncio.gather(_relay(client_reader, server_writer, delay), _relay(server_reader, client_writer, delay))
+
+
+def start_server(cert: str, key: str, server_ms: float, rtt_ms: float) -> threading.Event:
+    """在后台线程中启动 HTTPS 模拟服务和延迟代理，返回服务就绪的事件"""
+    ready = threading.Event()
+
+    async def serve():
+        config = uvicorn.Config(create_app(server_ms), host="127.0.0.1", port=SERVER_PORT, log_level="warning",
+                                ssl_certfile=cert, ssl_keyfile=key)
+        server = uvicorn.Server(config)
+        server_task = asyncio.create_task(server.serve())
+        proxy = await asyncio.start_server(lambda r, w: _proxy(r, w, rtt_ms / 2000), "127.0.0.1", PROXY_PORT)
+        while not server.started:
+            await asyncio.sleep(0.05)
+        ready.set()
+        async with proxy:
+            await server_task
+
+    threading.Thread(target=lambda: asyncio.run(serve()), daemon=True).start()
+    return ready
+
+
+def create_certificate(directory: str):
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-keyout", key, "-out", cert,
+                    "-days", "1", "-subj", "/CN=localhost", "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1"],
+                   check=True, capture_output=True)
+    return cert, key
+
+
+def chat_model(http_async_client) -> ChatOpenAI:
+    return ChatOpenAI(base_url=f"https://127.0.0.1:{PROXY_PORT}/v1", api_key="sk-bench", model="bench-model",
+                      temperature=0.0, max_retries=0, http_async_client=http_async_client)
+
+
+async def run(mode: str, calls: int, concurrency: int, verify: ssl.SSLContext) -> list:
+    shared_client = create_async_http_client(verify=verify) if mode == "shared" else None
+    shared_model = chat_model(shared_client) if shared_client else None
+    timings = []
+
+    async def worker(count: int):
+        for _ in range(count):
+            start = time.perf_counter()
+            if shared_model is not None:
+                await shared_model.ainvoke("hello")
+            else:
+                client = create_async_http_client(verify=verify)
+                try:
+                    await chat_model(client).ainvoke("hello")
+                finally:
+                    await client.aclose()
+            timings.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(worker(calls // concurrency) for _ in range(concurrency)))
+    if shared_client is not None:
+        await shared_client.aclose()
+    return timings
+
+
+def main(calls: int, concurrency: int, rtt_ms: float, server_ms: float):
+    logging.disable(logging.WARNING)
+    with tempfile.TemporaryDirectory() as directory:
+        cert, key = create_certificate(directory)
+        if not start_server(cert, key, server_ms, rtt_ms).wait(15):
+            raise RuntimeError("mock server did not start in time")
+        verify = ssl.create_default_context(cafile=cert)
+        # 预热：加载 openai 客户端相关模块
+        asyncio.run(run("shared", concurrency, concurrency, verify))
+        print(f"calls={calls}, concurrency={concurrency}, rtt={rtt_ms}ms, server={server_ms}ms")
+        print(f"{'mode':>9} {'p50(ms)':>8} {'p95(ms)':>8} {'connections':>11} {'tls handshakes':>14}")
+        results = {}
+        for mode in ("per call", "shared"):
+            before = dict(http_metrics)
+            timings = sorted(asyncio.run(run(mode, calls, concurrency, verify)))
+            handshakes = http_metrics['tls_handshakes'] - before['tls_handshakes']
+            results[mode] = handshakes
+            print(f"{mode:>9} {statistics.median(timings) * 1000:8.1f} "
+                  f"{timings[int(len(timings) * 0.95) - 1] * 1000:8.1f} "
+                  f"{http_metrics['connections_opened'] - before['connections_opened']:>11} {handshakes:>14}")
+        print(f"TLS handshakes avoided: {results['per call'] - results['shared']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200, help="每种模式的调用次数")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发调用数")
+    parser.add_argument("--rtt", type=float, default=20, help="模拟的网络往返时间（毫秒）")
+    parser.add_argument("--server-ms", type=float, default=5, help="模拟服务每次调用的处理时间（毫秒）")
+    args = parser.parse_args()
+    main(args.calls, args.concurrency, args.rtt, args.server_ms)
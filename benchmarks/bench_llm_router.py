@@ -0,0 +1,182 @@
+"""
+多服务商路由基准测试：本地启动三个模拟 OpenAI 接口的服务，对比单一服务商和 LLMRouter
+
+场景：
+  - tail:   a 平均 --fast-ms，但有 --tail-prob 的请求耗时 --tail-ms（长尾）；b 稳定 --slow-ms；c 稳定 2 倍 --slow-ms
+            对比只用 a、路由不对冲、路由 + p95 对冲的延迟分布
+  - outage: 中间三分之一的调用期间 a 全部返回 500，对比只用 a 和路由的失败次数、熔断次数，
+            熔断 --cooldown 秒后试探调用成功即恢复使用 a
+
+--stream 时以流式调用测试，延迟为首个数据块的时间。
+
+运行方式（在项目根目录，需存在 config.yaml）：
+
+    python -m benchmarks.bench_llm_router --calls 300 --concurrency 4
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import statistics
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
+from langchain_openai import ChatOpenAI
+
+from utils.llm_clients import create_async_http_client
+from utils.llm_router import LLMRouter, get_backend_stats
+
+BASE_PORT = 18500
+
+
+def create_app(behaviour: dict) -> FastAPI:
+    """behaviour 可在运行中修改：latency_ms、tail_prob、tail_ms、fail"""
+    app = FastAPI()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(body: dict):
+        tail = random.random() < behaviour.get("tail_prob", 0)
+        await asyncio.sleep((behaviour["tail_ms"] if tail else behaviour["latency_ms"]) / 1000)
+        if behaviour.get("fail"):
+            return JSONResponse({"error": {"message": "upstream unavailable", "type": "server_error"}},
+                                status_code=500)
+        created = int(time.time())
+        if body.get("stream"):
+            async def events():
+                for content in ("o", "k"):
+                    chunk = {"id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": created,
+                             "model": body["model"],
+                             "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}]}
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+        return {
+            "id": "chatcmpl-bench", "object": "chat.completion", "created": created, "model": body["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 1, "total_tokens": 11},
+        }
+
+    return app
+
+
+def start_servers(behaviours: dict) -> None:
+    """在后台线程中启动模拟服务，每个服务一个端口"""
+    ready = threading.Event()
+
+    async def serve():
+        servers = [uvicorn.Server(uvicorn.Config(create_app(behaviour), host="127.0.0.1", port=BASE_PORT + i,
+                                                 log_level="warning"))
+                   for i, behaviour in enumerate(behaviours.values())]
+        tasks = [asyncio.create_task(server.serve()) for server in servers]
+        while not all(server.started for server in servers):
+            await asyncio.sleep(0.05)
+        ready.set()
+        await asyncio.gather(*tasks)
+
+    threading.Thread(target=lambda: asyncio.run(serve()), daemon=True).start()
+    if not ready.wait(15):
+        raise RuntimeError("mock servers did not start in time")
+
+
+def backends(names, scenario: str, cooldown: float = 30) -> dict:
+    """每个场景使用不同的后端名称，统计信息互不影响"""
+    client = create_async_http_client()
+    for name in names:
+        get_backend_stats(f"{scenario}-{name}").cooldown = cooldown
+    return {f"{scenario}-{name}": ChatOpenAI(base_url=f"http://127.0.0.1:{BASE_PORT + i}/v1", api_key="sk-bench",
+                                            model=f"model-{name}", temperature=0.0, max_retries=0,
+                                            http_async_client=client)
+            for i, name in enumerate(names)}
+
+
+async def run(model, calls: int, concurrency: int, stream: bool, on_call=None):
+    timings, errors = [], 0
+
+    async def worker(offset: int):
+        nonlocal errors
+        for i in range(offset, calls, concurrency):
+            if on_call:
+                on_call(i)
+            start = time.perf_counter()
+            try:
+                if stream:
+                    async for _ in model.astream("hello"):
+                        timings.append(time.perf_counter() - start)
+                        break
+                else:
+                    await model.ainvoke("hello")
+                    timings.append(time.perf_counter() - start)
+            except Exception:
+                errors += 1
+
+    await asyncio.gather(*(worker(offset) for offset in range(concurrency)))
+    return sorted(timings), errors
+
+
+def report(name: str, timings: list, errors: int, extra: str = ""):
+    def q(p):
+        return timings[min(len(timings) - 1, int(len(timings) * p))] * 1000 if timings else float("nan")
+    print(f"{name:>22} {statistics.median(timings) * 1000 if timings else float('nan'):8.1f} {q(0.95):8.1f} "
+          f"{q(0.99):8.1f} {errors:>7} {extra}")
+
+
+def backend_summary(names) -> str:
+    parts = []
+    for name in names:
+        metrics = get_backend_stats(name).get_metrics()
+        parts.append(f"{name.split('-')[-1]}:{metrics['calls']}/{metrics['failures']}f/{metrics['hedges']}h/"
+                     f"{metrics['circuit_opens']}o")
+    return " ".join(parts)
+
+
+def main(calls: int, concurrency: int, fast_ms: float, slow_ms: float, tail_ms: float, tail_prob: float,
+         hedge_min_ms: float, cooldown: float, stream: bool):
+    logging.disable(logging.WARNING)
+    random.seed(0)
+    behaviours = {"a": {"latency_ms": fast_ms, "tail_prob": tail_prob, "tail_ms": tail_ms},
+                  "b": {"latency_ms": slow_ms}, "c": {"latency_ms": slow_ms * 2}}
+    start_servers(behaviours)
+    print(f"calls={calls}, concurrency={concurrency}, a={fast_ms}ms ({tail_prob:.0%} at {tail_ms}ms), "
+          f"b={slow_ms}ms, c={slow_ms * 2}ms, hedge min={hedge_min_ms}ms, cooldown={cooldown}s, stream={stream}")
+    print("backends: calls/failures/hedges/circuit opens")
+    print(f"{'tail':>22} {'p50(ms)':>8} {'p95(ms)':>8} {'p99(ms)':>8} {'errors':>7} backends")
+    single = backends(["a"], "single")
+    report("a only", *asyncio.run(run(next(iter(single.values())), calls, concurrency, stream)))
+    for hedge in (False, True):
+        scenario = "hedged" if hedge else "unhedged"
+        router = LLMRouter(backends=backends("abc", scenario), temperature=0.0, hedge=hedge,
+                           hedge_min=hedge_min_ms / 1000)
+        report(f"router {scenario}", *asyncio.run(run(router, calls, concurrency, stream)),
+               backend_summary(router.backends))
+
+    print(f"\n{'outage':>22} {'p50(ms)':>8} {'p95(ms)':>8} {'p99(ms)':>8} {'errors':>7} backends")
+    behaviours["a"]["tail_prob"] = 0
+
+    def outage(i: int):
+        behaviours["a"]["fail"] = calls // 3 <= i < 2 * calls // 3
+
+    single = backends(["a"], "outage-single")
+    report("a only", *asyncio.run(run(next(iter(single.values())), calls, concurrency, stream, outage)))
+    router = LLMRouter(backends=backends("abc", "outage", cooldown), temperature=0.0, hedge_min=hedge_min_ms / 1000)
+    report("router", *asyncio.run(run(router, calls, concurrency, stream, outage)), backend_summary(router.backends))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=300, help="每种配置的调用次数")
+    parser.add_argument("--concurrency", type=int, default=4, help="并发调用数")
+    parser.add_argument("--fast-ms", type=float, default=20, help="服务a的正常延迟（毫秒）")
+    parser.add_argument("--slow-ms", type=float, default=40, help="服务b的延迟（毫秒），服务c为其2倍")
+    parser.add_argument("--tail-ms", type=float, default=1000, help="服务a长尾请求的延迟（毫秒）")
+    parser.add_argument("--tail-prob", type=float, default=0.03, help="服务a长尾请求的比例")
+    parser.add_argument("--hedge-min-ms", type=float, default=50, help="对冲等待时间的下限（毫秒）")
+    parser.add_argument("--cooldown", type=float, default=0.5, help="outage 场景中熔断后放行试探调用前的等待时间（秒）")
+    parser.add_argument("--stream", action="store_true", help="以流式调用测试首个数据块的延迟")
+    args = parser.parse_args()
+    main(args.calls, args.concurrency, args.fast_ms, args.slow_ms, args.tail_ms, args.tail_prob, args.hedge_min_ms,
+         args.cooldown, args.stream)
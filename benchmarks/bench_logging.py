@@ -0,0 +1,102 @@
+"""
+日志开销基准测试：模拟一个请求的日志量，统计请求线程中花在日志上的时间
+
+每个请求记录：
+  - 10 条普通的 INFO 日志（路由、节点开始结束等）
+  - 3 条完整工具输出的 INFO 日志（每条 --payload 个字符）
+  - --chunks 条逐token的 INFO 日志（同一行代码，模拟旧的流式数据块日志）
+
+对比的模式：
+  - sync text:   ConcurrentRotatingFileHandler 直接写文件，文本格式（旧实现）
+  - sync json:   直接写文件，JSON格式 + 截断 + 采样
+  - async json:  QueueHandler 入队，后台线程写文件，JSON格式 + 截断 + 采样；drain 为等待后台线程写完的时间
+
+运行方式（在项目根目录，需存在 config.yaml）：
+
+    python -m benchmarks.bench_logging --requests 200
+"""
+import argparse
+import logging
+import os
+import queue
+import tempfile
+import time
+from logging.handlers import QueueListener
+
+from concurrent_log_handler import ConcurrentRotatingFileHandler
+
+from utils.log_utils import TEXT_FORMAT, JsonFormatter, RecordQueueHandler, SamplingFilter, TruncatingFilter
+
+
+def file_handler(path: str, formatter: logging.Formatter) -> logging.Handler:
+    handler = ConcurrentRotatingFileHandler(path, maxBytes=50 * 1024 * 1024, backupCount=3)
+    handler.setFormatter(formatter)
+    return handler
+
+
+def simulate_request(logger: logging.Logger, i: int, payload: str, chunks: int) -> None:
+    for step in range(10):
+        logger.info(f"Request {i} step {step} routed to execute_node")
+    for tool in range(3):
+        logger.info(f"Tool Output [read_file_{tool}]: {payload}")
+    for chunk in range(chunks):
+        logger.info(f"Streaming chunk from report_node: token{chunk}")
+
+
+def run(name: str, handler: logging.Handler, requests: int, payload: str, chunks: int,
+        listener: QueueListener = None, log_dir: str = "") -> None:
+    logger = logging.getLogger(f"bench_logging.{name}")
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    logger.handlers = [handler]
+    if listener is not None:
+        listener.start()
+    start = time.perf_counter()
+    for i in range(requests):
+        simulate_request(logger, i, payload, chunks)
+    elapsed = time.perf_counter() - start
+    if listener is not None:
+        listener.stop()
+    drained = time.perf_counter() - start
+    handler.close()
+    size = sum(os.path.getsize(os.path.join(log_dir, f)) for f in os.listdir(log_dir))
+    print(f"{name:>11} {elapsed / requests * 1e6:15.0f} {drained / requests * 1e6:13.0f} {size / 1024:10.0f}")
+
+
+def with_filters(handler: logging.Handler, max_chars: int, burst: int, every: int) -> logging.Handler:
+    handler.addFilter(SamplingFilter(burst, every))
+    handler.addFilter(TruncatingFilter(max_chars))
+    return handler
+
+
+def main(requests: int, payload_chars: int, chunks: int, max_chars: int, burst: int, every: int):
+    payload = "x" * payload_chars
+    print(f"requests={requests}, payload={payload_chars} chars, chunks={chunks}, max chars={max_chars}, "
+          f"sample burst={burst}, sample every={every}")
+    print(f"{'mode':>11} {'request(us/req)':>15} {'drain(us/req)':>13} {'file(KB)':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        run("sync text", file_handler(os.path.join(directory, "app.log"), logging.Formatter(TEXT_FORMAT)),
+            requests, payload, chunks, log_dir=directory)
+    with tempfile.TemporaryDirectory() as directory:
+        handler = file_handler(os.path.join(directory, "app.log"), JsonFormatter())
+        run("sync json", with_filters(handler, max_chars, burst, every), requests, payload, chunks,
+            log_dir=directory)
+    with tempfile.TemporaryDirectory() as directory:
+        log_queue = queue.Queue(-1)
+        target = file_handler(os.path.join(directory, "app.log"), JsonFormatter())
+        listener = QueueListener(log_queue, target)
+        handler = with_filters(RecordQueueHandler(log_queue), max_chars, burst, every)
+        run("async json", handler, requests, payload, chunks, listener=listener, log_dir=directory)
+        target.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="模拟的请求数")
+    parser.add_argument("--payload", type=int, default=20000, help="每条工具输出日志的字符数")
+    parser.add_argument("--chunks", type=int, default=300, help="每个请求的逐token日志条数")
+    parser.add_argument("--max-chars", type=int, default=2000, help="单条日志消息的最大字符数")
+    parser.add_argument("--burst", type=int, default=50, help="同一行代码每秒保留的日志条数")
+    parser.add_argument("--every", type=int, default=20, help="超出后每多少条保留一条")
+    args = parser.parse_args()
+    main(args.requests, args.payload, args.chunks, args.max_chars, args.burst, args.every)
@@ -0,0 +1,92 @@
+"""
+MCP 工具调用开销微基准测试。
+
+启动本地 exec_mcp_server.py（SSE，127.0.0.1:9000），用 send_message 工具对比：
+  - before: 每次调用 asyncio.run(tool.ainvoke(...))，每次新建事件循环并重新建立SSE连接
+  - after:  单个常驻事件循环 + McpSessionManager 的常驻会话
+
+运行方式（在项目根目录）：
+
+    python -m benchmarks.bench_mcp_tool_call --calls 50
+"""
+import argparse
+import asyncio
+import statistics
+import subprocess
+import sys
+import time
+
+from langchain_mcp_adapters.client import MultiServerMCPClient
+
+from tools.mcp.mcp_server import McpSessionManager
+
+SERVER_NAME = "exec-sse"
+CONNECTIONS = {SERVER_NAME: {"url": "http://127.0.0.1:9000/sse", "transport": "sse"}}
+TOOL_ARGS = {"message": "hello"}
+
+
+def wait_for_server(timeout: float = 15.0):
+    """轮询直到本地MCP Server可以返回工具列表"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            asyncio.run(MultiServerMCPClient(CONNECTIONS).get_tools())
+            return
+        except Exception:
+            time.sleep(0.3)
+    raise RuntimeError("exec_mcp_server.py did not start in time")
+
+
+def bench_before(calls: int) -> list:
+    tools = asyncio.run(MultiServerMCPClient(CONNECTIONS).get_tools())
+    tool = {t.name: t for t in tools}["send_message"]
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        asyncio.run(tool.ainvoke(TOOL_ARGS))
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+async def bench_after(calls: int) -> list:
+    manager = McpSessionManager(MultiServerMCPClient(CONNECTIONS))
+    try:
+        tool = (await manager.get_all_tools_dict())["send_message"]
+        timings = []
+        for _ in range(calls):
+            start = time.perf_counter()
+            await tool.ainvoke(TOOL_ARGS)
+            timings.append(time.perf_counter() - start)
+        return timings
+    finally:
+        await manager.aclose()
+
+
+def report(name: str, timings: list):
+    ms = sorted(t * 1000 for t in timings)
+    p95 = ms[min(len(ms) - 1, int(len(ms) * 0.95))]
+    print(f"{name:>8} {statistics.mean(ms):>10.2f} {statistics.median(ms):>10.2f} {p95:>10.2f}")
+
+
+def main(calls: int):
+    server = subprocess.Popen([sys.executable, "tools/mcp/exec_mcp_server.py"],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_server()
+        before = bench_before(calls)
+        after = asyncio.run(bench_after(calls))
+        print(f"send_message x {calls} calls (ms per call)")
+        print(f"{'mode':>8} {'mean':>10} {'p50':>10} {'p95':>10}")
+        report("before", before)
+        report("after", after)
+        print(f"overhead saved per call: {statistics.mean(before) * 1000 - statistics.mean(after) * 1000:.2f} ms")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=50, help="每种模式的工具调用次数")
+    args = parser.parse_args()
+    main(args.calls)
@@ -0,0 +1,102 @@
+"""
+分级模型基准测试：对比所有节点使用强模型与按节点分级（计划创建和报告使用强模型，计划更新、STEP执行和上下文摘要使用快模型）
+的单请求耗时和估算费用。
+
+桩模型按每4个字符一个token估算用量，费用按 --strong-price / --fast-price（每百万token，输入输出相同）计算。
+--invalid 为快模型输出无效计划的比例，用于观察升级到强模型的开销。
+
+运行方式（在项目根目录，需存在 config.yaml）：
+
+    python -m benchmarks.bench_model_tiers --requests 10 --width 4
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import time
+from collections import defaultdict
+
+from langchain_mcp_adapters.client import MultiServerMCPClient
+
+import tools.mcp.mcp_server as mcp_server
+
+# 节点模块导入时会实例化ChatOpenAI，提供占位密钥即可，基准测试不会真正调用
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+# 在导入节点模块之前替换MCP配置为空，基准测试不连接任何MCP Server
+mcp_server.get_all_mcp = lambda: MultiServerMCPClient({})
+
+from benchmarks.stubs import StubChatModel  # noqa: E402
+from graph.advanced_agent import nodes  # noqa: E402
+from graph.advanced_agent.graph import build_graph  # noqa: E402
+from graph.advanced_agent.state import graph_input_formpt  # noqa: E402
+from utils.hooks import register_hook, unregister_hook  # noqa: E402
+from utils.transcript import NullTranscriptStore, set_transcript_store  # noqa: E402
+
+# 基准测试不写入对话记录文件
+set_transcript_store(NullTranscriptStore())
+
+FAST_NODES = ("update_planner_node", "execute_node", "context_summary")
+STRONG_NODES = ("create_planner_node", "report_node")
+
+
+async def run(graph, requests: int, prices: dict):
+    usage = defaultdict(lambda: {"calls": 0, "tokens": 0})
+
+    def on_llm_call(model, input_tokens, output_tokens, cached, **kwargs):
+        usage[model]["calls"] += 1
+        usage[model]["tokens"] += input_tokens + output_tokens
+
+    register_hook("llm_call", on_llm_call)
+    timings = []
+    try:
+        for i in range(requests):
+            start = time.perf_counter()
+            await graph.ainvoke(graph_input_formpt(f"request {i}"), {"recursion_limit": 200})
+            timings.append(time.perf_counter() - start)
+    finally:
+        unregister_hook("llm_call", on_llm_call)
+    cost = sum(u["tokens"] * prices[model] / 1e6 for model, u in usage.items()) / requests
+    calls = " ".join(f"{model}:{u['calls'] / requests:.1f}" for model, u in sorted(usage.items()))
+    return statistics.mean(timings), cost, calls
+
+
+async def main(requests: int, width: int, strong_latency: float, fast_latency: float, strong_price: float,
+               fast_price: float, invalid: float):
+    logging.disable(logging.WARNING)
+    prices = {"strong": strong_price, "fast": fast_price}
+    strong = StubChatModel(model_name="strong", latency=strong_latency, plan_width=width, report_tokens=200)
+    fast = StubChatModel(model_name="fast", latency=fast_latency, plan_width=width, report_tokens=200)
+    graph = build_graph()
+    print(f"requests={requests}, plan width={width}, strong={strong_latency}s ${strong_price}/M, "
+          f"fast={fast_latency}s ${fast_price}/M")
+    print(f"{'config':>22} {'latency(s)':>10} {'cost($/req)':>12} {'escalations':>11}  calls/req")
+
+    nodes.set_llm(strong)
+    latency, cost, calls = await run(graph, requests, prices)
+    print(f"{'all strong':>22} {latency:10.3f} {cost:12.5f} {0:11.1f}  {calls}")
+
+    for rate in sorted({0.0, invalid}):
+        nodes.set_llm(strong)
+        tier_fast = fast.model_copy(update={"invalid_plan_rate": rate})
+        nodes.node_llms.update({node: tier_fast for node in FAST_NODES})
+        nodes.node_llms.update({node: strong for node in STRONG_NODES})
+        nodes.escalation_llms.update({node: strong for node in FAST_NODES})
+        nodes.escalation_metrics.clear()
+        latency, cost, calls = await run(graph, requests, prices)
+        escalations = sum(nodes.get_escalation_metrics().values()) / requests
+        print(f"{f'tiered ({rate:.0%} invalid)':>22} {latency:10.3f} {cost:12.5f} {escalations:11.1f}  {calls}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=10, help="每种配置的请求数")
+    parser.add_argument("--width", type=int, default=4, help="计划的STEP数量")
+    parser.add_argument("--strong-latency", type=float, default=0.4, help="强模型单次调用的延迟（秒）")
+    parser.add_argument("--fast-latency", type=float, default=0.1, help="快模型单次调用的延迟（秒）")
+    parser.add_argument("--strong-price", type=float, default=10.0, help="强模型每百万token的价格")
+    parser.add_argument("--fast-price", type=float, default=0.4, help="快模型每百万token的价格")
+    parser.add_argument("--invalid", type=float, default=0.2, help="快模型输出无效计划的比例")
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.width, args.strong_latency, args.fast_latency, args.strong_price,
+                     args.fast_price, args.invalid))
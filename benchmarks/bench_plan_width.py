@@ -0,0 +1,56 @@
+"""
+计划宽度基准测试：对比相互独立的STEP（并发执行）与链式依赖的STEP（顺序执行）的单请求耗时。
+
+运行方式（在项目根目录，需存在 config.yaml）：
+
+    python -m benchmarks.bench_plan_width --latency 0.05
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+from langchain_mcp_adapters.client import MultiServerMCPClient
+
+import tools.mcp.mcp_server as mcp_server
+
+# 节点模块导入时会实例化ChatOpenAI，提供占位密钥即可，基准测试不会真正调用
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+# 在导入节点模块之前替换MCP配置为空，基准测试不连接任何MCP Server
+mcp_server.get_all_mcp = lambda: MultiServerMCPClient({})
+
+from benchmarks.stubs import StubChatModel  # noqa: E402
+from graph.advanced_agent import nodes  # noqa: E402
+from graph.advanced_agent.graph import build_graph  # noqa: E402
+from graph.advanced_agent.state import graph_input_formpt  # noqa: E402
+from utils.config_utils import Config  # noqa: E402
+from utils.transcript import NullTranscriptStore, set_transcript_store  # noqa: E402
+
+# 基准测试不写入对话记录文件
+set_transcript_store(NullTranscriptStore())
+
+
+async def run_once(graph, width: int, independent: bool, latency: float) -> float:
+    nodes.set_llm(StubChatModel(latency=latency, plan_width=width, independent_steps=independent))
+    start = time.perf_counter()
+    await graph.ainvoke(graph_input_formpt("bench"), {"recursion_limit": 200})
+    return time.perf_counter() - start
+
+
+async def main(latency: float):
+    logging.disable(logging.WARNING)
+    graph = build_graph()
+    print(f"stub latency={latency}s, MAX_PARALLEL_STEPS={Config.MAX_PARALLEL_STEPS}")
+    print(f"{'width':>6} {'chained(s)':>11} {'parallel(s)':>12} {'speedup':>8}")
+    for width in (1, 2, 4, 8):
+        chained = await run_once(graph, width, False, latency)
+        parallel = await run_once(graph, width, True, latency)
+        print(f"{width:>6} {chained:>11.3f} {parallel:>12.3f} {chained / parallel:>7.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.05, help="桩模型单次调用延迟（秒）")
+    args = parser.parse_args()
+    asyncio.run(main(args.latency))
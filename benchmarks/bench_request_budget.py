@@ -0,0 +1,68 @@
+"""
+请求预算基准测试：链式依赖的计划（每个STEP依赖上一个STEP），对比不限制、按token预算和按耗时预算时
+单个请求的耗时、LLM调用次数、token用量和已执行的STEP数。预算用尽后不再执行新的STEP和计划更新，
+report_node 基于已有结果生成报告。
+
+桩模型按每4个字符一个token估算用量。
+
+运行方式（在项目根目录，需存在 config.yaml）：
+
+    python -m benchmarks.bench_request_budget --width 8 --latency 0.05
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+from langchain_mcp_adapters.client import MultiServerMCPClient
+
+import tools.mcp.mcp_server as mcp_server
+
+# 节点模块导入时会实例化ChatOpenAI，提供占位密钥即可，基准测试不会真正调用
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+# 在导入节点模块之前替换MCP配置为空，基准测试不连接任何MCP Server
+mcp_server.get_all_mcp = lambda: MultiServerMCPClient({})
+
+from benchmarks.stubs import StubChatModel  # noqa: E402
+from graph.advanced_agent import nodes  # noqa: E402
+from graph.advanced_agent.graph import build_graph  # noqa: E402
+from graph.advanced_agent.state import graph_input_formpt  # noqa: E402
+from utils.transcript import NullTranscriptStore, set_transcript_store  # noqa: E402
+from utils.usage import start_request_usage  # noqa: E402
+
+# 基准测试不写入对话记录文件
+set_transcript_store(NullTranscriptStore())
+
+
+async def run_once(graph, token_budget: int, time_budget: float):
+    usage = start_request_usage("bench", token_budget=token_budget, time_budget=time_budget)
+    start = time.perf_counter()
+    result = await graph.ainvoke(graph_input_formpt("bench"), {"recursion_limit": 200})
+    elapsed = time.perf_counter() - start
+    return elapsed, usage, len(result.get("step_results") or {}), bool(result.get("final_report"))
+
+
+async def main(width: int, latency: float):
+    logging.disable(logging.WARNING)
+    nodes.set_llm(StubChatModel(latency=latency, plan_width=width, independent_steps=False, report_tokens=50))
+    graph = build_graph()
+    # 不限制时的用量作为参照，预算取其一半
+    _, full, _, _ = await run_once(graph, 0, 0)
+    full_elapsed = (full.calls + 1) * latency
+    print(f"plan width={width} (chained), stub latency={latency}s")
+    print(f"{'budget':>16} {'latency(s)':>10} {'calls':>6} {'tokens':>7} {'steps':>6} {'report':>7}")
+    for name, token_budget, time_budget in (("unlimited", 0, 0),
+                                            (f"{full.total_tokens // 2} tokens", full.total_tokens // 2, 0),
+                                            (f"{full_elapsed / 2:.2f}s", 0, full_elapsed / 2)):
+        elapsed, usage, steps, report = await run_once(graph, token_budget, time_budget)
+        print(f"{name:>16} {elapsed:10.3f} {usage.calls:>6} {usage.total_tokens:>7} {f'{steps}/{width}':>6} "
+              f"{'yes' if report else 'no':>7}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--width", type=int, default=8, help="计划的STEP数量")
+    parser.add_argument("--latency", type=float, default=0.05, help="桩模型单次调用延迟（秒）")
+    args = parser.parse_args()
+    asyncio.run(main(args.width, args.latency))
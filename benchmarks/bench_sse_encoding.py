@@ -0,0 +1,93 @@
+"""
+流式响应数据块编码基准测试：对比每个token生成SSE数据块的吞吐量（chunks/sec）
+
+  - legacy+log:  每块构造字典、json.dumps、调用 time.time()，并同步写一条 INFO 日志（旧实现）
+  - legacy:      同上但不写日志
+  - encoder:     ChunkEncoder 预生成前缀和后缀，只序列化 delta 文本
+  - coalesced:   ChunkEncoder + ChunkCoalescer，按字符数合并token后再编码，同时输出实际发送的帧数
+
+token为中英文混合的短文本，模拟模型逐token输出。
+
+运行方式（在项目根目录，需存在 config.yaml）：
+
+    python -m benchmarks.bench_sse_encoding --tokens 200000
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+import uuid
+
+from concurrent_log_handler import ConcurrentRotatingFileHandler
+
+from utils.sse import ChunkCoalescer, ChunkEncoder
+
+TOKENS = ["The", " agent", " 调用", "了", " search", "_tool", "，", "结果", "显示", " \"quoted\"", "\n", " 42", "。"]
+
+
+def legacy(tokens, chunk_id, logger):
+    for chunk in tokens:
+        if logger is not None:
+            logger.info(f"Streaming chunk from report_node: {chunk}")
+        yield f"data: {json.dumps({'id': chunk_id, 'object': 'chat.completion.chunk', 'created': int(time.time()), 'choices': [{'index': 0, 'delta': {'content': chunk}, 'finish_reason': None}]})}\n\n"
+
+
+def encoded(tokens, chunk_id):
+    encoder = ChunkEncoder(chunk_id)
+    for chunk in tokens:
+        yield encoder.content(chunk)
+
+
+def coalesced(tokens, chunk_id, max_chars, max_delay):
+    encoder = ChunkEncoder(chunk_id)
+    coalescer = ChunkCoalescer(max_chars, max_delay)
+    for chunk in tokens:
+        text = coalescer.add(chunk)
+        if text is not None:
+            yield encoder.content(text)
+    text = coalescer.flush()
+    if text is not None:
+        yield encoder.content(text)
+
+
+def run(name, frames, tokens):
+    start = time.perf_counter()
+    count = 0
+    size = 0
+    for frame in frames:
+        count += 1
+        size += len(frame)
+    elapsed = time.perf_counter() - start
+    print(f"{name:>12} {tokens / elapsed:14,.0f} {count:8} {size / 1024:10.0f}")
+
+
+def main(tokens: int, max_chars: int, max_delay_ms: float):
+    stream = [TOKENS[i % len(TOKENS)] for i in range(tokens)]
+    chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+    with tempfile.TemporaryDirectory() as directory:
+        logger = logging.getLogger("bench_sse_encoding")
+        logger.propagate = False
+        logger.setLevel(logging.DEBUG)
+        handler = ConcurrentRotatingFileHandler(os.path.join(directory, "app.log"), maxBytes=5 * 1024 * 1024,
+                                                backupCount=3)
+        handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+        logger.addHandler(handler)
+        print(f"tokens={tokens}, coalesce chars={max_chars}, coalesce ms={max_delay_ms}")
+        print(f"{'encoder':>12} {'tokens/sec':>14} {'frames':>8} {'bytes(KB)':>10}")
+        run("legacy+log", legacy(stream, chunk_id, logger), tokens)
+        run("legacy", legacy(stream, chunk_id, None), tokens)
+        run("encoder", encoded(stream, chunk_id), tokens)
+        run("coalesced", coalesced(stream, chunk_id, max_chars, max_delay_ms / 1000), tokens)
+        logger.removeHandler(handler)
+        handler.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=200000, help="编码的token数量")
+    parser.add_argument("--chars", type=int, default=32, help="合并的字符数上限")
+    parser.add_argument("--ms", type=float, default=20, help="合并的等待时间上限（毫秒）")
+    args = parser.parse_args()
+    main(args.tokens, args.chars, args.ms)
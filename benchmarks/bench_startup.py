@@ -0,0 +1,106 @@
+"""
+冷启动基准测试：对比导入时同步发现MCP工具（旧方式）与按需发现（McpToolRegistry）。
+
+启动本地 exec_mcp_server.py（SSE，127.0.0.1:9000），并额外配置一个不可达的Server，
+输出以下耗时：
+  - eager:  旧的导入期行为，asyncio.run(get_all_tools()) 执行两次
+  - import: 导入 graph.advanced_agent.graph 的耗时（子进程中测量）
+  - first:  首次 registry.get_tools()，各Server并发发现，不可达Server超时后跳过
+  - cached: 缓存命中时 registry.get_tools() 的耗时
+
+运行方式（在项目根目录，需存在 config.yaml）：
+
+    python -m benchmarks.bench_startup
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+from langchain_mcp_adapters.client import MultiServerMCPClient
+
+from tools.mcp.mcp_server import McpSessionManager, McpToolRegistry
+
+LOCAL = {"exec-sse": {"url": "http://127.0.0.1:9000/sse", "transport": "sse"}}
+# 端口9上没有服务，用于模拟宕机的MCP Server
+UNREACHABLE = {"down-sse": {"url": "http://127.0.0.1:9/sse", "transport": "sse"}}
+
+IMPORT_SNIPPET = (
+    "import time; start = time.perf_counter(); "
+    "import graph.advanced_agent.graph; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def wait_for_server(timeout: float = 15.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            asyncio.run(MultiServerMCPClient(LOCAL).get_tools())
+            return
+        except Exception:
+            time.sleep(0.3)
+    raise RuntimeError("exec_mcp_server.py did not start in time")
+
+
+def measure_eager(connections: dict):
+    """返回旧方式的耗时，发现失败时返回异常（旧方式下模块无法导入）"""
+    start = time.perf_counter()
+    try:
+        for _ in range(2):
+            asyncio.run(MultiServerMCPClient(connections).get_tools())
+    except Exception as e:
+        return e
+    return time.perf_counter() - start
+
+
+def measure_import() -> float:
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "sk-bench")
+    output = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], env=env, capture_output=True, text=True,
+                            check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+async def measure_registry(discovery_timeout: float):
+    manager = McpSessionManager(MultiServerMCPClient({**LOCAL, **UNREACHABLE}))
+    registry = McpToolRegistry(manager, discovery_timeout=discovery_timeout)
+    try:
+        start = time.perf_counter()
+        tools = await registry.get_tools()
+        first = time.perf_counter() - start
+        start = time.perf_counter()
+        await registry.get_tools()
+        cached = time.perf_counter() - start
+        return first, cached, len(tools)
+    finally:
+        await manager.aclose()
+
+
+def main(discovery_timeout: float):
+    server = subprocess.Popen([sys.executable, "tools/mcp/exec_mcp_server.py"],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_server()
+        eager = measure_eager(LOCAL)
+        eager_down = measure_eager({**LOCAL, **UNREACHABLE})
+        imported = measure_import()
+        first, cached, count = asyncio.run(measure_registry(discovery_timeout))
+        print(f"{'phase':>8} {'seconds':>10}")
+        print(f"{'eager':>8} {eager:>10.3f}  (old import-time discovery, local server only)")
+        print(f"{'eager':>8} {'failed':>10}  (old import-time discovery with unreachable server: {eager_down!r:.60})")
+        print(f"{'import':>8} {imported:>10.3f}  (no discovery at import)")
+        print(f"{'first':>8} {first:>10.3f}  ({count} tools, unreachable server skipped)")
+        print(f"{'cached':>8} {cached:>10.6f}")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--discovery-timeout", type=float, default=2.0, help="单个Server的发现超时（秒）")
+    args = parser.parse_args()
+    main(args.discovery_timeout)
@@ -0,0 +1,115 @@
+"""
+STEP执行上限基准测试：桩模型在每个STEP中先调用 --rounds 轮 stub_tool 再给出总结，工具有 --tail-prob 的概率耗时
+--tail 秒（长尾），对比以下配置的单请求耗时：
+
+  - no limits:        不限制STEP的轮数和耗时，请求耗时取决于最慢的工具调用
+  - step timeout:     STEP_TIMEOUT 为 --step-timeout 秒，超时时取消进行中的工具调用，以已有结果结束STEP
+  - runaway, N iters: 模型一直调用工具、不会自行结束，STEP_MAX_ITERATIONS 限制LLM轮数（不限制时请求不会结束）
+  - runaway, request: 同上，只由请求的耗时预算（--request-timeout 秒）结束
+
+cut 为每个请求提前结束的STEP数。
+
+运行方式（在项目根目录，需存在 config.yaml）：
+
+    python -m benchmarks.bench_step_limits --requests 20 --width 4
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import statistics
+import time
+
+from langchain_core.tools import StructuredTool
+from langchain_mcp_adapters.client import MultiServerMCPClient
+
+import tools.mcp.mcp_server as mcp_server
+
+# 节点模块导入时会实例化ChatOpenAI，提供占位密钥即可，基准测试不会真正调用
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+# 在导入节点模块之前替换MCP配置为空，基准测试不连接任何MCP Server
+mcp_server.get_all_mcp = lambda: MultiServerMCPClient({})
+
+from benchmarks.stubs import StubChatModel  # noqa: E402
+from graph.advanced_agent import nodes  # noqa: E402
+from graph.advanced_agent.graph import build_graph  # noqa: E402
+from graph.advanced_agent.state import graph_input_formpt  # noqa: E402
+from utils.config_utils import Config  # noqa: E402
+from utils.transcript import NullTranscriptStore, set_transcript_store  # noqa: E402
+from utils.usage import start_request_usage  # noqa: E402
+
+# 基准测试不写入对话记录文件
+set_transcript_store(NullTranscriptStore())
+
+
+class StubToolRegistry:
+    """只提供 stub_tool 的工具注册表，代替MCP工具"""
+
+    def __init__(self, latency: float, tail: float, tail_prob: float):
+        async def stub_tool(round: int) -> str:
+            await asyncio.sleep(tail if random.random() < tail_prob else latency)
+            return f"result of round {round}"
+
+        self.tools = [StructuredTool.from_function(coroutine=stub_tool, name="stub_tool",
+                                                   description="stub tool for benchmarks")]
+
+    async def get_tools(self):
+        return self.tools
+
+
+async def run(graph, requests: int, request_timeout: float = 0):
+    timings, calls, cut = [], 0, 0
+    for i in range(requests):
+        before = sum(nodes.get_limit_metrics().values())
+        usage = start_request_usage("bench", time_budget=request_timeout)
+        start = time.perf_counter()
+        result = await graph.ainvoke(graph_input_formpt(f"request {i}"),
+                                     {"recursion_limit": Config.GRAPH_RECURSION_LIMIT})
+        timings.append(time.perf_counter() - start)
+        assert result.get("final_report"), "every request must still produce a report"
+        calls += usage.calls
+        cut += sum(nodes.get_limit_metrics().values()) - before
+    timings.sort()
+    return timings, calls / requests, cut / requests
+
+
+async def main(requests: int, width: int, rounds: int, latency: float, tool_latency: float, tail: float,
+               tail_prob: float, step_timeout: float, max_iterations: int, request_timeout: float):
+    # 超时的工具调用会记录ERROR日志
+    logging.disable(logging.ERROR)
+    random.seed(0)
+    nodes.get_tool_registry = lambda: StubToolRegistry(tool_latency, tail, tail_prob)
+    graph = build_graph()
+    print(f"requests={requests}, width={width}, rounds={rounds}, llm={latency}s, tool={tool_latency}s "
+          f"({tail_prob:.0%} at {tail}s)")
+    print(f"{'config':>20} {'mean(s)':>8} {'p95(s)':>8} {'max(s)':>8} {'calls':>6} {'cut':>5}")
+    scenarios = (
+        ("no limits", rounds, 0, 0, 0),
+        (f"step timeout {step_timeout:g}s", rounds, 0, step_timeout, 0),
+        (f"runaway, {max_iterations} iters", -1, max_iterations, 0, 0),
+        (f"runaway, request {request_timeout:g}s", -1, 0, 0, request_timeout),
+    )
+    for name, tool_rounds, iterations, timeout, request in scenarios:
+        nodes.set_llm(StubChatModel(latency=latency, plan_width=width, tool_rounds=tool_rounds))
+        Config.STEP_MAX_ITERATIONS, Config.STEP_TIMEOUT = iterations, timeout
+        timings, calls, cut = await run(graph, requests, request)
+        print(f"{name:>20} {statistics.mean(timings):8.3f} {timings[int(len(timings) * 0.95) - 1]:8.3f} "
+              f"{timings[-1]:8.3f} {calls:6.1f} {cut:5.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20, help="每种配置的请求数")
+    parser.add_argument("--width", type=int, default=4, help="计划的STEP数量（相互独立，并发执行）")
+    parser.add_argument("--rounds", type=int, default=3, help="每个STEP调用工具的轮数")
+    parser.add_argument("--latency", type=float, default=0.05, help="桩模型单次调用延迟（秒）")
+    parser.add_argument("--tool-latency", type=float, default=0.1, help="工具调用的正常延迟（秒）")
+    parser.add_argument("--tail", type=float, default=5.0, help="长尾工具调用的延迟（秒）")
+    parser.add_argument("--tail-prob", type=float, default=0.05, help="长尾工具调用的比例")
+    parser.add_argument("--step-timeout", type=float, default=1.0, help="STEP_TIMEOUT（秒）")
+    parser.add_argument("--max-iterations", type=int, default=8, help="STEP_MAX_ITERATIONS")
+    parser.add_argument("--request-timeout", type=float, default=2.0, help="请求的耗时预算（秒）")
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.width, args.rounds, args.latency, args.tool_latency, args.tail,
+                     args.tail_prob, args.step_timeout, args.max_iterations, args.request_timeout))
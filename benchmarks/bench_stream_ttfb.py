@@ -0,0 +1,96 @@
+"""
+流式响应首字节时间基准测试：在本进程中启动 uvicorn，调用流式 /v1/chat/completions，统计
+
+  - ttfb:          收到第一个字节（角色信息）的时间
+  - first progress: 收到第一个进度事件（计划创建）的时间
+  - first token:   收到第一个报告token的时间
+  - total:         流结束的时间
+
+桩模型先等待 latency 再按 token_latency 逐token输出，模拟真实模型的流式输出。
+
+运行方式（在项目根目录，需存在 config.yaml）：
+
+    python -m benchmarks.bench_stream_ttfb --latency 0.05 --width 4
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import statistics
+import time
+
+import httpx
+import uvicorn
+from langchain_mcp_adapters.client import MultiServerMCPClient
+
+import tools.mcp.mcp_server as mcp_server
+
+# 节点模块导入时会实例化ChatOpenAI，提供占位密钥即可，基准测试不会真正调用
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+# 在导入节点模块之前替换MCP配置为空，基准测试不连接任何MCP Server
+mcp_server.get_all_mcp = lambda: MultiServerMCPClient({})
+
+import backend  # noqa: E402
+from benchmarks.stubs import StubChatModel  # noqa: E402
+from graph.advanced_agent import nodes  # noqa: E402
+from graph.advanced_agent.graph import build_graph_with_memory  # noqa: E402
+from utils.transcript import NullTranscriptStore, set_transcript_store  # noqa: E402
+
+# 基准测试不写入对话记录文件
+set_transcript_store(NullTranscriptStore())
+
+
+async def measure(client: httpx.AsyncClient, i: int) -> dict:
+    payload = {"messages": [{"role": "user", "content": f"stream request {i}"}], "stream": True,
+               "userId": "bench", "conversationId": str(i)}
+    timings = {}
+    start = time.perf_counter()
+    async with client.stream("POST", "/v1/chat/completions", json=payload) as response:
+        async for line in response.aiter_lines():
+            now = time.perf_counter() - start
+            timings.setdefault("ttfb", now)
+            if line.startswith("event: progress"):
+                timings.setdefault("first progress", now)
+            elif line.startswith("data:") and '"content"' in line:
+                timings.setdefault("first token", now)
+    timings["total"] = time.perf_counter() - start
+    return timings
+
+
+async def main(latency: float, token_latency: float, width: int, tokens: int, requests: int):
+    logging.disable(logging.WARNING)
+    nodes.set_llm(StubChatModel(latency=latency, token_latency=token_latency, plan_width=width,
+                                report_tokens=tokens))
+    backend.graph = build_graph_with_memory()
+    # ASGITransport 会缓冲完整响应，需要通过真实的HTTP连接才能测量首字节时间
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(backend.app, host="127.0.0.1", port=port, lifespan="off",
+                                           log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    print(f"stub latency={latency}s, token latency={token_latency}s, plan width={width}, "
+          f"report tokens={tokens}, requests={requests}")
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=None) as client:
+        results = [await measure(client, i) for i in range(requests)]
+    server.should_exit = True
+    await server_task
+    print(f"{'metric':>15} {'p50(ms)':>9} {'max(ms)':>9}")
+    for key in ("ttfb", "first progress", "first token", "total"):
+        values = [r[key] for r in results if key in r]
+        if values:
+            print(f"{key:>15} {statistics.median(values) * 1000:9.1f} {max(values) * 1000:9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.05, help="桩模型首个token前的延迟（秒）")
+    parser.add_argument("--token-latency", type=float, default=0.002, help="桩模型每个token的间隔（秒）")
+    parser.add_argument("--width", type=int, default=4, help="计划的STEP数量")
+    parser.add_argument("--tokens", type=int, default=200, help="最终报告的token数量")
+    parser.add_argument("--requests", type=int, default=10, help="顺序发送的请求数")
+    args = parser.parse_args()
+    asyncio.run(main(args.latency, args.token_latency, args.width, args.tokens, args.requests))
@@ -0,0 +1,81 @@
+"""
+all_messages 内存增长基准测试：50个STEP的链式计划，对比旧的 all_messages 全量累加与对话记录存储。
+
+  - legacy:     state['all_messages'] += input + [response]（每轮重复复制完整历史）
+  - transcript: 每条消息按ID写入一次对话记录，状态中只保存ID
+
+运行方式（在项目根目录，需存在 config.yaml）：
+
+    python -m benchmarks.bench_transcript_memory --steps 50
+"""
+import argparse
+import asyncio
+import logging
+import os
+import pickle
+import tempfile
+import time
+import tracemalloc
+
+from langchain_mcp_adapters.client import MultiServerMCPClient
+
+import tools.mcp.mcp_server as mcp_server
+
+# 节点模块导入时会实例化ChatOpenAI，提供占位密钥即可，基准测试不会真正调用
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+# 在导入节点模块之前替换MCP配置为空，基准测试不连接任何MCP Server
+mcp_server.get_all_mcp = lambda: MultiServerMCPClient({})
+
+from benchmarks.stubs import StubChatModel  # noqa: E402
+from graph.advanced_agent import nodes  # noqa: E402
+from graph.advanced_agent.graph import build_graph  # noqa: E402
+from graph.advanced_agent.state import graph_input_formpt  # noqa: E402
+from utils.llm import llm_ainvoke  # noqa: E402
+from utils.tools import message_to_dict  # noqa: E402
+from utils.transcript import FileTranscriptStore, set_transcript_store  # noqa: E402
+
+
+async def legacy_llm_ainvoke(state, llm, input, return_dict=True):
+    """改造前的 llm_ainvoke 实现"""
+    response = await llm.ainvoke(input)
+    state['all_messages'] += (input + [response]) if isinstance(input, list) else [input]
+    if return_dict:
+        response = message_to_dict(response)
+    return response
+
+
+async def run(steps: int, invoke) -> dict:
+    nodes.llm_ainvoke = invoke
+    nodes.set_llm(StubChatModel(latency=0, plan_width=steps, independent_steps=False))
+    graph = build_graph()
+    tracemalloc.start()
+    start = time.perf_counter()
+    state = await graph.ainvoke(graph_input_formpt("bench"), {"recursion_limit": steps * 4 + 10})
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    all_messages = state['all_messages']
+    return {"entries": len(all_messages), "state_bytes": len(pickle.dumps(all_messages)),
+            "peak_mb": peak / 1e6, "seconds": elapsed}
+
+
+async def main(steps: int):
+    logging.disable(logging.WARNING)
+    with tempfile.TemporaryDirectory() as directory:
+        set_transcript_store(FileTranscriptStore(directory))
+        legacy = await run(steps, legacy_llm_ainvoke)
+        transcript = await run(steps, llm_ainvoke)
+        transcript_bytes = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+    print(f"{steps}-step chained plan")
+    print(f"{'mode':>11} {'entries':>8} {'state bytes':>12} {'peak MB':>8} {'seconds':>8}")
+    for name, result in (("legacy", legacy), ("transcript", transcript)):
+        print(f"{name:>11} {result['entries']:>8} {result['state_bytes']:>12} {result['peak_mb']:>8.1f} "
+              f"{result['seconds']:>8.2f}")
+    print(f"transcript file bytes on disk: {transcript_bytes}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--steps", type=int, default=50, help="计划中的STEP数量")
+    args = parser.parse_args()
+    asyncio.run(main(args.steps))
@@ -0,0 +1,135 @@
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class StubChatModel(BaseChatModel):
+    """基准测试用的桩模型，按提示词类型返回固定内容，并用 sleep 模拟网络延迟"""
+
+    # 单次调用的模拟延迟（秒）
+    latency: float = 0.05
+    # 生成计划的步骤数量
+    plan_width: int = 1
+    # 为True时各STEP互不依赖，否则每个STEP依赖上一个STEP
+    independent_steps: bool = True
+    # 最终报告的token数量，以及流式输出时每个token的间隔（秒）
+    report_tokens: int = 1
+    token_latency: float = 0.0
+    # 模型名称（llm_call 事件按名称统计），以及计划回复为无效JSON的比例
+    model_name: str = "stub"
+    invalid_plan_rate: float = 0.0
+    # 执行STEP时先调用 stub_tool 的轮数（非流式调用），-1 为一直调用工具、不会自行结束
+    tool_rounds: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def bind_tools(self, tools, **kwargs):
+        # 桩模型不会发起工具调用，直接返回自身
+        return self
+
+    def _plan(self) -> dict:
+        steps = []
+        for i in range(1, self.plan_width + 1):
+            depends_on = [] if self.independent_steps or i == 1 else [str(i - 1)]
+            steps.append({"id": str(i), "title": f"step {i}", "description": f"step {i}",
+                          "status": "pending", "depends_on": depends_on})
+        return {"thought": "stub", "goal": "stub goal", "steps": steps}
+
+    def _reply(self, messages: List[BaseMessage]) -> str:
+        last = str(messages[-1].content) if messages else ""
+        # 计划更新时原样返回计划，已执行STEP的完成状态由 update_planner_node 标记
+        if "You are now creating a plan" in last or "You are updating the plan" in last:
+            if self.invalid_plan_rate and random.random() < self.invalid_plan_rate:
+                return '{"goal": "stub goal", "steps": "not a list"}'
+            return json.dumps(self._plan(), ensure_ascii=False)
+        if "专门的汇报人员" in last:
+            return "stub report" + " token" * (self.report_tokens - 1)
+        return "stub step summary"
+
+    @staticmethod
+    def _usage(messages: List[BaseMessage], reply: str) -> dict:
+        """按每4个字符一个token估算用量"""
+        input_tokens = sum(len(str(m.content)) for m in messages) // 4
+        output_tokens = len(reply) // 4
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens}
+
+    def _tool_calls(self, messages: List[BaseMessage]) -> list:
+        rounds = sum(1 for m in messages if isinstance(m, ToolMessage))
+        if self.tool_rounds < 0 or rounds < self.tool_rounds:
+            return [{"name": "stub_tool", "args": {"round": rounds}, "id": f"call_{uuid.uuid4().hex[:12]}",
+                     "type": "tool_call"}]
+        return []
+
+    def _result(self, messages: List[BaseMessage]) -> ChatResult:
+        reply = self._reply(messages)
+        tool_calls = self._tool_calls(messages) if reply == "stub step summary" else []
+        message = AIMessage(content=reply, tool_calls=tool_calls, usage_metadata=self._usage(messages, reply))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        return self._result(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._result(messages)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        # 首个token之前等待 latency，之后每个token间隔 token_latency
+        await asyncio.sleep(self.latency)
+        reply = self._reply(messages)
+        tokens = reply.split(" ")
+        for i, token in enumerate(tokens):
+            if i and self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            text = token if i == 0 else " " + token
+            # 用量随最后一个数据块返回
+            usage = self._usage(messages, reply) if i == len(tokens) - 1 else None
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=text, usage_metadata=usage))
+            if run_manager:
+                await run_manager.on_llm_new_token(text, chunk=chunk)
+            yield chunk
+
+
+class StubEmbeddings(Embeddings):
+    """
+    基准测试用的桩Embedding模型：每次接口调用耗时 latency + per_text_latency * 文本数，
+    同时最多 max_concurrency 个调用，模拟接口的并发限制
+    """
+
+    def __init__(self, size: int = 16, latency: float = 0.03, per_text_latency: float = 0.0005,
+                 max_concurrency: int = 4):
+        self.size = size
+        self.latency = latency
+        self.per_text_latency = per_text_latency
+        self._semaphore = threading.Semaphore(max_concurrency)
+        self.calls = 0
+
+    def _vector(self, text: str) -> List[float]:
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [b / 255 for b in digest[:self.size]]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with self._semaphore:
+            self.calls += 1
+            time.sleep(self.latency + self.per_text_latency * len(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
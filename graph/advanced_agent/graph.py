@@ -1,5 +1,6 @@
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import StateGraph, START, END
+from langgraph.types import Send
 
 from graph.advanced_agent.nodes import (
     report_node,
@@ -7,7 +8,9 @@ from graph.advanced_agent.nodes import (
     create_planner_node,
     update_planner_node
 )
-from graph.advanced_agent.state import State
+from graph.advanced_agent.state import State, get_ready_steps
+from utils.config_utils import Config
+from utils.usage import budget_exhausted, mark_cut_short
 
 
 def _build_base_graph():
@@ -21,17 +24,28 @@ def _build_base_graph():
     builder.add_edge("report_node", END)
 
 
-    builder.add_edge("create_planner_node","execute_node")
+    builder.add_conditional_edges("create_planner_node", route_ready_steps, ["execute_node", "report_node"])
     builder.add_edge("execute_node", "update_planner_node")
-    builder.add_conditional_edges("update_planner_node", route_when_plan_completed,{False:"execute_node",True:"report_node"})
+    builder.add_conditional_edges("update_planner_node", route_ready_steps, ["execute_node", "report_node"])
     return builder
 
-def route_when_plan_completed(state: State):
-    plan = state['plan']
-    if plan and len(plan['steps'][-1]['status'])>0 and plan['steps'][-1]['status'] == 'completed':
-        return True
-    else:
-        return False
+
+# execute_node 读取的状态字段。Send 的参数会随检查点写入，只传这些字段，不复制整个对话的 messages
+EXECUTE_STATE_KEYS = ("user_message", "plan", "observations", "all_messages", "run_id")
+
+
+def route_ready_steps(state: State):
+    """将依赖已满足的STEP通过Send并发分发给execute_node，所有STEP完成或请求预算用尽后进入report_node"""
+    ready_steps = get_ready_steps(state['plan'])
+    if not ready_steps:
+        return "report_node"
+    if budget_exhausted():
+        # 还有未执行的STEP，报告只基于部分结果
+        mark_cut_short('request_budget')
+        return "report_node"
+    step_state = {key: state[key] for key in EXECUTE_STATE_KEYS if key in state}
+    return [Send("execute_node", {**step_state, "current_step": step})
+            for step in ready_steps[:Config.MAX_PARALLEL_STEPS]]
 
 
 def get_graph_builder():
@@ -46,11 +60,11 @@ def build_graph_with_memory():
     return builder.compile(checkpointer=memory)
 
 
-def build_graph():
-    """Build and return the agent workflow graph without memory."""
+def build_graph(checkpointer=None):
+    """Build and return the agent workflow graph, optionally with a durable checkpointer for resumable runs."""
     # build state graph
     builder = _build_base_graph()
-    return builder.compile()
+    return builder.compile(checkpointer=checkpointer)
 
 
 # if __name__ == '__main__':
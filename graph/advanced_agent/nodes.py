@@ -1,25 +1,132 @@
 import asyncio
 import json
 import logging
+import time
 
 from dotenv import load_dotenv
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
-from langchain_openai import ChatOpenAI
+from langgraph.config import get_config
 
 from graph.advanced_agent.prompts import *
-from graph.advanced_agent.state import State
-from tools.mcp.mcp_server import get_all_tools, get_all_tools_dict
-from utils.llm import llm_invoke, llm_ainvoke
-from utils.tools import message_to_dict
+from graph.advanced_agent.state import State, Plan, normalize_plan, mark_steps_completed, merge_replan, plan_to_dict
+from tools.mcp.mcp_server import get_tool_registry
+from utils.context_window import context_window
+from utils.decorators import node_hook
+from utils.config_utils import Config
+from utils.json_repair import loads_tolerant
+from utils.llm import llm_ainvoke, llm_ainvoke_structured
+from utils.llm_router import get_routed_chat_model, get_tier_model
+from utils.tool_dispatch import dispatch_tool_calls
+from utils.tool_idempotency import IdempotencyScope, get_tool_result_store
+from utils.tools import message_to_dict, tools_list_to_dict
+from utils.transcript import record_message_refs
+from utils.usage import budget_exhausted, get_request_usage, mark_cut_short
 
 load_dotenv()
-# llm = ChatOpenAI(model="gemini-2.5-flash", temperature=0.0)
-llm = ChatOpenAI(model="gpt-4.1-mini", temperature=0.0)
-tools = asyncio.run(get_all_tools())
-tools_dict = asyncio.run(get_all_tools_dict())
-tools_info = str(tools)
+# 服务商、模型和温度见 config.yaml 的 llm_client 配置，与服务的其他LLM调用共享HTTP连接池；
+# 启用 llm_router 时在多个服务商之间路由。未在 models.NODES 中配置档位的节点使用该模型
+llm = get_routed_chat_model()
 logger = logging.getLogger(__name__)
 
+# 节点 -> 模型及输出校验失败时的升级模型，按 config.yaml 的 models 配置创建；context_summary 为上下文摘要使用的模型
+node_llms = {node: get_tier_model(tier) for node, tier in Config.MODEL_NODE_TIERS.items()}
+escalation_llms = {node: get_tier_model(Config.MODEL_ESCALATE_TO) for node, tier in Config.MODEL_NODE_TIERS.items()
+                   if Config.MODEL_ESCALATE_TO and tier != Config.MODEL_ESCALATE_TO}
+
+# 各节点改用升级模型的次数
+escalation_metrics = {}
+# 因执行上限提前结束的次数：max_iterations、step_deadline、request_budget、llm_timeout 为提前结束的STEP，
+# planner_timeout 为超过请求截止时间而沿用原计划的计划更新，report_timeout 为以STEP结果代替的报告
+limit_metrics = {}
+
+
+def get_node_llm(node: str):
+    return node_llms.get(node, llm)
+
+
+def get_escalation_llm(node: str):
+    """节点输出校验失败时改用的模型，节点已使用最高档位或未启用升级时返回None"""
+    return escalation_llms.get(node)
+
+
+def set_llm(model) -> None:
+    """所有节点改用同一个模型，不再升级（基准测试替换为桩模型时使用）"""
+    global llm
+    llm = model
+    node_llms.clear()
+    escalation_llms.clear()
+
+
+def get_escalation_metrics():
+    return dict(escalation_metrics)
+
+
+def get_limit_metrics():
+    return dict(limit_metrics)
+
+
+def _request_deadline():
+    """当前请求的截止时间（time.perf_counter()），未设置耗时预算时返回None"""
+    usage = get_request_usage()
+    return usage.deadline if usage is not None else None
+
+
+def _step_deadline(start: float):
+    """STEP的截止时间：STEP_TIMEOUT 与请求截止时间中较早者，均未设置时返回None"""
+    deadlines = [deadline for deadline in (start + Config.STEP_TIMEOUT if Config.STEP_TIMEOUT > 0 else None,
+                                           _request_deadline()) if deadline is not None]
+    return min(deadlines) if deadlines else None
+
+
+def _remaining(deadline):
+    """距截止时间的秒数，作为 asyncio.wait_for 的超时时间，未设置截止时间时返回None（不超时）"""
+    return None if deadline is None else max(deadline - time.perf_counter(), 0)
+
+
+def _deadline_exceeded(deadline):
+    """
+    LLM调用超时结束STEP时的 (原因, 说明)，区分是请求截止时间还是 STEP_TIMEOUT；
+    未设置截止时间或截止时间未到（超时来自LLM客户端本身）时返回 llm_timeout。
+    """
+    if deadline is None or time.perf_counter() < deadline:
+        return 'llm_timeout', "LLM call timed out"
+    usage = get_request_usage()
+    if usage is not None and usage.deadline is not None and deadline >= usage.deadline:
+        return 'request_budget', f"request deadline exceeded ({usage.deadline - usage.started:.0f}s)"
+    return 'step_deadline', f"step deadline exceeded ({Config.STEP_TIMEOUT:.0f}s)"
+
+
+def _report_timeout():
+    """报告生成的超时时间：REPORT_TIMEOUT 与请求剩余时间中较小者，剩余时间不低于 REPORT_MIN_TIMEOUT"""
+    timeouts = [Config.REPORT_TIMEOUT] if Config.REPORT_TIMEOUT > 0 else []
+    remaining = _remaining(_request_deadline())
+    if remaining is not None:
+        # 预算已用尽时仍给报告留出最短时间，避免直接退回到 fallback_report
+        timeouts.append(max(remaining, Config.REPORT_MIN_TIMEOUT))
+    return min(timeouts) if timeouts else None
+
+
+def _step_stop_reason(iterations: int, deadline):
+    """STEP需要结束时返回 (原因, 说明)，否则返回None"""
+    exhausted = budget_exhausted()
+    if exhausted:
+        return 'request_budget', exhausted
+    if deadline is not None and time.perf_counter() >= deadline:
+        return _deadline_exceeded(deadline)
+    if iterations >= Config.STEP_MAX_ITERATIONS > 0:
+        return 'max_iterations', f"reached {Config.STEP_MAX_ITERATIONS} iterations"
+    return None
+
+
+def _record_limit(reason: str) -> None:
+    limit_metrics[reason] = limit_metrics.get(reason, 0) + 1
+    mark_cut_short(reason)
+
+
+def _escalate(node: str, reason) -> None:
+    escalation_metrics[node] = escalation_metrics.get(node, 0) + 1
+    logger.warning(f"{node} 的输出校验失败，改用升级模型重试: {reason}")
+
 def extract_json(text):
     if '```json' not in text:
         return text
@@ -34,107 +141,300 @@ def extract_answer(text):
     return text
 
 
-def create_planner_node(state: State):
+# 计划生成的解析结果统计：structured 结构化输出直接成功，repaired 容错解析成功，
+# retries 额外的LLM调用次数，retry_seconds 重试带来的额外耗时，failures 重试耗尽的次数
+planner_metrics = {'calls': 0, 'structured': 0, 'repaired': 0, 'retries': 0, 'retry_seconds': 0.0, 'failures': 0}
+
+
+def get_planner_metrics():
+    return dict(planner_metrics)
+
+
+def _plan_candidates(response):
+    """返回可能包含计划JSON的文本：消息正文，以及结构化输出失败时的工具调用参数"""
+    candidates = [extract_json(extract_answer(response.content))] if isinstance(response.content, str) else []
+    for tool_call in getattr(response, 'invalid_tool_calls', None) or []:
+        if tool_call.get('args'):
+            candidates.append(tool_call['args'])
+    return candidates
+
+
+async def invoke_plan(state: State, messages, node: str):
+    """
+    调用LLM生成计划：优先使用绑定 Plan 模型的结构化输出，失败时对原始输出做一次容错解析，
+    仍然失败才追加错误信息重新调用LLM，最多重试 Config.PLAN_MAX_RETRIES 次。
+    节点配置了升级模型时，第一次重试改用升级模型重新生成。
+
+    Returns:
+        tuple: (计划dict，解析失败时为None, 最后一次的原始响应消息)
+    """
+    original = messages
+    messages = list(messages)
+    model = get_node_llm(node)
+    escalation_llm = get_escalation_llm(node)
+    planner_metrics['calls'] += 1
+    first_attempt_end = None
+    try:
+        for attempt in range(Config.PLAN_MAX_RETRIES + 1):
+            if Config.PLAN_STRUCTURED_OUTPUT:
+                response, parsed = await llm_ainvoke_structured(state, model, messages, Plan,
+                                                                Config.PLAN_STRUCTURED_OUTPUT_METHOD)
+            else:
+                response, parsed = await llm_ainvoke(state, model, messages, False), None
+            if first_attempt_end is None:
+                first_attempt_end = time.perf_counter()
+            if parsed is not None:
+                planner_metrics['structured'] += 1
+                return plan_to_dict(parsed), response
+            error = None
+            for candidate in _plan_candidates(response):
+                try:
+                    plan = plan_to_dict(Plan.model_validate(loads_tolerant(candidate)))
+                    planner_metrics['repaired'] += 1
+                    return plan, response
+                except Exception as e:
+                    error = e
+            if attempt < Config.PLAN_MAX_RETRIES:
+                planner_metrics['retries'] += 1
+                if escalation_llm is not None and model is not escalation_llm:
+                    # 升级模型使用原始提示词重新生成
+                    _escalate(node, error)
+                    model = escalation_llm
+                    messages = list(original)
+                    continue
+                logger.warning(f"计划解析失败，第{attempt + 1}次重试: {error}")
+                messages += [AIMessage(content=str(response.content)), HumanMessage(content=f"json格式错误:{error}")]
+        planner_metrics['failures'] += 1
+        logger.error("计划解析失败，已达到最大重试次数")
+        return None, response
+    finally:
+        if first_attempt_end is not None:
+            # 第一次调用之后的耗时全部来自重试
+            planner_metrics['retry_seconds'] += time.perf_counter() - first_attempt_end
+
+
+def parse_text_tool_call(content: str, tools_dict):
+    """
+    解析文本形式的 <tool_call>{"name": ..., "args": {...}}</tool_call>，容错解析JSON。
+
+    Returns:
+        tuple: (工具调用dict, None)，无法解析或调用了不存在的工具时为 (None, 问题描述)
+    """
+    try:
+        tool_call = loads_tolerant(content.split('<tool_call>')[-1].split('</tool_call>')[0].strip())
+        name, args = tool_call['name'], tool_call.get('args') or {}
+        if not isinstance(name, str) or not isinstance(args, dict):
+            raise TypeError("name must be a string and args an object")
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        return None, f"unparsable <tool_call>: {e}"
+    if name not in tools_dict:
+        return None, f"unknown tool {name}"
+    return {'name': name, 'args': args, 'id': ''}, None
+
+
+def invalid_tool_call(response, tools_dict):
+    """
+    校验模型返回的工具调用，返回第一个问题的描述，全部有效时返回None：
+    参数不是有效JSON、调用了不存在的工具，或文本形式的 <tool_call> 无法解析。
+    """
+    for tool_call in getattr(response, 'invalid_tool_calls', None) or []:
+        return f"invalid arguments for {tool_call.get('name')}: {tool_call.get('error') or tool_call.get('args')}"
+    for tool_call in getattr(response, 'tool_calls', None) or []:
+        if tool_call['name'] not in tools_dict:
+            return f"unknown tool {tool_call['name']}"
+    content = response.content if isinstance(response.content, str) else ''
+    if not getattr(response, 'tool_calls', None) and '<tool_call>' in content:
+        return parse_text_tool_call(content, tools_dict)[1]
+    return None
+
+
+@node_hook
+@record_message_refs
+async def create_planner_node(state: State):
     logger.info("***正在运行Create Planner node***")
+    # 首次使用时才发现MCP工具，之后使用缓存
+    tools_info = str(await get_tool_registry().get_tools())
     messages = [SystemMessage(content=PLAN_SYSTEM_PROMPT), HumanMessage(
         content=PLAN_CREATE_PROMPT.format(user_message=state['user_message'], tools_info=tools_info))]
-    response = llm_invoke(state, llm, messages)
-    state['observations'] += [str(response)]
-    plan = json.loads(extract_json(extract_answer(response['content'])))
-    return {'plan': plan}
+    plan, response = await invoke_plan(state, messages, 'create_planner_node')
+    if plan is None:
+        # 无法得到有效计划时返回空计划，直接进入report_node
+        plan = Plan(goal=state['user_message']).model_dump()
+    return {'plan': normalize_plan(plan), 'observations': [str(message_to_dict(response))]}
 
-def update_planner_node(state: State):
+@node_hook
+@record_message_refs
+async def update_planner_node(state: State):
     logger.info("***正在运行Update Planner node***")
-    plan = state['plan']
+    step_results = state.get('step_results') or {}
+    # 先将已执行的STEP标记为完成，再交给LLM调整后续计划
+    plan = mark_steps_completed(state['plan'], step_results)
     goal = plan['goal']
-    messages = state['observations']
-    messages.extend([SystemMessage(content=PLAN_SYSTEM_PROMPT),
-                     HumanMessage(content=UPDATE_PLAN_PROMPT.format(plan=plan, goal=goal))])
-    while True:
-        try:
-            response = llm_invoke(state, llm, messages)
-            plan = json.loads(extract_json(extract_answer(response['content'])))
-            state['messages']+=[AIMessage(content=json.dumps(plan, ensure_ascii=False))]
-            return {'plan': plan}
-        except Exception as e:
-            messages += [HumanMessage(content=f"json格式错误:{e}")]
+    exhausted = budget_exhausted()
+    if exhausted:
+        # 预算用尽后不再调整计划，route_ready_steps 直接进入report_node
+        logger.warning(f"跳过计划更新: {exhausted}")
+        return {'plan': plan, 'messages': [AIMessage(content=json.dumps(plan, ensure_ascii=False))]}
+    # 按节点token预算裁剪历史观察，较早的观察以摘要代替
+    messages = await context_window.fit('update_planner_node', state['observations'],
+                                        [SystemMessage(content=PLAN_SYSTEM_PROMPT),
+                                         HumanMessage(content=UPDATE_PLAN_PROMPT.format(plan=plan, goal=goal))],
+                                        get_node_llm('context_summary'))
+    try:
+        # 计划更新不超过请求截止时间，超时时取消进行中的LLM调用
+        updated_plan, _ = await asyncio.wait_for(invoke_plan(state, messages, 'update_planner_node'),
+                                                 _remaining(_request_deadline()))
+    except asyncio.TimeoutError:
+        _record_limit('planner_timeout')
+        updated_plan = None
+    if updated_plan is not None:
+        # 计划目标保持不变；已执行的STEP沿用当前计划，不依赖LLM回传的 id 和状态
+        updated_plan['goal'] = goal
+        plan = merge_replan(plan, updated_plan, step_results)
+    else:
+        logger.warning("计划更新失败，沿用当前计划")
+    return {'plan': plan, 'messages': [AIMessage(content=json.dumps(plan, ensure_ascii=False))]}
 
 
-def execute_node(state: State):
+@node_hook
+@record_message_refs
+async def execute_node(state: State):
+    """执行单个STEP，由 route_ready_steps 通过 Send 分发，相互独立的STEP会并发执行"""
     logger.info("***正在运行execute_node***")
-  
-    plan = state['plan']
-    steps = plan['steps']
-    current_step = None
-    current_step_index = 0
-    
-    # 获取第一个未完成STEP
-    for i, step in enumerate(steps):
-        status = step['status']
-        if status == 'pending':
-            current_step = step
-            current_step_index = i
-            break
-        
+
+    current_step = state['current_step']
     logger.info(f"当前执行STEP:{current_step}")
     
-    messages = state['observations'] + [SystemMessage(content=EXECUTE_SYSTEM_PROMPT),
-                                        HumanMessage(content=EXECUTION_PROMPT.format(user_message=state['user_message'],
-                                        step=current_step['description']))]
+    messages = await context_window.fit('execute_node', state['observations'],
+                                        [SystemMessage(content=EXECUTE_SYSTEM_PROMPT),
+                                         HumanMessage(content=EXECUTION_PROMPT.format(
+                                             user_message=state['user_message'], step=current_step['description']))],
+                                        get_node_llm('context_summary'))
+
+    # 使用绑定在常驻MCP会话上的工具，工具调用不再重新建立连接
+    tools = await get_tool_registry().get_tools()
+    session_tools_dict = tools_list_to_dict(tools)
 
-    # tools = await get_all_tools()
-    # tools_dict = await get_all_tools_dict()
+    # 本轮对话的工具调用幂等键，恢复运行时重新执行的STEP直接复用已成功的工具调用结果
+    thread_id = get_config()["configurable"].get("thread_id", "default")
+    scope = IdempotencyScope(thread_id, state['run_id'], current_step['id']) \
+        if state.get('run_id') and get_tool_result_store() is not None else None
 
     tool_message = None
     response_content = None
+    # 本STEP产生的消息和观察，执行结束后统一返回给graph，由reducer与其他并行STEP合并
+    new_messages = []
+    step_observations = []
+    model = get_node_llm('execute_node')
+    escalation_llm = get_escalation_llm('execute_node')
+    # LLM轮数和截止时间限制本STEP的执行时间，不取决于模型何时停止调用工具
+    deadline = _step_deadline(time.perf_counter())
+    iterations = 0
     while True:
-        response = asyncio.run(llm_ainvoke(state, llm.bind_tools(tools), messages, False))
-        state['observations'] += [response]
+        stopped = _step_stop_reason(iterations, deadline)
+        if stopped:
+            break
+        iterations += 1
+        try:
+            # 截止时间到达时 wait_for 取消进行中的LLM调用
+            response = await asyncio.wait_for(llm_ainvoke(state, model.bind_tools(tools), messages, False),
+                                              _remaining(deadline))
+            if escalation_llm is not None and model is not escalation_llm:
+                invalid = invalid_tool_call(response, session_tools_dict)
+                if invalid:
+                    # 本STEP之后的调用都使用升级模型
+                    _escalate('execute_node', invalid)
+                    model = escalation_llm
+                    response = await asyncio.wait_for(llm_ainvoke(state, model.bind_tools(tools), messages, False),
+                                                      _remaining(deadline))
+        except asyncio.TimeoutError:
+            stopped = _step_stop_reason(iterations, deadline) or _deadline_exceeded(deadline)
+            break
+        step_observations += [response]
         response = message_to_dict(response)
         response_content = extract_answer(response['content'])
         if response['tool_calls']:
-            for tool_call in response['tool_calls']:
+            ai_message = AIMessage(content=response_content, tool_calls=response['tool_calls'])
+            new_messages.append(ai_message)
+            messages += [ai_message]
+            # 同一轮的工具调用并发执行，结果与tool_calls顺序一致
+            # 工具调用的超时不超过STEP剩余时间，超时的调用被取消并作为错误结果返回，已完成的结果保留
+            remaining = _remaining(deadline)
+            results = await dispatch_tool_calls(response['tool_calls'], session_tools_dict,
+                                                timeout=Config.TOOL_CALL_TIMEOUT if remaining is None
+                                                else min(Config.TOOL_CALL_TIMEOUT, remaining),
+                                                scope=scope, thread_id=thread_id)
+            for result in results:
+                tool_call = result['tool_call']
                 tool_name = tool_call['name']
                 tool_args = tool_call['args']
-                tool_result = asyncio.run(tools_dict[tool_name].ainvoke(tool_args))
+                tool_result = result['result']
                 logger.info(f"tool_name:{tool_name},tool_args:{tool_args}\ntool_result:{tool_result}")
-                ai_message = AIMessage(content=response_content, tool_calls=response['tool_calls'])
-                yield {'messages': [ai_message]}
                 tool_message = ToolMessage(
                     content=f"tool_name:{tool_name},tool_args:{tool_args}\ntool_result:{tool_result}",
-                    name=tool_name, tool_call_id=tool_call['id'])
-                messages += [ai_message, tool_message]
-                state['observations'] += [tool_message]
-                yield {'messages': [tool_message]}
+                    name=tool_name, tool_call_id=tool_call['id'], status='error' if result['error'] else 'success',
+                    response_metadata={'elapsed': result['elapsed'], 'wait': result['wait'],
+                                       'replayed': result['replayed']})
+                messages += [tool_message]
+                step_observations += [tool_message]
+                new_messages.append(tool_message)
 
         elif '<tool_call>' in response['content']:
-            tool_call = response['content'].split('<tool_call>')[-1].split('</tool_call>')[0].strip()
-
-            tool_call = json.loads(tool_call)
-
-            tool_name = tool_call['name']
-            tool_args = tool_call['args']
-            tool_result = asyncio.run(tools_dict[tool_name].ainvoke(tool_args))
-            logger.info(f"tool_name:{tool_name},tool_args:{tool_args}\ntool_result:{tool_result}")
+            # 无法解析或调用了不存在的工具时把错误作为工具结果返回给模型，由模型修正，不中断STEP
+            tool_call, error = parse_text_tool_call(response['content'], session_tools_dict)
+            if error:
+                tool_result = f"Error: {error}"
+                logger.warning(f"Invalid <tool_call> in STEP {current_step['id']}: {error}")
+            else:
+                remaining = _remaining(deadline)
+                result, = await dispatch_tool_calls([tool_call], session_tools_dict,
+                                                    timeout=Config.TOOL_CALL_TIMEOUT if remaining is None
+                                                    else min(Config.TOOL_CALL_TIMEOUT, remaining),
+                                                    scope=scope, thread_id=thread_id)
+                tool_result = result['result']
+                logger.info(f"tool_name:{tool_call['name']},tool_args:{tool_call['args']}\ntool_result:{tool_result}")
             messages += [AIMessage(content=extract_answer(response['content']))]
             messages += [HumanMessage(content=f"tool_result:{tool_result}")]
         else:
             break
 
+    if stopped:
+        # 提前结束的STEP保留已得到的工具结果（在观察中），由report_node基于部分结果生成报告
+        reason, detail = stopped
+        _record_limit(reason)
+        logger.warning(f"STEP {current_step['id']} 提前结束: {detail}")
+        response_content = f"{response_content or ''}\n(STEP未完成: {detail})".strip()
     logger.info(f"当前STEP执行总结:{response_content}")
 
-    return
+    return {'messages': new_messages, 'observations': step_observations,
+            'step_results': {current_step['id']: response_content}}
 
 
-def report_node(state: State):
+@node_hook
+@record_message_refs
+async def report_node(state: State):
     """Report node that writes a final report."""
     logger.info("***正在运行report_node***")
     
-    observations = state.get("observations")
-    messages = observations + [HumanMessage(content=REPORT_SYSTEM_PROMPT)]
-    response = llm_invoke(state, llm, messages)
-    response = AIMessage(content=response['content'])
-    # state['messages'] += [AIMessage(content=response["content"])]
-    # state['final_report'] += [AIMessage(content=response["content"])]
-    # return state
+    messages = await context_window.fit('report_node', state.get("observations"),
+                                        [HumanMessage(content=REPORT_SYSTEM_PROMPT)], get_node_llm('context_summary'))
+    timeout = _report_timeout()
+    try:
+        # 直接返回模型输出的消息，保留消息ID：流式输出时已逐token发送过的报告不会在节点结束时再次发送
+        response = await asyncio.wait_for(llm_ainvoke(state, get_node_llm('report_node'), messages, False), timeout)
+    except asyncio.TimeoutError:
+        _record_limit('report_timeout')
+        logger.warning(f"报告生成超过 {timeout:.0f}s，以各STEP的结果代替")
+        response = AIMessage(content=fallback_report(state))
     return {"final_report": response, "messages": [response]}
+
+
+def fallback_report(state: State) -> str:
+    """报告生成超时时返回的内容：计划目标及各STEP的执行结果"""
+    plan = state.get('plan') or {}
+    step_results = state.get('step_results') or {}
+    lines = [f"报告生成超时，以下为各STEP的执行结果。目标：{plan.get('goal', state.get('user_message', ''))}"]
+    for step in plan.get('steps', []):
+        result = step_results.get(step.get('id'), '未执行')
+        lines.append(f"STEP {step.get('id')} {step.get('title', '')}：{result}")
+    return "\n\n".join(lines)
@@ -34,10 +34,12 @@ Return format requirements are as follows:
 - Create a plan based on the tools you can use. Please note that you cannot use the tools; you can only create a plan based on them.
 - JSON fields are as follows:
     - thought: string, required, response to user's message and thinking about the task, as detailed as possible
-    - steps: array, each step contains title and description
+    - steps: array, each step contains id, title, description, status and depends_on
+        - id: string, required, unique step id, e.g. "1", "2"
         - title: string, required, step title
         - description: string, required, step description
         - status: string, required, step status, can be pending or completed
+        - depends_on: array of string, required, ids of the steps that must be completed before this step; use an empty array if the step is independent, independent steps will be executed in parallel
     - goal: string, plan goal generated based on the context
 - If the task is determined to be unfeasible, return an empty array for steps and empty string for goal
 
@@ -47,9 +49,11 @@ EXAMPLE JSON OUTPUT:
    "goal": "",
    "steps": [
       {{  
+            "id": "1",
             "title": "",
-            "description": ""
-            "status": "pending"
+            "description": "",
+            "status": "pending",
+            "depends_on": []
       }}
    ],
 }}
@@ -57,6 +61,7 @@ EXAMPLE JSON OUTPUT:
 Create a plan according to the following requirements:
 - Provide as much detail as possible for each step
 - Break down complex steps into multiple sub-steps
+- Only declare a dependency when a step really needs the result of another step
 
 User message:
 {user_message}
@@ -71,6 +76,7 @@ You are updating the plan, you need to update the plan based on the context resu
 - Don't change the description if the change is small
 - Status: pending or completed
 - Only re-plan the following uncompleted steps, don't change the completed steps
+- Keep the id and depends_on of existing steps, new steps must use new unique ids
 - Keep the output format consistent with the input plan's format.
 
 Input:
@@ -1,18 +1,24 @@
-from typing import List, Dict, Any
+import logging
+import uuid
+from typing import List, Dict, Any, Optional, Annotated
 from typing import Literal
 
-from langchain_core.messages import AnyMessage
 from langgraph.graph import MessagesState
 from pydantic import BaseModel
 
 
 # from utils.agent_utils import ToolConfig
 
+logger = logging.getLogger(__name__)
+
 
 class Step(BaseModel):
+    id: str = ""
     title: str = ""
     description: str = ""
     status: Literal["pending", "completed"] = "pending"
+    # 依赖的STEP id，依赖全部完成后该STEP才能执行；为空表示可以与其他STEP并行
+    depends_on: List[str] = []
 
 
 class Plan(BaseModel):
@@ -20,22 +26,170 @@ class Plan(BaseModel):
     thought: str = ""
     steps: List[Step] = []
 
+def merge_observations(left: List, right: Optional[List]) -> List:
+    """observations 的 reducer：并行STEP各自返回的观察按顺序追加；传入 None 表示清空（新一轮对话开始）"""
+    if right is None:
+        return []
+    return (left or []) + list(right)
+
+
+def merge_message_ids(left: List[str], right: Optional[List[str]]) -> List[str]:
+    """all_messages 的 reducer：追加尚未记录的消息ID，并行STEP各自返回的ID按顺序合并；传入 None 表示清空"""
+    if right is None:
+        return []
+    known = set(left or [])
+    return (left or []) + [message_id for message_id in dict.fromkeys(right) if message_id not in known]
+
+
+def merge_step_results(left: Dict[str, str], right: Optional[Dict[str, str]]) -> Dict[str, str]:
+    """step_results 的 reducer：合并各STEP的执行总结（step id -> 总结）；传入 None 表示清空"""
+    if right is None:
+        return {}
+    return {**(left or {}), **right}
+
+
 class State(MessagesState):
     user_message: str = ""
     plan: Plan
-    observations: List
+    observations: Annotated[List, merge_observations]
+    # 本轮对话中已执行完成的STEP及其执行总结
+    step_results: Annotated[Dict[str, str], merge_step_results]
     final_report: List
     # last_node: str = ''
-    all_messages: List[AnyMessage] = []
+    # 本轮对话中发给LLM及LLM返回的消息ID，消息内容只写入对话记录存储（utils/transcript.py）一次
+    all_messages: Annotated[List[str], merge_message_ids]
+    # 本轮对话的运行ID，从检查点恢复运行时保持不变，用于生成工具调用的幂等键
+    run_id: str = ""
     # tools_messages: List[AnyMessage]
 
 
-def graph_input_formpt(user_message, plan: Plan = None, observations: List = [], final_report: List = []) -> Dict[
+def graph_input_formpt(user_message, plan: Plan = None, observations: List = None, final_report: List = None) -> Dict[
     Any, Any]:
+    # observations、step_results 和 all_messages 传入 None 会清空同一线程上一轮对话遗留的内容
+    # 每次调用都创建新的列表，避免并发请求之间共享同一个可变默认值
     return {
         "user_message": user_message,
         "plan": plan,
         "observations": observations,
-        "final_report": final_report,
-        "all_messages": [],
+        "step_results": None,
+        "final_report": final_report if final_report is not None else [],
+        "all_messages": None,
+        "run_id": uuid.uuid4().hex,
     }
+
+
+def plan_to_dict(plan: Plan) -> Dict[str, Any]:
+    """
+    将解析出的 Plan 转为dict。模型没有给出 depends_on 的STEP不带该字段，
+    由 normalize_plan 按顺序执行补全，而不是当作无依赖的STEP并行执行。
+    """
+    data = plan.model_dump()
+    for step, parsed in zip(data['steps'], plan.steps):
+        if 'depends_on' not in parsed.model_fields_set:
+            del step['depends_on']
+    return data
+
+
+def _unique_id(preferred: str, used: set) -> str:
+    """返回未被使用的STEP id，优先使用 preferred，冲突时追加序号"""
+    step_id, n = preferred, 1
+    while step_id in used:
+        n += 1
+        step_id = f"{preferred}_{n}"
+    return step_id
+
+
+def normalize_plan(plan: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    补全计划中每个STEP的 id、status 和 depends_on 字段。
+
+    缺少 id 或 id 与前面的STEP重复时重新编号，依赖重复 id 的STEP依赖其中第一个STEP。
+    未声明 depends_on 的STEP视为依赖上一个STEP，保持与旧版计划一致的顺序执行语义。
+    """
+    steps = plan.get('steps') or []
+    # 模型给出的 id 优先保留，补全的 id 避开所有已给出的 id
+    explicit = {str(step['id']) for step in steps if step.get('id')}
+    used = set()
+    for i, step in enumerate(steps):
+        step_id = str(step.get('id') or '')
+        if not step_id or step_id in used:
+            if step_id:
+                logger.warning(f"计划中STEP id {step_id} 重复，重新编号")
+            step_id = _unique_id(str(i + 1), used | explicit)
+        used.add(step_id)
+        step['id'] = step_id
+        step.setdefault('status', 'pending')
+        if 'depends_on' not in step:
+            step['depends_on'] = [steps[i - 1]['id']] if i > 0 else []
+        step['depends_on'] = [str(dep) for dep in step['depends_on'] or [] if str(dep) != step_id]
+    plan['steps'] = steps
+    return plan
+
+
+def mark_steps_completed(plan: Dict[str, Any], step_results: Dict[str, str]) -> Dict[str, Any]:
+    """将已经执行过的STEP标记为 completed，避免重复执行"""
+    for step in plan.get('steps') or []:
+        if step['id'] in step_results:
+            step['status'] = 'completed'
+    return plan
+
+
+def _step_content(step: Dict[str, Any]) -> tuple:
+    return (step.get('title') or '').strip().lower(), (step.get('description') or '').strip().lower()
+
+
+def merge_replan(plan: Dict[str, Any], updated: Dict[str, Any], step_results: Dict[str, str]) -> Dict[str, Any]:
+    """
+    合并重新生成的计划。已执行的STEP（step_results 中的STEP）始终沿用当前计划中的内容和 id，
+    不依赖模型回传的 id 和状态：
+
+      - 新计划中与已执行STEP内容（标题和描述）相同，或沿用其 id 并标记为 completed 的STEP视为该STEP，不再执行；
+      - 其余STEP都作为 pending STEP，id 与已执行STEP冲突时重新编号，依赖关系随之改写。
+    """
+    completed = [dict(step, status='completed') for step in plan.get('steps') or [] if step['id'] in step_results]
+    completed_ids = {step['id'] for step in completed}
+    by_content = {_step_content(step): step['id'] for step in completed}
+    updated = normalize_plan(updated)
+    # 新计划中的 id -> 合并后的 id
+    remap = {}
+    pending = []
+    for step in updated['steps']:
+        same = by_content.get(_step_content(step))
+        if same is None and step['id'] in completed_ids and step['status'] == 'completed':
+            same = step['id']
+        if same is not None:
+            remap[step['id']] = same
+            continue
+        pending.append(step)
+    used = completed_ids | {step['id'] for step in pending}
+    for step in pending:
+        if step['id'] in completed_ids:
+            new_id = _unique_id(step['id'], used)
+            used.add(new_id)
+            remap[step['id']] = new_id
+    for step in pending:
+        step['id'] = remap.get(step['id'], step['id'])
+        step['status'] = 'pending'
+        step['depends_on'] = [remap.get(dep, dep) for dep in step['depends_on']]
+    updated['steps'] = completed + pending
+    return updated
+
+
+def get_ready_steps(plan: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    返回所有依赖已满足、可以立即执行的 pending STEP。
+
+    依赖了不存在的STEP id 时忽略该依赖；若存在 pending STEP 但都因循环依赖无法执行，
+    返回第一个 pending STEP，保证计划能够继续推进。
+    """
+    if not plan:
+        return []
+    steps = plan.get('steps') or []
+    known_ids = {step['id'] for step in steps}
+    completed_ids = {step['id'] for step in steps if step['status'] == 'completed'}
+    pending = [step for step in steps if step['status'] == 'pending']
+    ready = [step for step in pending
+             if all(dep in completed_ids or dep not in known_ids for dep in step['depends_on'])]
+    if pending and not ready:
+        return pending[:1]
+    return ready
@@ -1,26 +1,38 @@
+import asyncio
 import logging
 
-from concurrent_log_handler import ConcurrentRotatingFileHandler
-
 from graph.advanced_agent.graph import build_graph
 from graph.advanced_agent.state import graph_input_formpt
-from utils.agent_utils import graph_response
+from utils.agent_utils import agraph_response
+from utils.checkpointer import CompactingAsyncPostgresSaver
 from utils.config_utils import Config
+from utils.db_pool import create_async_connection_pool
+from utils.log_utils import get_log_handler
+from utils.usage import start_request_usage
 
-handler = ConcurrentRotatingFileHandler(
-    # 日志文件
-    Config.LOG_FILE,
-    # 日志文件最大允许大小为5MB，达到上限后触发轮转
-    maxBytes=Config.MAX_BYTES,
-    # 在轮转时，最多保留3个历史日志文件
-    backupCount=Config.BACKUP_COUNT
-)
-format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 logging.basicConfig(level=logging.INFO,  # 设置根logger的级别
-                    format=format,
-                    handlers=[handler])  # 添加StreamHandler
+                    handlers=[get_log_handler()])  # 共享的日志处理器，写文件由后台线程完成
 logger = logging.getLogger(__name__)
 
+
+async def run(user_input: str, config: dict):
+    """运行一轮对话；线程上一次运行被中断时，先从最后完成的一步继续运行"""
+    pool = create_async_connection_pool("main")
+    await pool.open()
+    try:
+        checkpointer = CompactingAsyncPostgresSaver(pool)
+        await checkpointer.setup()
+        graph = build_graph(checkpointer)
+        # 与服务的请求相同，按 budget 配置限制本轮对话的token用量和耗时
+        start_request_usage(config["configurable"]["user_id"])
+        if (await graph.aget_state(config)).next:
+            logger.info(f"Resuming interrupted run of thread {config['configurable']['thread_id']}")
+            await agraph_response(graph, None, config)
+        await agraph_response(graph, graph_input_formpt(user_input), config)
+    finally:
+        await pool.close()
+
+
 if __name__ == '__main__':
     # inputs = {"user_message": "对所给文档进行分析，生成分析报告，文档路径为student_habits_performance.csv",
     #           "plan": None,
@@ -28,10 +40,6 @@ if __name__ == '__main__':
     #           "final_report": ""}
 
     user_input = "帮我创建一个名为test.py的文件，内容为test123"
-    graph_input = graph_input_formpt(user_input)
-
-    graph = build_graph()
     # asyncio.run(graph.astream(graph_input_formpt(user_input), {"recursion_limit":100}))
-    config = {"configurable": {"thread_id": "330", "user_id": "330"}}
-    graph_response(graph, graph_input, config)
-    # asyncio.run(graph_response(graph, graph_input,config))
+    config = {"configurable": {"thread_id": "330", "user_id": "330"}, "recursion_limit": Config.GRAPH_RECURSION_LIMIT}
+    asyncio.run(run(user_input, config))
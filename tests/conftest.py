@@ -0,0 +1,17 @@
+"""
+测试在临时目录中运行：Config 从当前目录读取 config.yaml，这里使用 config_example.yaml 的副本，
+日志等运行时文件也写入临时目录，不依赖本地配置。
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_workdir = tempfile.mkdtemp(prefix="multi-agent-tests-")
+shutil.copy(os.path.join(ROOT, "config_example.yaml"), os.path.join(_workdir, "config.yaml"))
+os.chdir(_workdir)
+# 节点模块导入时会实例化ChatOpenAI，提供占位密钥即可，测试不会真正调用
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
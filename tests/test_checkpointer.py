@@ -0,0 +1,161 @@
+import asyncio
+import contextlib
+import os
+
+import pytest
+from langgraph.checkpoint.base import create_checkpoint, empty_checkpoint
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+import utils.checkpointer as checkpointer
+from utils.checkpointer import HASHLIST_TYPE, CompactingAsyncPostgresSaver, dump_compacted, split_digests
+
+serde = JsonPlusSerializer()
+
+
+def restore(blob_rows, content_rows):
+    """按 _load_checkpoint_tuple 的方式从哈希列表和内容还原列表通道"""
+    contents = {row[1]: (row[2], row[3]) for row in content_rows}
+    return {channel: [serde.loads_typed(contents[digest]) for digest in split_digests(blob)]
+            for _, _, channel, _, type_, blob in blob_rows if type_ == HASHLIST_TYPE}
+
+
+def test_dump_compacted_round_trip():
+    values = {"messages": ["a", {"b": 1}, "a"], "plan": {"steps": []}, "__pregel_tasks": ["send"]}
+    versions = {"messages": 2, "plan": 1, "__pregel_tasks": 1, "cleared": 3}
+    blob_rows, content_rows = dump_compacted(serde, "t", "", values, versions, set())
+
+    assert restore(blob_rows, content_rows) == {"messages": ["a", {"b": 1}, "a"]}
+    # 重复元素只写入一次内容
+    assert len(content_rows) == 2
+    types = {row[2]: row[4] for row in blob_rows}
+    assert types["cleared"] == "empty"
+    assert types["plan"] != HASHLIST_TYPE
+    assert types["__pregel_tasks"] != HASHLIST_TYPE
+
+
+def test_dump_compacted_skips_known_content():
+    values = {"messages": ["a", "b"]}
+    _, first = dump_compacted(serde, "t", "", values, {"messages": 1}, set())
+    values["messages"].append("c")
+    blob_rows, content_rows = dump_compacted(serde, "t", "", values, {"messages": 2}, {row[1] for row in first})
+
+    assert [serde.loads_typed((row[2], row[3])) for row in content_rows] == ["c"]
+    assert restore(blob_rows, first + content_rows) == {"messages": ["a", "b", "c"]}
+
+
+class FakeCursor:
+    def __init__(self, log):
+        self.log = log
+        self.rowcount = 0
+        self.connection = self
+
+    def transaction(self):
+        return FakeTransaction(self.log)
+
+    def cursor(self, **kwargs):
+        return self
+
+    async def executemany(self, sql, rows):
+        self.log.append(("insert", sql.split()[2], len(rows)))
+        await asyncio.sleep(0.01)
+
+    async def execute(self, sql, params=None):
+        self.log.append(("execute",))
+        await asyncio.sleep(0.01)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeTransaction:
+    def __init__(self, log):
+        self.log = log
+
+    async def __aenter__(self):
+        self.log.append(("begin",))
+
+    async def __aexit__(self, *exc):
+        self.log.append(("commit",))
+
+
+class FakeSaver(CompactingAsyncPostgresSaver):
+    """不连接数据库，记录 aput 和 aprune 发出的语句顺序"""
+
+    def __init__(self, log):
+        super().__init__(object(), serde=serde, keep_last=2, prune_every=1000)
+        self.log = log
+
+    @contextlib.asynccontextmanager
+    async def _cursor(self, *, pipeline=False):
+        yield FakeCursor(self.log)
+
+    async def _timed(self, kind, coro):
+        return await coro
+
+
+def test_prune_and_aput_do_not_interleave(monkeypatch):
+    log = []
+
+    @contextlib.asynccontextmanager
+    async def get_connection(conn):
+        yield FakeCursor(log)
+
+    monkeypatch.setattr(checkpointer._ainternal, "get_connection", get_connection)
+    checkpoint = empty_checkpoint()
+    checkpoint["channel_values"] = {"messages": ["a", "b"]}
+    config = {"configurable": {"thread_id": "t", "checkpoint_ns": ""}}
+
+    async def run():
+        saver = FakeSaver(log)
+        # 写入前已知内容都已存在：与清理并发时，清理提交后写入必须重新写入被跳过的内容
+        saver._known_for("t").update(row[1] for row in dump_compacted(
+            serde, "t", "", checkpoint["channel_values"], {"messages": 1}, set())[1])
+        await asyncio.gather(saver.aprune("t"), saver.aput(config, checkpoint, {}, {"messages": 1}))
+
+    asyncio.run(run())
+
+    commits = [i for i, entry in enumerate(log) if entry == ("commit",)]
+    assert len(commits) == 2
+    prune, put = log[:commits[0] + 1], log[commits[0] + 1:]
+    assert all(entry[0] != "insert" for entry in prune)
+    assert ("insert", "checkpoint_content", 2) in put
+
+
+@pytest.mark.skipif(not os.environ.get("TEST_DB_URI"), reason="TEST_DB_URI not set")
+def test_postgres_round_trip_and_prune():
+    from utils.config_utils import Config
+    from utils.db_pool import create_async_connection_pool
+
+    Config.DB_URI = os.environ["TEST_DB_URI"]
+
+    async def run():
+        pool = create_async_connection_pool("test")
+        await pool.open()
+        try:
+            saver = CompactingAsyncPostgresSaver(pool, keep_last=2, prune_every=1000)
+            await saver.setup()
+            await saver.adelete_thread("test-checkpointer")
+            config = {"configurable": {"thread_id": "test-checkpointer", "checkpoint_ns": ""}}
+            checkpoint, messages = empty_checkpoint(), []
+            for step in range(5):
+                messages = messages + [f"message {step}"]
+                checkpoint = create_checkpoint(checkpoint, None, step)
+                checkpoint["channel_values"] = {"messages": messages}
+                checkpoint["channel_versions"] = {"messages": step + 1}
+                config = await saver.aput(config, checkpoint, {"step": step}, {"messages": step + 1})
+            loaded = await saver.aget_tuple(config)
+            assert loaded.checkpoint["channel_values"]["messages"] == messages
+
+            deleted = await saver.aprune("test-checkpointer")
+            assert deleted["checkpoints"] == 3
+            remaining = [item async for item in saver.alist({"configurable": {"thread_id": "test-checkpointer"}})]
+            assert len(remaining) == 2
+            assert remaining[0].checkpoint["channel_values"]["messages"] == messages
+            await saver.adelete_thread("test-checkpointer")
+        finally:
+            await pool.close()
+
+    asyncio.run(run())
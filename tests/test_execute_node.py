@@ -0,0 +1,136 @@
+import asyncio
+import time
+from typing import List
+
+import pytest
+from langchain_core.messages import BaseMessage, ToolMessage
+from langchain_core.tools import StructuredTool
+
+from benchmarks.stubs import StubChatModel
+from graph.advanced_agent import nodes
+from graph.advanced_agent.graph import build_graph
+from graph.advanced_agent.state import graph_input_formpt
+from utils.config_utils import Config
+from utils.usage import _request_usage, start_request_usage
+
+
+@pytest.fixture(autouse=True)
+def request_usage():
+    """每个测试结束后清除当前上下文中的请求用量"""
+    token = _request_usage.set(None)
+    yield
+    _request_usage.reset(token)
+
+
+class StubToolRegistry:
+    def __init__(self):
+        async def stub_tool(round: int = 0) -> str:
+            return f"result of round {round}"
+
+        self.tools = [StructuredTool.from_function(coroutine=stub_tool, name="stub_tool",
+                                                   description="stub tool for tests")]
+
+    async def get_tools(self):
+        return self.tools
+
+
+class TextToolCallModel(StubChatModel):
+    """执行STEP时依次返回给定的文本 <tool_call>，之后给出总结"""
+
+    replies: List[str] = []
+
+    def _reply(self, messages: List[BaseMessage]) -> str:
+        reply = super()._reply(messages)
+        if reply != "stub step summary":
+            return reply
+        calls = sum(1 for m in messages if "tool_result:" in str(m.content))
+        return self.replies[calls] if calls < len(self.replies) else reply
+
+
+def run_graph(monkeypatch, llm, **config):
+    monkeypatch.setattr(nodes, "get_tool_registry", StubToolRegistry)
+    for key, value in config.items():
+        monkeypatch.setattr(Config, key, value)
+    nodes.set_llm(llm)
+    return asyncio.run(build_graph().ainvoke(graph_input_formpt("test"), {"recursion_limit": 50}))
+
+
+def test_deadline_exceeded_without_deadline():
+    assert nodes._deadline_exceeded(None)[0] == "llm_timeout"
+    # 截止时间未到时超时来自LLM客户端
+    assert nodes._deadline_exceeded(time.perf_counter() + 60)[0] == "llm_timeout"
+
+
+def test_deadline_exceeded_reports_the_deadline_that_fired(monkeypatch):
+    monkeypatch.setattr(Config, "STEP_TIMEOUT", 30)
+    assert nodes._deadline_exceeded(time.perf_counter() - 1) == ("step_deadline", "step deadline exceeded (30s)")
+
+    usage = start_request_usage("test", time_budget=20)
+    usage.started, usage.deadline = usage.started - 21, usage.deadline - 21
+    assert nodes._deadline_exceeded(usage.deadline) == ("request_budget", "request deadline exceeded (20s)")
+
+
+def test_step_stop_reason(monkeypatch):
+    monkeypatch.setattr(Config, "STEP_MAX_ITERATIONS", 3)
+    assert nodes._step_stop_reason(2, None) is None
+    assert nodes._step_stop_reason(3, None)[0] == "max_iterations"
+    assert nodes._step_stop_reason(0, time.perf_counter() - 1)[0] == "step_deadline"
+
+    start_request_usage("test", token_budget=1).add("execute_node", 1, 1)
+    assert nodes._step_stop_reason(0, None)[0] == "request_budget"
+
+
+def test_report_timeout_follows_request_deadline(monkeypatch):
+    monkeypatch.setattr(Config, "REPORT_TIMEOUT", 120)
+    monkeypatch.setattr(Config, "REPORT_MIN_TIMEOUT", 5)
+    assert nodes._report_timeout() == 120
+
+    usage = start_request_usage("test", time_budget=30)
+    assert 25 < nodes._report_timeout() <= 30
+    usage.deadline = time.perf_counter() - 1
+    assert nodes._report_timeout() == 5
+
+    monkeypatch.setattr(Config, "REPORT_TIMEOUT", 0)
+    assert nodes._report_timeout() == 5
+
+
+def test_parse_text_tool_call():
+    tools = {"stub_tool": object()}
+
+    call, error = nodes.parse_text_tool_call('<tool_call>{"name": "stub_tool", "args": {"round": 1},}</tool_call>',
+                                             tools)
+    assert error is None and call["name"] == "stub_tool" and call["args"] == {"round": 1}
+    assert nodes.parse_text_tool_call('<tool_call>{"name": "missing"}</tool_call>', tools)[1] == "unknown tool missing"
+    assert nodes.parse_text_tool_call("<tool_call>not json</tool_call>", tools)[1].startswith("unparsable")
+    assert nodes.parse_text_tool_call('<tool_call>["stub_tool"]</tool_call>', tools)[1].startswith("unparsable")
+
+
+def test_invalid_text_tool_calls_do_not_fail_the_step(monkeypatch):
+    llm = TextToolCallModel(latency=0, replies=['<tool_call>{"name": "made_up", "args": {}}</tool_call>',
+                                                "<tool_call>{oops</tool_call>",
+                                                '<tool_call>{"name": "stub_tool", "args": {"round": 7}}</tool_call>'])
+    result = run_graph(monkeypatch, llm, STEP_MAX_ITERATIONS=8, STEP_TIMEOUT=0)
+
+    assert result["step_results"] == {"1": "stub step summary"}
+    assert result["final_report"].content.startswith("stub report")
+
+
+def test_runaway_step_stops_at_max_iterations(monkeypatch):
+    before = nodes.get_limit_metrics().get("max_iterations", 0)
+    result = run_graph(monkeypatch, StubChatModel(latency=0, tool_rounds=-1), STEP_MAX_ITERATIONS=3, STEP_TIMEOUT=0)
+
+    assert "STEP未完成: reached 3 iterations" in result["step_results"]["1"]
+    assert sum(isinstance(m, ToolMessage) for m in result["observations"]) == 3
+    assert nodes.get_limit_metrics()["max_iterations"] == before + 1
+    assert result["final_report"].content.startswith("stub report")
+
+
+def test_runaway_step_stops_at_request_deadline(monkeypatch):
+    start_request_usage("test", time_budget=0.3)
+    result = run_graph(monkeypatch, StubChatModel(latency=0.05, tool_rounds=-1), STEP_MAX_ITERATIONS=0,
+                       STEP_TIMEOUT=0, REPORT_MIN_TIMEOUT=5)
+
+    assert "STEP未完成" in result["step_results"]["1"]
+    assert "time budget exhausted" in result["step_results"]["1"]
+    # 请求截止后报告仍有 REPORT_MIN_TIMEOUT 可用，不会退回到 fallback_report
+    assert result["final_report"].content.startswith("stub report")
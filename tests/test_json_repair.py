@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+from utils.json_repair import loads_tolerant, repair_json
+
+
+def test_valid_json_is_parsed_unchanged():
+    assert loads_tolerant('{"steps": [{"id": "1", "content": "a, b"}]}') == {"steps": [{"id": "1", "content": "a, b"}]}
+
+
+def test_repairs_common_llm_output():
+    text = '好的，计划如下：\n```json\n{"steps": [{"id": "1", "done": False, "note": None},], "final": True}\n```\n以上。'
+    assert loads_tolerant(text) == {"steps": [{"id": "1", "done": False, "note": None}], "final": True}
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"a": 1, "b":', {"a": 1}),
+    ('{"a": 1, "b"', {"a": 1}),
+    ('{"a": 1, "ke', {"a": 1}),
+    ('{"a": "hel', {"a": "hel"}),
+    ('{"a": "q\\', {"a": "q"}),
+    ('{"a": {"b": [1, 2,', {"a": {"b": [1, 2]}}),
+    ('{"a": "x", "b": {"c"', {"a": "x", "b": {}}),
+])
+def test_truncated_output(text, expected):
+    assert loads_tolerant(text) == expected
+
+
+def test_brackets_and_keywords_inside_strings_are_kept():
+    assert loads_tolerant('{"a": "[x, True}", "b": 1,}') == {"a": "[x, True}", "b": 1}
+
+
+def test_unrepairable_input_raises_decode_error():
+    with pytest.raises(json.JSONDecodeError):
+        loads_tolerant('{"a": 中文}')
+    with pytest.raises(json.JSONDecodeError):
+        loads_tolerant("no json here")
+
+
+def test_large_truncated_array():
+    text = "[" + ",".join(['{"a": [1, 2]}'] * 20000)
+    assert repair_json(text).endswith("]") and len(loads_tolerant(text)) == 20000
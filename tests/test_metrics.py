@@ -0,0 +1,19 @@
+from utils.instrumentation import _cumulative, _point_in_time
+from utils.metrics import MetricsRegistry
+
+
+def test_counter_callback_renders_total_samples():
+    registry = MetricsRegistry()
+    registry.counter("cache_events", "Cache events", ("metric",), callback=lambda: {("hits",): 3})
+
+    assert registry.render().splitlines() == ["# HELP cache_events Cache events", "# TYPE cache_events counter",
+                                              'cache_events_total{metric="hits"} 3']
+
+
+def test_component_stats_split_into_counters_and_gauges():
+    stats = lambda: {("llm_cache", "hits"): 3, ("llm_cache", "hit_rate"): 0.5, ("memory_writer", "pending"): 2,
+                     ("router", "completion_latency_p95"): 1.5, ("router", "circuit_opens"): 1}
+
+    assert _cumulative(stats)() == {("llm_cache", "hits"): 3, ("router", "circuit_opens"): 1}
+    assert set(_point_in_time(stats)()) == {("llm_cache", "hit_rate"), ("memory_writer", "pending"),
+                                            ("router", "completion_latency_p95")}
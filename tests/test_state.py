@@ -0,0 +1,70 @@
+from graph.advanced_agent.state import (Plan, get_ready_steps, mark_steps_completed, merge_replan, normalize_plan,
+                                      plan_to_dict)
+
+
+def test_plan_without_depends_on_runs_sequentially():
+    plan = plan_to_dict(Plan.model_validate({"goal": "g", "steps": [{"title": "a"}, {"title": "b"}]}))
+
+    assert "depends_on" not in plan["steps"][0]
+    assert [step["depends_on"] for step in normalize_plan(plan)["steps"]] == [[], ["1"]]
+
+
+def test_plan_with_explicit_empty_depends_on_runs_in_parallel():
+    plan = plan_to_dict(Plan.model_validate(
+        {"steps": [{"id": "1", "depends_on": []}, {"id": "2", "depends_on": []}]}))
+
+    assert [step["depends_on"] for step in normalize_plan(plan)["steps"]] == [[], []]
+
+
+def test_normalize_plan_remaps_duplicate_ids():
+    plan = normalize_plan({"steps": [{"id": "2", "title": "a"}, {"title": "b"}, {"id": "2", "title": "c"},
+                                     {"id": "4", "title": "d", "depends_on": ["2"]}]})
+    ids = [step["id"] for step in plan["steps"]]
+
+    assert len(set(ids)) == 4
+    assert ids[0] == "2" and ids[3] == "4"
+    # 依赖重复的 id 时依赖第一个STEP
+    assert plan["steps"][3]["depends_on"] == ["2"]
+    assert plan["steps"][2]["depends_on"] == [ids[1]]
+
+
+def test_get_ready_steps_follows_dependencies():
+    plan = normalize_plan({"steps": [{"id": "1", "depends_on": []}, {"id": "2", "depends_on": []},
+                                     {"id": "3", "depends_on": ["1", "2"]}, {"id": "4", "depends_on": ["missing"]}]})
+
+    assert [step["id"] for step in get_ready_steps(plan)] == ["1", "2", "4"]
+    mark_steps_completed(plan, {"1": "done", "2": "done", "4": "done"})
+    assert [step["id"] for step in get_ready_steps(plan)] == ["3"]
+    mark_steps_completed(plan, {"3": "done"})
+    assert get_ready_steps(plan) == []
+
+
+def test_get_ready_steps_breaks_cycles():
+    plan = normalize_plan({"steps": [{"id": "1", "depends_on": ["2"]}, {"id": "2", "depends_on": ["1"]}]})
+
+    assert [step["id"] for step in get_ready_steps(plan)] == ["1"]
+
+
+def test_merge_replan_keeps_completed_steps_when_renumbered():
+    plan = normalize_plan({"goal": "g", "steps": [{"id": "1", "title": "search", "depends_on": []},
+                                                  {"id": "2", "title": "write", "depends_on": ["1"]}]})
+    updated = {"goal": "g", "steps": [{"id": "a", "title": "Search", "status": "pending", "depends_on": []},
+                                      {"id": "1", "title": "verify", "depends_on": ["a"]},
+                                      {"id": "b", "title": "write", "depends_on": ["1"]}]}
+    merged = merge_replan(plan, updated, {"1": "search results"})
+    steps = {step["title"]: step for step in merged["steps"]}
+
+    assert steps["search"] == dict(plan["steps"][0], status="completed")
+    assert steps["verify"]["id"] not in ("1", "a")
+    assert steps["verify"]["depends_on"] == ["1"]
+    assert steps["write"]["depends_on"] == [steps["verify"]["id"]]
+    assert [step["title"] for step in get_ready_steps(merged)] == ["verify"]
+
+
+def test_merge_replan_does_not_trust_status_from_llm():
+    plan = normalize_plan({"steps": [{"id": "1", "title": "a", "depends_on": []}]})
+    updated = {"steps": [{"id": "1", "title": "a", "status": "completed"},
+                         {"id": "2", "title": "b", "status": "completed"}]}
+    merged = merge_replan(plan, updated, {"1": "done"})
+
+    assert [(step["id"], step["status"]) for step in merged["steps"]] == [("1", "completed"), ("2", "pending")]
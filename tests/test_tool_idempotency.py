@@ -0,0 +1,46 @@
+import asyncio
+
+from utils.tool_idempotency import IdempotencyScope, MemoryToolResultStore
+
+CALLS = [{"name": "read_file", "args": {"path": "a.txt"}},
+         {"name": "write_file", "args": {"path": "a.txt", "content": "x"}},
+         {"name": "read_file", "args": {"path": "a.txt"}}]
+
+
+def keys(scope, calls):
+    return [scope.key_for(call) for call in calls]
+
+
+def test_replayed_step_produces_the_same_keys():
+    assert keys(IdempotencyScope("t", "r", "1"), CALLS) == keys(IdempotencyScope("t", "r", "1"), CALLS)
+
+
+def test_repeated_calls_are_distinguished_by_occurrence():
+    first_read, _, second_read = keys(IdempotencyScope("t", "r", "1"), CALLS)
+    assert first_read != second_read
+
+
+def test_argument_order_does_not_change_the_key():
+    reordered = {"name": "write_file", "args": {"content": "x", "path": "a.txt"}}
+    assert IdempotencyScope("t", "r", "1").key_for(CALLS[1]) == IdempotencyScope("t", "r", "1").key_for(reordered)
+    # 没有参数和空参数视为相同的调用
+    assert IdempotencyScope("t", "r", "1").key_for({"name": "now"}) == \
+        IdempotencyScope("t", "r", "1").key_for({"name": "now", "args": None})
+
+
+def test_keys_are_scoped_to_thread_run_and_step():
+    key = IdempotencyScope("t", "r", "1").key_for(CALLS[0])
+    for scope in (IdempotencyScope("t2", "r", "1"), IdempotencyScope("t", "r2", "1"), IdempotencyScope("t", "r", "2")):
+        assert scope.key_for(CALLS[0]) != key
+
+
+def test_memory_store_evicts_least_recently_used():
+    async def run():
+        store = MemoryToolResultStore(max_entries=2)
+        await store.aput("a", "t", "tool", 1)
+        await store.aput("b", "t", "tool", 2)
+        assert await store.aget("a") == (True, 1)
+        await store.aput("c", "t", "tool", 3)
+        return [await store.aget(key) for key in "abc"]
+
+    assert asyncio.run(run()) == [(True, 1), (False, None), (True, 3)]
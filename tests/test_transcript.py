@@ -0,0 +1,76 @@
+import asyncio
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from graph.advanced_agent.state import merge_message_ids
+from utils.llm import _collect_new_messages
+from utils.transcript import FileTranscriptStore, TranscriptStore, record_message_refs
+
+
+class FlakyTranscriptStore(TranscriptStore):
+    """前 failures 次写入失败的对话记录存储"""
+
+    def __init__(self, failures: int):
+        super().__init__()
+        self.failures = failures
+        self.written = []
+
+    def _write(self, thread_id, messages):
+        if self.failures > 0:
+            self.failures -= 1
+            raise OSError("disk full")
+        self.written += [message.id for message in messages]
+
+
+def test_failed_write_is_not_marked_seen():
+    store = FlakyTranscriptStore(failures=1)
+    messages = [HumanMessage(content="q", id="m1"), AIMessage(content="a", id="m2")]
+
+    # 写入失败不抛出异常
+    store.append("t", messages)
+    assert store.written == []
+    store.append("t", messages)
+    assert store.written == ["m1", "m2"]
+    store.append("t", messages)
+    assert store.written == ["m1", "m2"]
+
+
+def test_failed_async_write_is_retried():
+    store = FlakyTranscriptStore(failures=1)
+    messages = [HumanMessage(content="q", id="m1")]
+
+    async def run():
+        await store.aappend("t", messages)
+        await store.aappend("t", messages + [AIMessage(content="a", id="m2")])
+
+    asyncio.run(run())
+    assert store.written == ["m1", "m2"]
+
+
+def test_file_transcript_round_trip(tmp_path):
+    store = FileTranscriptStore(str(tmp_path), max_files=0, max_file_bytes=0)
+    store.append("t", [HumanMessage(content="q", id="m1"), AIMessage(content="a", id="m2")])
+    store.append("t", [HumanMessage(content="q", id="m1")])
+
+    loaded = asyncio.run(store.aload("t", ["m2", "m1", "missing"]))
+    assert [(type(m), m.content) for m in loaded] == [(AIMessage, "a"), (HumanMessage, "q")]
+
+
+def test_message_refs_are_returned_as_state_update():
+    state = {"all_messages": ["m1"]}
+
+    @record_message_refs
+    async def node(state):
+        first = _collect_new_messages(state, [HumanMessage(content="q", id="m1")], AIMessage(content="a", id="m2"))
+        second = _collect_new_messages(state, [HumanMessage(content="q", id="m1")], AIMessage(content="a", id="m2"))
+        return {"collected": [[m.id for m in first], [m.id for m in second]]}
+
+    update = asyncio.run(node(state))
+    assert update == {"collected": [["m2"], []], "all_messages": ["m2"]}
+    # 不修改并行STEP共享的状态列表
+    assert state == {"all_messages": ["m1"]}
+
+
+def test_merge_message_ids():
+    assert merge_message_ids(["a", "b"], ["b", "c", "c"]) == ["a", "b", "c"]
+    assert merge_message_ids(["a"], None) == []
@@ -1,10 +1,13 @@
 import asyncio
 import json
 import logging
+import time
 from os import path
 
 from langchain_mcp_adapters.client import MultiServerMCPClient
+from langchain_mcp_adapters.tools import load_mcp_tools
 
+from utils.config_utils import Config
 from utils.exceptions import McpConnectError
 from utils.tools import tools_list_to_dict
 
@@ -170,6 +173,220 @@ async def get_all_tools_dict():
     tools_dict = tools_list_to_dict(tools)
     return tools_dict
 
+
+class McpSessionManager:
+    """
+    为每个MCP Server维持一个常驻的客户端会话。
+
+    client.get_tools() 返回的工具在每次调用时都会重新建立连接（SSE需要重新握手），
+    通过该管理器加载的工具绑定在常驻会话上，工具调用的耗时只剩工具本身的执行时间。
+    会话必须在同一个事件循环中创建和使用，因此每个事件循环对应一个管理器实例。
+    """
+
+    def __init__(self, client: MultiServerMCPClient):
+        self.client = client
+        self.loop = asyncio.get_running_loop()
+        # server_name -> ClientSession
+        self._sessions = {}
+        # server_name -> (持有会话的后台任务, 关闭事件)
+        self._holders = {}
+        # server_name -> 绑定在会话上的工具列表
+        self._tools = {}
+        self._locks = {}
+        # 会话断开时的回调，参数为 server_name
+        self._close_listeners = []
+
+    def add_close_listener(self, listener) -> None:
+        """注册会话断开时的回调，缓存了该会话工具的组件据此失效"""
+        if listener not in self._close_listeners:
+            self._close_listeners.append(listener)
+
+    async def _hold_session(self, server_name, ready: asyncio.Future, close_event: asyncio.Event):
+        """
+        在独立的后台任务中持有会话上下文，保证会话的进入和退出发生在同一个任务内。
+        """
+        try:
+            async with self.client.session(server_name) as session:
+                # 等待方已取消（例如发现超时）时直接关闭会话
+                if ready.done():
+                    return
+                ready.set_result(session)
+                await close_event.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                logger.error(f"MCP session '{server_name}' closed unexpectedly: {e}")
+        finally:
+            # 会话断开后清理缓存，下次使用时重新连接
+            holder = self._holders.get(server_name)
+            if holder is not None and holder[0] is asyncio.current_task():
+                self._sessions.pop(server_name, None)
+                self._holders.pop(server_name, None)
+                self._tools.pop(server_name, None)
+                for listener in self._close_listeners:
+                    listener(server_name)
+
+    async def get_session(self, server_name):
+        lock = self._locks.setdefault(server_name, asyncio.Lock())
+        async with lock:
+            if server_name not in self._sessions:
+                ready = self.loop.create_future()
+                close_event = asyncio.Event()
+                task = self.loop.create_task(self._hold_session(server_name, ready, close_event))
+                try:
+                    session = await ready
+                except Exception as e:
+                    logger.error(f"Failed to establish connection to mcp server '{server_name}': {e}")
+                    raise McpConnectError(f"Failed to establish connection to mcp server '{server_name}'")
+                self._sessions[server_name] = session
+                self._holders[server_name] = (task, close_event)
+                logger.info(f"MCP session '{server_name}' established")
+            return self._sessions[server_name]
+
+    async def get_tools(self, server_name, reload: bool = False):
+        """获取绑定在常驻会话上的工具，同一会话内只加载一次，reload为True时重新拉取工具列表"""
+        if reload or server_name not in self._tools:
+            session = await self.get_session(server_name)
+            self._tools[server_name] = await load_mcp_tools(session)
+        return self._tools[server_name]
+
+    async def get_all_tools(self):
+        tools = []
+        for server_name in self.client.connections:
+            tools.extend(await self.get_tools(server_name))
+        return tools
+
+    async def get_all_tools_dict(self):
+        return tools_list_to_dict(await self.get_all_tools())
+
+    async def aclose(self):
+        holders = list(self._holders.values())
+        for _, close_event in holders:
+            close_event.set()
+        if holders:
+            await asyncio.gather(*(task for task, _ in holders), return_exceptions=True)
+
+
+_session_manager = None
+
+
+def get_session_manager() -> McpSessionManager:
+    """
+    获取当前事件循环对应的会话管理器，事件循环变化时（例如多次调用asyncio.run）重新创建。
+    """
+    global _session_manager
+    if _session_manager is None or _session_manager.loop is not asyncio.get_running_loop():
+        _session_manager = McpSessionManager(get_all_mcp())
+    return _session_manager
+
+
+async def close_session_manager():
+    global _session_manager, _tool_registry
+    if _session_manager is not None:
+        await _session_manager.aclose()
+        _session_manager = None
+    _tool_registry = None
+
+
+class McpToolRegistry:
+    """
+    MCP工具注册表：首次使用时才发现工具，并按TTL缓存。
+
+    - 各个MCP Server并发发现，单个Server超时或不可用只会被跳过，不影响其他Server
+    - 缓存过期后在后台刷新，刷新期间继续返回旧的工具列表
+    - 发现失败的Server在 retry 秒后于后台重试，不等待整个TTL
+    - 会话断开时丢弃绑定在旧会话上的工具，下次使用时重新发现
+    - 并发的首次访问共享同一次发现过程
+    """
+
+    def __init__(self, manager: McpSessionManager, ttl: float = Config.MCP_TOOLS_CACHE_TTL,
+                 discovery_timeout: float = Config.MCP_DISCOVERY_TIMEOUT, retry: float = Config.MCP_DISCOVERY_RETRY):
+        self.manager = manager
+        self.ttl = ttl
+        self.discovery_timeout = discovery_timeout
+        self.retry = retry
+        # server_name -> 工具列表
+        self._tools = {}
+        # server_name -> 最近一次发现成功 / 失败的时间
+        self._fetched_at = {}
+        self._failed_at = {}
+        self._refresh_task = None
+        manager.add_close_listener(self.invalidate)
+
+    def invalidate(self, server_name) -> None:
+        """丢弃该Server的工具，下次 get_tools 时重新连接并发现"""
+        self._tools.pop(server_name, None)
+        self._fetched_at.pop(server_name, None)
+        self._failed_at.pop(server_name, None)
+
+    async def _discover(self, server_name):
+        start = time.perf_counter()
+        tools = await asyncio.wait_for(self.manager.get_tools(server_name, reload=True), self.discovery_timeout)
+        logger.info(f"Discovered {len(tools)} tools from '{server_name}' in {time.perf_counter() - start:.3f}s")
+        return tools
+
+    async def _refresh(self, server_names):
+        results = await asyncio.gather(*(self._discover(name) for name in server_names), return_exceptions=True)
+        now = time.monotonic()
+        for server_name, result in zip(server_names, results):
+            if isinstance(result, BaseException):
+                # 发现失败时保留该Server上一次的工具列表（如果有），retry 秒后重试
+                logger.error(f"Failed to discover tools from mcp server '{server_name}': {result!r}")
+                self._failed_at[server_name] = now
+            else:
+                self._tools[server_name] = result
+                self._fetched_at[server_name] = now
+                self._failed_at.pop(server_name, None)
+
+    def _schedule_refresh(self, server_names) -> asyncio.Task:
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.get_running_loop().create_task(self._refresh(server_names))
+        return self._refresh_task
+
+    async def refresh(self):
+        """立即刷新全部Server的工具列表并等待完成"""
+        await self._schedule_refresh(list(self.manager.client.connections))
+
+    def _unknown(self):
+        """尚未发现过（首次使用或会话断开后）的Server"""
+        return [name for name in self.manager.client.connections
+                if name not in self._fetched_at and name not in self._failed_at]
+
+    def _stale(self):
+        """缓存过期或发现失败后等待重试时间已到的Server"""
+        now = time.monotonic()
+        return [name for name in self.manager.client.connections
+                if (name in self._failed_at and now - self._failed_at[name] > self.retry)
+                or (name not in self._failed_at and name in self._fetched_at
+                    and now - self._fetched_at[name] > self.ttl)]
+
+    async def get_tools(self):
+        unknown = self._unknown()
+        while unknown:
+            # 等待发现完成；正在进行的刷新可能不包含这些Server，完成后再检查一次
+            await self._schedule_refresh(unknown)
+            unknown = self._unknown()
+        stale = self._stale()
+        if stale:
+            self._schedule_refresh(stale)
+        return [tool for tools in self._tools.values() for tool in tools]
+
+    async def get_tools_dict(self):
+        return tools_list_to_dict(await self.get_tools())
+
+
+_tool_registry = None
+
+
+def get_tool_registry() -> McpToolRegistry:
+    """获取当前事件循环对应的工具注册表，与会话管理器一一对应"""
+    global _tool_registry
+    manager = get_session_manager()
+    if _tool_registry is None or _tool_registry.manager is not manager:
+        _tool_registry = McpToolRegistry(manager)
+    return _tool_registry
+
 async def main():
     tools = await get_all_tools_dict()
     result = await tools["send_message"].ainvoke({"message":"hello"})
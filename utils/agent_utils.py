@@ -1,3 +1,5 @@
+# 导入异步IO模块，用于运行异步状态图
+import asyncio
 # 导入日志模块，用于记录程序运行时的信息
 import logging
 # 导入操作系统接口模块，用于处理文件路径和环境变量
@@ -13,7 +15,6 @@ from html import escape
 # 从typing模块导入类型提示工具
 from typing import Literal, Annotated, Sequence, Optional
 
-from concurrent_log_handler import ConcurrentRotatingFileHandler
 # 导入LangChain的消息基类
 from langchain_core.messages import BaseMessage
 from langchain_core.messages import ToolMessage
@@ -33,10 +34,12 @@ from langgraph.prebuilt import ToolNode
 from langgraph.store.base import BaseStore
 # 导入Postgres存储类
 from langgraph.store.postgres import PostgresStore
+# 导入异步Postgres存储类
+from langgraph.store.postgres.aio import AsyncPostgresStore
 # 导入 psycopg2 的操作异常类，用于捕获数据库连接错误
 from psycopg2 import OperationalError
 # 导入PostgreSQL连接池类
-from psycopg_pool import ConnectionPool
+from psycopg_pool import ConnectionPool, AsyncConnectionPool
 # 导入Pydantic的基类和字段定义工具
 from pydantic import BaseModel, Field
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
@@ -44,34 +47,28 @@ from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_excep
 from typing_extensions import TypedDict
 
 from graph.advanced_agent.graph import get_graph_builder
+from graph.advanced_agent.state import graph_input_formpt
 # 导入工具配置模块
 from tools.tools.tools_config import get_tools
 # 导入统一的 Config 类
 from utils.config_utils import Config
+# 压缩写入量的检查点保存类
+from utils.checkpointer import CompactingAsyncPostgresSaver
+# 带指标统计的异步连接池
+from utils.db_pool import InstrumentedAsyncPostgresSaver, connections_in_use, create_async_connection_pool
+# 合并并发Embedding请求的包装器
+from utils.embedding_batcher import BatchedEmbeddings
+# 共享的日志处理器
+from utils.log_utils import configure_logger
+# 记忆的后台批量写入队列
+from utils.memory_writer import get_memory_writer
 # 导入自定义的get_llm函数，用于获取LLM模型
 from utils.llm import get_llm
 
 # # 设置日志基本配置，级别为DEBUG或INFO
-logger = logging.getLogger(__name__)
-# 设置日志器级别为DEBUG
-logger.setLevel(logging.DEBUG)
+# 日志经共享的处理器写入 Config.LOG_FILE，默认由后台线程写出，不阻塞请求
+logger = configure_logger(logging.getLogger(__name__), logging.DEBUG)
 # logger.setLevel(logging.INFO)
-logger.handlers = []  # 清空默认处理器
-# 使用ConcurrentRotatingFileHandler
-handler = ConcurrentRotatingFileHandler(
-    # 日志文件
-    Config.LOG_FILE,
-    # 日志文件最大允许大小为5MB，达到上限后触发轮转
-    maxBytes=Config.MAX_BYTES,
-    # 在轮转时，最多保留3个历史日志文件
-    backupCount=Config.BACKUP_COUNT
-)
-# 设置处理器级别为DEBUG
-handler.setLevel(logging.DEBUG)
-handler.setFormatter(logging.Formatter(
-    "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-))
-logger.addHandler(handler)
 
 
 # 定义消息状态类，使用TypedDict进行类型注解
@@ -283,6 +280,14 @@ def filter_messages(messages: list) -> list:
     return filtered[-5:] if len(filtered) > 5 else filtered
 
 
+# 定义跨线程存储使用的Embedding模型
+def get_store_embeddings(llm_embedding):
+    """返回跨线程存储使用的Embedding模型，启用批处理时合并并发的Embedding请求并缓存结果"""
+    if Config.EMBEDDING_BATCH_ENABLED:
+        return BatchedEmbeddings(llm_embedding)
+    return llm_embedding
+
+
 # 定义跨线程的持久化存储的存储和过滤函数
 def store_memory(question: BaseMessage, config: RunnableConfig, store: BaseStore) -> str:
     """存储用户输入中的记忆信息。
@@ -299,15 +304,23 @@ def store_memory(question: BaseMessage, config: RunnableConfig, store: BaseStore
     try:
         # 在跨线程存储数据库中搜索相关记忆
         memories = store.search(namespace, query=str(question.content))
-        user_info = "\n".join([d.value["data"] for d in memories])
+        memory_data = [d.value["data"] for d in memories]
 
         # 如果包含“记住”，存储新记忆
         if "记住" in question.content.lower():
             memory = escape(question.content)
-            store.put(namespace, str(uuid.uuid4()), {"data": memory})
-            logger.info(f"Stored memory: {memory}")
+            if Config.MEMORY_WRITE_BEHIND:
+                # 交给后台队列批量写入，不阻塞当前请求
+                get_memory_writer().submit(store, namespace, memory)
+                logger.info(f"Queued memory: {memory}")
+            else:
+                store.put(namespace, str(uuid.uuid4()), {"data": memory})
+                logger.info(f"Stored memory: {memory}")
 
-        return user_info
+        if Config.MEMORY_WRITE_BEHIND:
+            # 加上尚未写入的记忆，保证能读到刚提交的记忆
+            memory_data += [m for m in get_memory_writer().pending(store, namespace) if m not in memory_data]
+        return "\n".join(memory_data)
     except Exception as e:
         logger.error(f"Error in store_memory: {e}")
         return ""
@@ -374,17 +387,30 @@ def test_connection(db_connection_pool: ConnectionPool) -> bool:
     return True
 
 
+# 异步连接池的数据库重试机制，策略与test_connection一致
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10),
+       retry=retry_if_exception_type(OperationalError))
+async def atest_connection(db_connection_pool: AsyncConnectionPool) -> bool:
+    """测试异步连接池是否可用"""
+    async with db_connection_pool.connection() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute("SELECT 1")
+            result = await cursor.fetchone()
+            if result != (1,):
+                raise ConnectionPoolError("连接池测试查询失败，返回结果异常")
+    return True
+
+
 # 周期性检查连接池状态，记录可用连接数和异常情况，提前预警
 def monitor_connection_pool(db_connection_pool: ConnectionPool, interval: int = 60):
-    """周期性监控连接池状态"""
+    """周期性检查连接池状态，接近上限时告警；详细的使用情况见 /metrics 中的 db_pool_* 指标"""
 
     def _monitor():
         while not db_connection_pool.closed:
             try:
-                stats = db_connection_pool.get_stats()
-                active = stats.get("connections_in_use", 0)
+                active = connections_in_use(db_connection_pool)
                 total = db_connection_pool.max_size
-                logger.info(f"Connection db_connection_pool status: {active}/{total} connections in use")
+                logger.debug(f"Connection db_connection_pool status: {active}/{total} connections in use")
                 if active >= total * 0.8:
                     logger.warning(f"Connection db_connection_pool nearing capacity: {active}/{total}")
             except Exception as e:
@@ -721,7 +747,7 @@ def create_graph(db_connection_pool: ConnectionPool, llm_chat, llm_embedding, to
         raise ConnectionPoolError("数据库连接池未初始化或已关闭")
     try:
         # 获取当前活动连接数和最大连接数
-        active_connections = db_connection_pool.get_stats().get("connections_in_use", 0)
+        active_connections = connections_in_use(db_connection_pool)
         max_connections = db_connection_pool.max_size
         if active_connections >= max_connections:
             logger.error(
@@ -750,7 +776,8 @@ def create_graph(db_connection_pool: ConnectionPool, llm_chat, llm_embedding, to
     # 跨线程持久化存储
     try:
         # 创建Postgres存储实例，指定嵌入维度和函数
-        store = PostgresStore(db_connection_pool, index={"dims": 1536, "embed": llm_embedding})
+        store = PostgresStore(db_connection_pool,
+                              index={"dims": 1536, "embed": get_store_embeddings(llm_embedding)})
         store.setup()
     except Exception as e:
         logger.error(f"Failed to setup PostgresStore: {e}")
@@ -762,6 +789,72 @@ def create_graph(db_connection_pool: ConnectionPool, llm_chat, llm_embedding, to
     return graph_builder.compile(checkpointer=checkpointer, store=store)
 
 
+# 创建并配置异步状态图
+async def create_async_graph(db_connection_pool: AsyncConnectionPool, llm_chat, llm_embedding,
+                             tool_config: ToolConfig) -> StateGraph:
+    """创建并配置异步状态图，检查点和存储均基于异步连接池，供 graph.astream 使用。
+
+    Args:
+        db_connection_pool: 异步数据库连接池。
+        llm_chat: Chat模型。
+        llm_embedding: Embedding模型。
+        tool_config: 工具配置参数。
+
+    Returns:
+        StateGraph: 编译后的状态图。
+
+    Raises:
+        ConnectionPoolError: 如果连接池未正确初始化或状态异常。
+    """
+    # 检查连接池是否为None或未打开
+    if db_connection_pool is None or db_connection_pool.closed:
+        logger.error("Connection db_connection_pool is None or closed")
+        raise ConnectionPoolError("数据库连接池未初始化或已关闭")
+    try:
+        # 获取当前活动连接数和最大连接数
+        active_connections = connections_in_use(db_connection_pool)
+        max_connections = db_connection_pool.max_size
+        if active_connections >= max_connections:
+            logger.error(
+                f"Connection db_connection_pool exhausted: {active_connections}/{max_connections} connections in use")
+            raise ConnectionPoolError("连接池已耗尽，无可用连接")
+        if not await atest_connection(db_connection_pool):
+            raise ConnectionPoolError("连接池测试失败")
+        logger.info("Connection db_connection_pool status: OK, test connection successful")
+    except OperationalError as e:
+        logger.error(f"Database operational error during connection test: {e}")
+        raise ConnectionPoolError(f"连接池测试失败，可能已关闭或超时: {str(e)}")
+    except Exception as e:
+        logger.error(f"Failed to verify connection db_connection_pool status: {e}")
+        raise ConnectionPoolError(f"无法验证连接池状态: {str(e)}")
+
+    # 线程内持久化存储
+    try:
+        # 创建异步Postgres检查点保存实例，启用压缩时列表通道按内容哈希去重并定期清理旧检查点
+        saver_class = CompactingAsyncPostgresSaver if Config.CHECKPOINT_COMPACTION else InstrumentedAsyncPostgresSaver
+        checkpointer = saver_class(db_connection_pool)
+        # 初始化检查点
+        await checkpointer.setup()
+    except Exception as e:
+        logger.error(f"Failed to setup AsyncPostgresSaver: {e}")
+        raise ConnectionPoolError(f"检查点初始化失败: {str(e)}")
+
+    # 跨线程持久化存储
+    try:
+        # 创建异步Postgres存储实例，指定嵌入维度和函数
+        store = AsyncPostgresStore(db_connection_pool,
+                                   index={"dims": 1536, "embed": get_store_embeddings(llm_embedding)})
+        await store.setup()
+    except Exception as e:
+        logger.error(f"Failed to setup AsyncPostgresStore: {e}")
+        raise ConnectionPoolError(f"存储初始化失败: {str(e)}")
+
+    graph_builder = get_graph_builder()
+
+    # 编译状态图，绑定检查点和存储
+    return graph_builder.compile(checkpointer=checkpointer, store=store)
+
+
 # 定义响应函数
 def graph_response(graph: StateGraph, user_input: str, config: dict, tool_config: ToolConfig = None) -> None:
     """处理用户输入并输出响应，区分工具输出和大模型输出，支持多工具。
@@ -818,9 +911,72 @@ def graph_response(graph: StateGraph, user_input: str, config: dict, tool_config
         print("Assistant: 处理响应时发生未知错误")
 
 
+# 定义异步响应函数
+async def agraph_response(graph: StateGraph, user_input: dict, config: dict, tool_config: ToolConfig = None) -> None:
+    """异步处理用户输入并输出响应，基于 graph.astream，区分工具输出和大模型输出。
+
+    Args:
+        graph: 状态图实例。
+        user_input: 由 graph_input_formpt 构造的图输入状态。
+        config: 运行时配置。
+    """
+    try:
+        # 启动状态图流处理用户输入
+        events = graph.astream(user_input, config, durability=Config.CHECKPOINT_DURABILITY)
+        # 遍历事件流
+        async for event in events:
+            # 遍历事件中的值
+            for value in event.values():
+                if value is None or "messages" not in value or not isinstance(value["messages"], list) \
+                        or not value["messages"]:
+                    logger.warning("No valid messages in response")
+                    continue
+                # 获取最后一条消息
+                last_message = value["messages"][-1]
+
+                # 检查消息是否包含工具调用
+                if hasattr(last_message, "tool_calls") and last_message.tool_calls:
+                    # 遍历工具调用
+                    for tool_call in last_message.tool_calls:
+                        # 检查工具调用是否为字典且包含名称
+                        if isinstance(tool_call, dict) and "name" in tool_call:
+                            # 记录工具调用日志
+                            logger.info(f"Calling tool: {tool_call['name']}")
+                    # 跳过本次循环
+                    continue
+
+                # 检查消息是否有内容
+                if hasattr(last_message, "content"):
+                    content = last_message.content
+
+                    # 情况1：工具输出（动态检查工具名称）
+                    if hasattr(last_message, "name"):
+                        tool_name = last_message.name
+                        print(f"Tool Output [{tool_name}]: {content}")
+                    # 情况2：大模型输出（非工具消息）
+                    else:
+                        print(f"Assistant: {content}")
+                else:
+                    # 如果消息没有内容，可能是中间状态
+                    logger.info("Message has no content, skipping")
+                    print("Assistant: 未获取到相关回复")
+    except ValueError as ve:
+        logger.error(f"Value error in response processing: {ve}")
+        print("Assistant: 处理响应时发生值错误")
+    except Exception as e:
+        logger.error(f"Error processing response: {e}")
+        print("Assistant: 处理响应时发生未知错误")
+
+
 # 定义主函数
 def main():
     """主函数，初始化并运行聊天机器人。"""
+    asyncio.run(amain())
+
+
+# 定义异步主函数
+async def amain():
+    """异步主函数，基于异步连接池和 graph.astream 运行聊天机器人。"""
     # 初始化连接池为None
     db_connection_pool = None
     try:
@@ -833,15 +989,12 @@ def main():
         # 创建 ToolConfig 实例
         tool_config = ToolConfig(tools)
 
-        # 定义数据库连接参数，自动提交且无预准备阈值，5秒超时
-        connection_kwargs = {"autocommit": True, "prepare_threshold": 0, "connect_timeout": 5}
-        # 创建数据库连接池，最大连接数20,最小保持2个活跃连接,从池中获取连接的最大等待时间10秒
-        db_connection_pool = ConnectionPool(conninfo=Config.DB_URI, max_size=20, min_size=2, kwargs=connection_kwargs,
-                                            timeout=10)
+        # 按 Config 创建异步数据库连接池，连接池大小和超时时间见 config.yaml 的 database 配置
+        db_connection_pool = create_async_connection_pool()
 
         # 打开连接池
         try:
-            db_connection_pool.open()
+            await db_connection_pool.open()
             logger.info("Database connection pool initialized")
             logger.debug("Database connection pool initialized")
         except Exception as e:
@@ -853,7 +1006,7 @@ def main():
 
         # 创建状态图
         try:
-            graph = create_graph(db_connection_pool, llm_chat, llm_embedding, tool_config)
+            graph = await create_async_graph(db_connection_pool, llm_chat, llm_embedding, tool_config)
         except ConnectionPoolError as e:
             logger.error(f"Graph creation failed: {e}")
             print(f"错误: {e}")
@@ -879,7 +1032,7 @@ def main():
                 print("请输入聊天内容！")
                 continue
             # 处理用户输入并选择是否流式输出响应
-            graph_response(graph, user_input, config, tool_config)
+            await agraph_response(graph, graph_input_formpt(user_input), config, tool_config)
 
     except ConnectionPoolError as e:
         # 捕获连接池相关的异常
@@ -902,7 +1055,7 @@ def main():
     finally:
         # 清理资源
         if db_connection_pool and not db_connection_pool.closed:
-            db_connection_pool.close()
+            await db_connection_pool.close()
             logger.info("Database connection pool closed")
 
 
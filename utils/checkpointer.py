@@ -0,0 +1,338 @@
+import asyncio
+import contextlib
+import hashlib
+import importlib.metadata
+import logging
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from langgraph.checkpoint.base import get_serializable_checkpoint_metadata
+from langgraph.checkpoint.postgres import _ainternal
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from langgraph.checkpoint.serde.types import _DeltaSnapshot
+from psycopg.rows import tuple_row
+from psycopg.types.json import Jsonb
+from psycopg_pool import AsyncConnectionPool
+
+from utils.config_utils import Config
+from utils.db_pool import InstrumentedAsyncPostgresSaver
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# 本模块覆盖了 AsyncPostgresSaver 的内部方法，只支持验证过的 langgraph-checkpoint-postgres 版本范围 [最低, 最高)
+SUPPORTED_SAVER_VERSIONS = ((3, 1), (3, 2))
+_SAVER_INTERNALS = ("_load_checkpoint_tuple", "_load_blobs", "_cursor", "UPSERT_CHECKPOINT_BLOBS_SQL",
+                    "UPSERT_CHECKPOINTS_SQL")
+
+
+def _check_saver_version() -> None:
+    """导入时检查 langgraph-checkpoint-postgres 的版本和依赖的内部接口，不兼容时直接失败，而不是运行时读写出错"""
+    version = importlib.metadata.version("langgraph-checkpoint-postgres")
+    major_minor = tuple(int(part) for part in version.split(".")[:2])
+    low, high = SUPPORTED_SAVER_VERSIONS
+    missing = [name for name in _SAVER_INTERNALS if not hasattr(AsyncPostgresSaver, name)]
+    if not low <= major_minor < high or missing or not hasattr(_ainternal, "get_connection"):
+        raise ImportError(f"utils.checkpointer requires langgraph-checkpoint-postgres>={'.'.join(map(str, low))},"
+                          f"<{'.'.join(map(str, high))}, found {version}"
+                          + (f" (missing {', '.join(missing)})" if missing else ""))
+
+
+_check_saver_version()
+
+# checkpoint_blobs 中列表通道的存储类型：blob 为各元素内容哈希（每个 DIGEST_SIZE 字节）的拼接
+HASHLIST_TYPE = "hashlist"
+DIGEST_SIZE = 16
+
+checkpoint_bytes = registry.counter(
+    "checkpoint_bytes_written", "Checkpoint bytes sent to Postgres by table", ("table",))
+checkpoint_pruned = registry.counter(
+    "checkpoint_rows_pruned", "Checkpoint rows deleted by the retention policy", ("table",))
+
+CREATE_CONTENT_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS checkpoint_content (
+        thread_id TEXT NOT NULL,
+        hash BYTEA NOT NULL,
+        type TEXT NOT NULL,
+        blob BYTEA,
+        PRIMARY KEY (thread_id, hash)
+    )"""
+
+INSERT_CONTENT_SQL = """
+    INSERT INTO checkpoint_content (thread_id, hash, type, blob) VALUES (%s, %s, %s, %s)
+    ON CONFLICT (thread_id, hash) DO NOTHING"""
+
+SELECT_CONTENT_SQL = "SELECT hash, type, blob FROM checkpoint_content WHERE thread_id = %s AND hash = ANY(%s)"
+
+# 每个 checkpoint_ns 保留最新的 keep_last 个检查点，删除更早的检查点及其待写入数据
+PRUNE_SQL = ("""
+    WITH doomed AS (
+        SELECT checkpoint_ns, checkpoint_id FROM (
+            SELECT checkpoint_ns, checkpoint_id,
+                   row_number() OVER (PARTITION BY checkpoint_ns ORDER BY checkpoint_id DESC) AS rn
+            FROM checkpoints WHERE thread_id = %(thread_id)s) ranked
+        WHERE rn > %(keep_last)s)
+    DELETE FROM checkpoint_writes w USING doomed d
+    WHERE w.thread_id = %(thread_id)s AND w.checkpoint_ns = d.checkpoint_ns AND w.checkpoint_id = d.checkpoint_id""",
+             """
+    WITH doomed AS (
+        SELECT checkpoint_ns, checkpoint_id FROM (
+            SELECT checkpoint_ns, checkpoint_id,
+                   row_number() OVER (PARTITION BY checkpoint_ns ORDER BY checkpoint_id DESC) AS rn
+            FROM checkpoints WHERE thread_id = %(thread_id)s) ranked
+        WHERE rn > %(keep_last)s)
+    DELETE FROM checkpoints c USING doomed d
+    WHERE c.thread_id = %(thread_id)s AND c.checkpoint_ns = d.checkpoint_ns AND c.checkpoint_id = d.checkpoint_id""",
+             # 删除剩余检查点都不再引用的通道版本
+             """
+    DELETE FROM checkpoint_blobs b
+    WHERE b.thread_id = %(thread_id)s AND NOT EXISTS (
+        SELECT 1 FROM checkpoints c, jsonb_each_text(c.checkpoint -> 'channel_versions') v
+        WHERE c.thread_id = b.thread_id AND c.checkpoint_ns = b.checkpoint_ns
+          AND v.key = b.channel AND v.value = b.version)""",
+             # 删除剩余通道版本都不再引用的内容
+             """
+    DELETE FROM checkpoint_content x
+    WHERE x.thread_id = %(thread_id)s AND NOT EXISTS (
+        SELECT 1 FROM checkpoint_blobs b, generate_series(0, length(b.blob) / %(digest_size)s - 1) AS i
+        WHERE b.thread_id = x.thread_id AND b.type = %(hashlist_type)s
+          AND substring(b.blob FROM i * %(digest_size)s + 1 FOR %(digest_size)s) = x.hash)""")
+PRUNE_TABLES = ("checkpoint_writes", "checkpoints", "checkpoint_blobs", "checkpoint_content")
+
+
+def content_hash(type_: str, blob: Optional[bytes]) -> bytes:
+    return hashlib.blake2b(type_.encode() + b"\0" + (blob or b""), digest_size=DIGEST_SIZE).digest()
+
+
+def split_digests(blob: bytes) -> List[bytes]:
+    return [blob[i:i + DIGEST_SIZE] for i in range(0, len(blob), DIGEST_SIZE)]
+
+
+def dump_compacted(serde, thread_id: str, checkpoint_ns: str, values: Dict[str, Any], versions: Dict[str, Any],
+                   known: Set[bytes]) -> Tuple[List[tuple], List[tuple]]:
+    """
+    序列化本次有新版本的通道。非空的业务列表通道（messages、observations 等）逐个元素序列化，
+    通道版本只保存元素哈希列表，本线程尚未写入过的元素内容写入 checkpoint_content；其余通道与 AsyncPostgresSaver 一致。
+
+    Returns:
+        (checkpoint_blobs 的行, checkpoint_content 的行)
+    """
+    blob_rows = []
+    content_rows = []
+    added = set()
+    for channel, version in versions.items():
+        if channel not in values:
+            blob_rows.append((thread_id, checkpoint_ns, channel, str(version), "empty", None))
+            continue
+        value = values[channel]
+        # LangGraph 内部通道（如 __pregel_tasks 中的 Send）每步都不同，去重没有收益，按原方式存储
+        if type(value) is not list or not value or channel.startswith("__"):
+            blob_rows.append((thread_id, checkpoint_ns, channel, str(version), *serde.dumps_typed(value)))
+            continue
+        digests = []
+        for item in value:
+            type_, blob = serde.dumps_typed(item)
+            digest = content_hash(type_, blob)
+            digests.append(digest)
+            if digest not in known and digest not in added:
+                added.add(digest)
+                content_rows.append((thread_id, digest, type_, blob))
+        blob_rows.append((thread_id, checkpoint_ns, channel, str(version), HASHLIST_TYPE, b"".join(digests)))
+    return blob_rows, content_rows
+
+
+def rows_size(rows: Iterable[tuple]) -> int:
+    return sum(len(value) for row in rows for value in row if isinstance(value, (bytes, str)))
+
+
+class CompactingAsyncPostgresSaver(InstrumentedAsyncPostgresSaver):
+    """
+    压缩检查点写入量的 AsyncPostgresSaver：
+
+      - 列表通道按元素内容哈希去重，每个元素在同一线程中只写入一次，每步只写入新元素和哈希列表；
+      - 每个线程每写入 prune_every 个检查点，在后台按保留策略删除较早的检查点、通道版本和不再引用的内容。
+
+    已知哈希集合按线程缓存：读取检查点时重置为该检查点引用的哈希，写入后加入新哈希，清理后清空，
+    保证跳过写入的内容一定仍在数据库中。同一线程的写入和清理由线程锁串行执行，
+    清理不会删除并发写入依据已知集合跳过的内容。
+    """
+
+    def __init__(self, conn, *args, keep_last: int = Config.CHECKPOINT_KEEP_LAST,
+                 prune_every: int = Config.CHECKPOINT_PRUNE_EVERY, known_threads: int = 1024, **kwargs):
+        super().__init__(conn, *args, **kwargs)
+        self.keep_last = keep_last
+        self.prune_every = prune_every
+        self.known_threads = known_threads
+        # thread_id -> 数据库中已存在的内容哈希
+        self._known: "OrderedDict[str, Set[bytes]]" = OrderedDict()
+        # thread_id -> 上次清理后写入的检查点数
+        self._puts_since_prune: Dict[str, int] = {}
+        self._prune_tasks: Set[asyncio.Task] = set()
+        # thread_id -> 写入与清理互斥的锁，不再使用时自动释放
+        self._thread_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        # 已开始的清理次数，读取检查点期间发生过清理时不重置已知集合
+        self._prunes_started = 0
+
+    async def setup(self) -> None:
+        await super().setup()
+        async with _ainternal.get_connection(self.conn) as conn:
+            await conn.execute(CREATE_CONTENT_TABLE_SQL)
+
+    def _known_for(self, thread_id: str, reset: Optional[Set[bytes]] = None) -> Set[bytes]:
+        """返回线程的已知哈希集合，传入 reset 时替换为该集合"""
+        known = self._known.get(thread_id) if reset is None else reset
+        if known is None:
+            known = set()
+        self._known[thread_id] = known
+        self._known.move_to_end(thread_id)
+        while len(self._known) > self.known_threads:
+            self._known.popitem(last=False)
+        return known
+
+    def _thread_lock(self, thread_id: str) -> asyncio.Lock:
+        lock = self._thread_locks.get(thread_id)
+        if lock is None:
+            lock = self._thread_locks[thread_id] = asyncio.Lock()
+        return lock
+
+    def _load_blobs(self, blob_values) -> Dict[str, Any]:
+        # 哈希列表通道在 _load_checkpoint_tuple 中还原
+        return super()._load_blobs([row for row in blob_values or [] if row[1].decode() != HASHLIST_TYPE])
+
+    async def _fetch_content(self, thread_id: str, digests: Set[bytes]) -> Dict[bytes, Tuple[str, bytes]]:
+        # 外层查询仍持有 self.lock，这里直接从连接池获取连接
+        async with _ainternal.get_connection(self.conn) as conn:
+            async with conn.cursor(row_factory=tuple_row) as cur:
+                await cur.execute(SELECT_CONTENT_SQL, (thread_id, list(digests)))
+                rows = await cur.fetchall()
+        return {bytes(digest): (type_, blob) for digest, type_, blob in rows}
+
+    async def _load_checkpoint_tuple(self, value):
+        hashlists = {channel.decode(): split_digests(bytes(blob)) for channel, type_, blob in value["channel_values"] or []
+                     if type_.decode() == HASHLIST_TYPE}
+        checkpoint_tuple = await super()._load_checkpoint_tuple(value)
+        if not hashlists:
+            return checkpoint_tuple
+        thread_id = value["thread_id"]
+        digests = {digest for channel_digests in hashlists.values() for digest in channel_digests}
+        # 读取期间有清理时，读到的内容可能随后被删除，不能作为已知集合
+        lock = self._thread_locks.get(thread_id)
+        reset_known = (lock is None or not lock.locked(), self._prunes_started)
+        contents = await self._fetch_content(thread_id, digests)
+        missing = digests - contents.keys()
+        if missing:
+            raise RuntimeError(f"Checkpoint {value['checkpoint_id']} of thread {thread_id} references "
+                               f"{len(missing)} missing content blobs")
+        channel_values = checkpoint_tuple.checkpoint["channel_values"]
+        for channel, channel_digests in hashlists.items():
+            channel_values[channel] = [self.serde.loads_typed(contents[digest]) for digest in channel_digests]
+        # 刚读取到的内容一定存在，重置已知集合，避免长期运行的线程集合无限增长
+        if reset_known == (True, self._prunes_started):
+            self._known_for(thread_id, reset=digests)
+        return checkpoint_tuple
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await self._timed("checkpoint", self._aput(config, checkpoint, metadata, new_versions))
+
+    async def _aput(self, config, checkpoint, metadata, new_versions):
+        configurable = config["configurable"].copy()
+        thread_id = configurable.pop("thread_id")
+        checkpoint_ns = configurable.pop("checkpoint_ns")
+        checkpoint_id = configurable.pop("checkpoint_id", None)
+
+        copy = checkpoint.copy()
+        copy["channel_values"] = copy["channel_values"].copy()
+        next_config = {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+        # 基本类型内联在检查点中，其余值写入 checkpoint_blobs，与 AsyncPostgresSaver 一致
+        blob_values = {}
+        for k, v in checkpoint["channel_values"].items():
+            if isinstance(v, _DeltaSnapshot):
+                blob_values[k] = copy["channel_values"].pop(k)
+                copy["channel_values"][k] = True
+            elif v is None or isinstance(v, (str, int, float, bool)):
+                pass
+            else:
+                blob_values[k] = copy["channel_values"].pop(k)
+
+        blob_versions = {k: v for k, v in new_versions.items() if k in blob_values}
+        checkpoint_row = (thread_id, checkpoint_ns, checkpoint["id"], checkpoint_id, Jsonb(copy),
+                          Jsonb(get_serializable_checkpoint_metadata(config, metadata)))
+
+        # 从读取已知集合到事务提交持有线程锁：清理在此期间不能删除被跳过写入的内容
+        async with self._thread_lock(thread_id):
+            known = self._known_for(thread_id)
+            blob_rows, content_rows = await asyncio.to_thread(
+                dump_compacted, self.serde, thread_id, checkpoint_ns, blob_values, blob_versions, set(known))
+            async with self._cursor(pipeline=True) as cur:
+                # 内容和引用它的通道版本在同一事务中提交，清理任务不会看到只有内容没有引用的中间状态
+                async with cur.connection.transaction():
+                    if content_rows:
+                        await cur.executemany(INSERT_CONTENT_SQL, content_rows)
+                    if blob_rows:
+                        await cur.executemany(self.UPSERT_CHECKPOINT_BLOBS_SQL, blob_rows)
+                    await cur.execute(self.UPSERT_CHECKPOINTS_SQL, checkpoint_row)
+            known.update(row[1] for row in content_rows)
+
+        checkpoint_bytes.inc("checkpoint_content", amount=rows_size(content_rows))
+        checkpoint_bytes.inc("checkpoint_blobs", amount=rows_size(blob_rows))
+        self._schedule_prune(thread_id)
+        return next_config
+
+    def _schedule_prune(self, thread_id: str) -> None:
+        if self.keep_last <= 0:
+            return
+        count = self._puts_since_prune.get(thread_id, 0) + 1
+        if count < self.prune_every:
+            self._puts_since_prune[thread_id] = count
+            return
+        self._puts_since_prune.pop(thread_id, None)
+        task = asyncio.create_task(self.aprune(thread_id))
+        self._prune_tasks.add(task)
+        task.add_done_callback(self._prune_tasks.discard)
+
+    async def aprune(self, thread_id: str, keep_last: Optional[int] = None) -> Dict[str, int]:
+        """
+        按保留策略清理一个线程：每个 checkpoint_ns 保留最新的 keep_last 个检查点。
+
+        Returns:
+            各表删除的行数
+        """
+        params = {"thread_id": thread_id, "keep_last": keep_last or self.keep_last,
+                  "digest_size": DIGEST_SIZE, "hashlist_type": HASHLIST_TYPE}
+        deleted = {}
+        # 使用单个连接时与其他检查点操作共用该连接，需要持有 self.lock；使用连接池时只阻塞本线程的写入
+        lock = contextlib.nullcontext() if isinstance(self.conn, AsyncConnectionPool) else self.lock
+        async with self._thread_lock(thread_id):
+            self._prunes_started += 1
+            try:
+                async with lock, _ainternal.get_connection(self.conn) as conn:
+                    async with conn.transaction():
+                        async with conn.cursor() as cur:
+                            for table, sql in zip(PRUNE_TABLES, PRUNE_SQL):
+                                await cur.execute(sql, params)
+                                deleted[table] = cur.rowcount
+            except Exception as e:
+                logger.error(f"Failed to prune checkpoints of thread {thread_id}: {e}")
+                return deleted
+            finally:
+                # 被删除的内容可能仍在已知哈希中，释放线程锁之前清空，下次写入时重新写入
+                self._known.pop(thread_id, None)
+        for table, count in deleted.items():
+            checkpoint_pruned.inc(table, amount=count)
+        logger.debug(f"Pruned checkpoints of thread {thread_id}: {deleted}")
+        return deleted
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        async with self._thread_lock(str(thread_id)):
+            await super().adelete_thread(thread_id)
+            async with _ainternal.get_connection(self.conn) as conn:
+                await conn.execute("DELETE FROM checkpoint_content WHERE thread_id = %s", (str(thread_id),))
+            self._known.pop(str(thread_id), None)
@@ -0,0 +1,209 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, List
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage, HumanMessage, ToolMessage
+
+from utils.config_utils import Config
+from utils.llm import emit_llm_call
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:  # tiktoken 未安装或编码文件无法下载时使用估算
+    _encoding = None
+
+SUMMARY_PROMPT = """
+你负责压缩智能体的历史上下文。请将<previous_summary>与<events>合并为一份简洁的中文摘要，
+保留已完成的操作、关键的工具结果（文件名、数值、结论）以及未解决的问题，不要编造内容。
+摘要不超过{max_tokens}个token，直接输出摘要正文。
+
+<previous_summary>
+{previous_summary}
+</previous_summary>
+
+<events>
+{events}
+</events>
+"""
+
+
+@lru_cache(maxsize=4096)
+def _count_text_tokens(text: str) -> int:
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    # 估算：非ASCII字符（中文等）约1个token，ASCII字符约4个字符1个token
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return non_ascii + (len(text) - non_ascii + 3) // 4
+
+
+def message_text(message: Any) -> str:
+    """提取观察的文本内容，工具调用参数也计入"""
+    if isinstance(message, BaseMessage):
+        text = message.content if isinstance(message.content, str) else json.dumps(message.content,
+                                                                                   ensure_ascii=False)
+        tool_calls = getattr(message, "tool_calls", None)
+        if tool_calls:
+            text += json.dumps(tool_calls, ensure_ascii=False, default=str)
+        return text
+    return str(message)
+
+
+def count_tokens(messages: List[Any]) -> int:
+    # 每条消息额外计入约4个token的角色和格式开销
+    return sum(_count_text_tokens(message_text(m)) + 4 for m in messages)
+
+
+class ContextWindow:
+    """
+    按节点的token预算裁剪 observations。
+
+    最近的观察原样保留，超出预算的较早观察按 strategy 处理：
+    - summarize: 增量摘要，摘要按观察前缀的哈希缓存，后续调用只需摘要新增的部分
+    - evict: 直接丢弃，并用一条提示消息说明省略的数量
+    """
+
+    def __init__(self, budgets: Dict[str, int] = None, strategy: str = Config.CONTEXT_STRATEGY,
+                 summary_ratio: float = 0.25, summary_chunk: int = Config.CONTEXT_SUMMARY_CHUNK,
+                 cache_size: int = 256):
+        self.budgets = budgets if budgets is not None else Config.CONTEXT_TOKEN_BUDGETS
+        self.strategy = strategy
+        # 预算中留给摘要的比例
+        self.summary_ratio = summary_ratio
+        # 摘要边界按该数量对齐，避免每新增一条观察就重新摘要
+        self.summary_chunk = max(1, summary_chunk)
+        self.cache_size = cache_size
+        # 前缀哈希 -> 摘要文本
+        self._summaries = OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _record(self, node: str, **values):
+        with self._lock:
+            metrics = self._metrics.setdefault(node, {
+                "calls": 0, "tokens_sent": 0, "tokens_original": 0, "max_tokens_sent": 0,
+                "summaries_computed": 0, "summary_cache_hits": 0, "evicted": 0})
+            for key, value in values.items():
+                if key == "max_tokens_sent":
+                    metrics[key] = max(metrics[key], value)
+                else:
+                    metrics[key] += value
+
+    def get_metrics(self) -> Dict[str, Dict[str, int]]:
+        """返回各节点的调用次数、发送token总数、压缩前token总数以及摘要缓存命中情况"""
+        with self._lock:
+            return {node: dict(metrics) for node, metrics in self._metrics.items()}
+
+    @staticmethod
+    def _prefix_hashes(observations: List[Any]) -> List[str]:
+        """hashes[i] 为前 i 条观察的滚动哈希"""
+        hashes = [""]
+        for message in observations:
+            hashes.append(hashlib.sha1((hashes[-1] + message_text(message)).encode("utf-8")).hexdigest())
+        return hashes
+
+    def _split_index(self, observations: List[Any], recent_budget: int) -> int:
+        """返回需要压缩的前缀长度k，observations[k:] 在 recent_budget 之内"""
+        total = 0
+        k = len(observations)
+        while k > 0:
+            tokens = count_tokens([observations[k - 1]])
+            if total + tokens > recent_budget:
+                break
+            total += tokens
+            k -= 1
+        if k == 0:
+            return 0
+        k = min(-(-k // self.summary_chunk) * self.summary_chunk, len(observations))
+        # 保留的部分不能以ToolMessage开头，否则与对应的工具调用消息分离
+        while k < len(observations) and isinstance(observations[k], ToolMessage):
+            k += 1
+        return k
+
+    def _cache_get(self, key: str):
+        with self._lock:
+            if key in self._summaries:
+                self._summaries.move_to_end(key)
+                return self._summaries[key]
+        return None
+
+    def _cache_put(self, key: str, summary: str):
+        with self._lock:
+            self._summaries[key] = summary
+            self._summaries.move_to_end(key)
+            while len(self._summaries) > self.cache_size:
+                self._summaries.popitem(last=False)
+
+    async def _summarize(self, node: str, observations: List[Any], k: int, llm: BaseChatModel,
+                         max_tokens: int) -> str:
+        hashes = self._prefix_hashes(observations[:k])
+        summary = self._cache_get(hashes[k])
+        if summary is not None:
+            self._record(node, summary_cache_hits=1)
+            return summary
+        # 找到已缓存的最长前缀，只摘要其后新增的观察
+        start, previous_summary = 0, ""
+        for i in range(k - 1, 0, -1):
+            cached = self._cache_get(hashes[i])
+            if cached is not None:
+                start, previous_summary = i, cached
+                break
+        events = "\n".join(f"[{type(m).__name__}] {message_text(m)}" for m in observations[start:k])
+        t0 = time.perf_counter()
+        try:
+            response = await llm.ainvoke([HumanMessage(content=SUMMARY_PROMPT.format(
+                max_tokens=max_tokens, previous_summary=previous_summary or "无", events=events))])
+        except Exception:
+            emit_llm_call(llm, t0, None, error=True)
+            raise
+        emit_llm_call(llm, t0, response)
+        summary = response.content if isinstance(response.content, str) else str(response.content)
+        self._cache_put(hashes[k], summary)
+        self._record(node, summaries_computed=1)
+        logger.info(f"Summarized observations[{start}:{k}] for {node}")
+        return summary
+
+    async def fit(self, node: str, observations: List[Any], prompt_messages: List[Any],
+                  llm: BaseChatModel) -> List[Any]:
+        """
+        返回裁剪后的 observations 加上节点自身的提示消息，总token数尽量控制在节点预算内。
+
+        Args:
+            node: 节点名称，用于查找预算和记录指标。
+            observations: 完整的观察列表。
+            prompt_messages: 节点本次调用的系统提示和任务提示。
+            llm: 用于生成摘要的模型。
+        """
+        observations = list(observations or [])
+        original = count_tokens(observations) + count_tokens(prompt_messages)
+        budget = self.budgets.get(node)
+        window = observations
+        if budget and original > budget:
+            available = max(budget - count_tokens(prompt_messages), 0)
+            summary_budget = int(available * self.summary_ratio) if self.strategy == "summarize" else 0
+            k = self._split_index(observations, available - summary_budget)
+            if k > 0:
+                if self.strategy == "summarize":
+                    summary = await self._summarize(node, observations, k, llm, summary_budget)
+                    head = [HumanMessage(content=f"以下是较早执行过程的摘要：\n{summary}")]
+                else:
+                    head = [HumanMessage(content=f"（已省略{k}条较早的执行记录）")]
+                    self._record(node, evicted=k)
+                window = head + observations[k:]
+        messages = window + list(prompt_messages)
+        sent = count_tokens(messages)
+        self._record(node, calls=1, tokens_sent=sent, tokens_original=original, max_tokens_sent=sent)
+        logger.debug(f"{node} context tokens: {sent} (original {original}, budget {budget})")
+        return messages
+
+
+context_window = ContextWindow()
@@ -0,0 +1,119 @@
+import time
+from typing import Dict, Tuple
+
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+
+from utils.config_utils import Config
+from utils.hooks import emit
+from utils.metrics import registry
+
+# 连接池使用率的分桶
+SATURATION_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+
+pool_wait_seconds = registry.histogram(
+    "db_pool_wait_seconds", "Time spent waiting to obtain a connection from the pool", ("pool",))
+pool_checkout_seconds = registry.histogram(
+    "db_pool_checkout_seconds", "Time a connection is held between checkout and return", ("pool",))
+pool_saturation = registry.histogram(
+    "db_pool_saturation", "Fraction of max_size in use when a connection is checked out", ("pool",),
+    buckets=SATURATION_BUCKETS)
+pool_timeouts = registry.counter(
+    "db_pool_timeouts", "Checkouts that failed with PoolTimeout", ("pool",))
+
+# 名称 -> 连接池，导出时读取实时状态
+_pools: Dict[str, "InstrumentedAsyncConnectionPool"] = {}
+
+
+def _pool_stats_gauge(key: str):
+    def collect() -> Dict[Tuple[str, ...], float]:
+        return {(name,): pool.get_stats().get(key, 0) for name, pool in _pools.items() if not pool.closed}
+
+    return collect
+
+
+for _key, _doc in (("pool_size", "Connections currently managed by the pool"),
+                   ("pool_available", "Idle connections available in the pool"),
+                   ("requests_waiting", "Clients currently waiting for a connection"),
+                   ("pool_max", "Maximum size of the pool")):
+    registry.gauge(f"db_pool_{_key.removeprefix('pool_')}", _doc, ("pool",), callback=_pool_stats_gauge(_key))
+
+
+def connections_in_use(db_connection_pool) -> int:
+    """返回连接池中正在使用的连接数，get_stats 不直接提供该值"""
+    stats = db_connection_pool.get_stats()
+    return stats.get("pool_size", 0) - stats.get("pool_available", 0)
+
+
+class InstrumentedAsyncConnectionPool(AsyncConnectionPool):
+    """
+    记录连接获取等待时间、连接占用时间和获取连接时使用率的异步连接池，
+    指标通过 utils.metrics.registry 导出。
+    """
+
+    def __init__(self, *args, name: str = "default", **kwargs):
+        self.metrics_name = name
+        self._in_use = 0
+        self._checkout_at: Dict[int, float] = {}
+        super().__init__(*args, **kwargs)
+        _pools[name] = self
+
+    async def getconn(self, timeout: float | None = None):
+        start = time.perf_counter()
+        try:
+            conn = await super().getconn(timeout=timeout)
+        except PoolTimeout:
+            pool_timeouts.inc(self.metrics_name)
+            raise
+        now = time.perf_counter()
+        self._in_use += 1
+        self._checkout_at[id(conn)] = now
+        pool_wait_seconds.observe(now - start, self.metrics_name)
+        pool_saturation.observe(self._in_use / self.max_size, self.metrics_name)
+        return conn
+
+    async def putconn(self, conn) -> None:
+        checkout_at = self._checkout_at.pop(id(conn), None)
+        if checkout_at is not None:
+            self._in_use -= 1
+            pool_checkout_seconds.observe(time.perf_counter() - checkout_at, self.metrics_name)
+        await super().putconn(conn)
+
+
+class InstrumentedAsyncPostgresSaver(AsyncPostgresSaver):
+    """写入检查点时触发 checkpoint_write 事件，用于统计和追踪检查点写入耗时"""
+
+    async def _timed(self, kind: str, coro):
+        start = time.perf_counter()
+        error = False
+        try:
+            return await coro
+        except BaseException:
+            error = True
+            raise
+        finally:
+            emit("checkpoint_write", kind=kind, elapsed=time.perf_counter() - start, error=error)
+
+    async def aput(self, *args, **kwargs):
+        return await self._timed("checkpoint", super().aput(*args, **kwargs))
+
+    async def aput_writes(self, *args, **kwargs):
+        return await self._timed("writes", super().aput_writes(*args, **kwargs))
+
+
+def create_async_connection_pool(name: str = "default") -> InstrumentedAsyncConnectionPool:
+    """
+    按 Config 中的连接池配置创建异步连接池，需要调用方 await pool.open()。
+    检查点、存储、对话记录和响应缓存共享同一个连接池。
+    """
+    # 自动提交、无预准备阈值，连接超时 DB_CONNECT_TIMEOUT 秒
+    connection_kwargs = {"autocommit": True, "prepare_threshold": 0, "connect_timeout": Config.DB_CONNECT_TIMEOUT}
+    return InstrumentedAsyncConnectionPool(
+        conninfo=Config.DB_URI,
+        max_size=Config.DB_POOL_MAX_SIZE,
+        min_size=Config.DB_POOL_MIN_SIZE,
+        kwargs=connection_kwargs,
+        timeout=Config.DB_POOL_TIMEOUT,
+        open=False,
+        name=name,
+    )
@@ -1,3 +1,4 @@
+import asyncio
 import functools
 import logging
 import time
@@ -6,6 +7,8 @@ from typing import Callable
 from langgraph.types import Command
 
 from graph.advanced_agent.state import State
+from utils.hooks import emit
+from utils.usage import current_node
 
 
 def timing_decorator(func: Callable) -> Callable:
@@ -22,6 +25,46 @@ def timing_decorator(func: Callable) -> Callable:
     return wrapper
 
 
+def node_hook(func: Callable) -> Callable:
+    """Decorator to emit node_start/node_end hook events around a graph node and mark it as the current node."""
+    node = func.__name__
+
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            emit("node_start", node=node)
+            token = current_node.set(node)
+            start_time = time.perf_counter()
+            error = False
+            try:
+                return await func(*args, **kwargs)
+            except BaseException:
+                error = True
+                raise
+            finally:
+                current_node.reset(token)
+                emit("node_end", node=node, elapsed=time.perf_counter() - start_time, error=error)
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        emit("node_start", node=node)
+        token = current_node.set(node)
+        start_time = time.perf_counter()
+        error = False
+        try:
+            return func(*args, **kwargs)
+        except BaseException:
+            error = True
+            raise
+        finally:
+            current_node.reset(token)
+            emit("node_end", node=node, elapsed=time.perf_counter() - start_time, error=error)
+
+    return wrapper
+
+
 def log_decorator(func: Callable) -> Callable:
     """Decorator to log function calls."""
 
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from utils.config_utils import Config
+
+logger = logging.getLogger(__name__)
+
+
+class BatchedEmbeddings(Embeddings):
+    """
+    合并并发请求的Embedding包装器。
+
+    同步和异步调用都提交到同一个后台线程，后台线程在 max_wait_ms 毫秒内收集请求，
+    去重后通过一次 embed_documents 调用完成整批请求，最多 max_batch_size 条文本。
+    文本到向量的结果保存在 LRU 缓存中，重复的问题不会再次请求Embedding接口。
+    """
+
+    def __init__(self, embeddings: Embeddings, max_batch_size: int = Config.EMBEDDING_MAX_BATCH_SIZE,
+                 max_wait_ms: float = Config.EMBEDDING_MAX_WAIT_MS, cache_size: int = Config.EMBEDDING_CACHE_SIZE):
+        self.embeddings = embeddings
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._metrics = {"requests": 0, "cache_hits": 0, "batches": 0, "batched_texts": 0, "max_batch_size": 0,
+                         "errors": 0}
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """返回请求数、缓存命中率、接口调用批次数及平均和最大批大小"""
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics["cache_hit_rate"] = metrics["cache_hits"] / metrics["requests"] if metrics["requests"] else 0.0
+        metrics["avg_batch_size"] = metrics["batched_texts"] / metrics["batches"] if metrics["batches"] else 0.0
+        return metrics
+
+    def _cache_get(self, text: str) -> Optional[List[float]]:
+        with self._lock:
+            self._metrics["requests"] += 1
+            if text in self._cache:
+                self._cache.move_to_end(text)
+                self._metrics["cache_hits"] += 1
+                return self._cache[text]
+        return None
+
+    def _cache_put(self, texts: List[str], vectors: List[List[float]]) -> None:
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                self._cache[text] = vector
+                self._cache.move_to_end(text)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None or not self._worker.is_alive():
+            with self._lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._worker.start()
+
+    def _submit(self, text: str) -> Future:
+        future = Future()
+        vector = self._cache_get(text)
+        if vector is not None:
+            future.set_result(vector)
+            return future
+        self._ensure_worker()
+        self._queue.put((text, future))
+        return future
+
+    def _collect(self) -> List[tuple]:
+        """阻塞等待第一条请求，然后在 max_wait 内继续收集，直到达到 max_batch_size"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            # 同一批内的重复文本只请求一次
+            pending = OrderedDict()
+            for text, future in batch:
+                pending.setdefault(text, []).append(future)
+            texts = list(pending)
+            try:
+                vectors = self.embeddings.embed_documents(texts)
+            except Exception as e:
+                logger.error(f"Embedding batch of {len(texts)} texts failed: {e}")
+                with self._lock:
+                    self._metrics["errors"] += 1
+                for futures in pending.values():
+                    for future in futures:
+                        future.set_exception(e)
+                continue
+            self._cache_put(texts, vectors)
+            with self._lock:
+                self._metrics["batches"] += 1
+                self._metrics["batched_texts"] += len(texts)
+                self._metrics["max_batch_size"] = max(self._metrics["max_batch_size"], len(texts))
+            for text, vector in zip(texts, vectors):
+                for future in pending[text]:
+                    future.set_result(vector)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        futures = [self._submit(text) for text in texts]
+        return [future.result() for future in futures]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._submit(text).result()
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return list(await asyncio.gather(*(asyncio.wrap_future(self._submit(text)) for text in texts)))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await asyncio.wrap_future(self._submit(text))
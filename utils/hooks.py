@@ -0,0 +1,44 @@
+import logging
+from collections import defaultdict
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# 事件名称 -> 回调列表。业务代码只调用 emit，指标、追踪等通过 register_hook 订阅事件
+_hooks: Dict[str, List[Callable]] = defaultdict(list)
+
+# 已使用的事件及参数：
+#   node_start(node)                                    graph节点开始执行
+#   node_end(node, elapsed, error)                      graph节点执行结束
+#   llm_call(model, elapsed, input_tokens, output_tokens, cached, error)
+#   tool_call(tool, elapsed, wait, error)
+#   checkpoint_write(kind, elapsed, error)              检查点写入，kind 为 checkpoint 或 writes
+#   request_start(stream)                               chat_completions 请求开始
+#   first_token(elapsed)                                流式响应产出第一个数据块
+#   request_end(stream, cached, elapsed, error)         chat_completions 请求结束
+#   request_usage(user_id, input_tokens, output_tokens, calls, exhausted)  请求结束时本次请求的LLM用量及预算是否用尽
+
+
+def register_hook(event: str, callback: Callable) -> None:
+    """订阅事件，回调以关键字参数接收事件数据，同一回调只注册一次"""
+    if callback not in _hooks[event]:
+        _hooks[event].append(callback)
+
+
+def unregister_hook(event: str, callback: Callable) -> None:
+    if callback in _hooks.get(event, []):
+        _hooks[event].remove(callback)
+
+
+def emit(event: str, **payload) -> None:
+    """
+    触发事件。没有订阅者时只有一次字典查找的开销，回调异常只记录日志，不影响业务流程。
+    """
+    callbacks = _hooks.get(event)
+    if not callbacks:
+        return
+    for callback in callbacks:
+        try:
+            callback(**payload)
+        except Exception as e:
+            logger.error(f"Hook {getattr(callback, '__name__', callback)} for {event} failed: {e}")
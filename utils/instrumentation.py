@@ -0,0 +1,176 @@
+from typing import Dict, Tuple
+
+from utils.hooks import register_hook
+from utils.metrics import registry
+
+# 首个数据块和整体请求的耗时分桶（秒），LLM应用的请求通常在秒级
+REQUEST_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+# 单个请求的token用量分桶
+TOKEN_BUCKETS = (1000, 2000, 5000, 10000, 20000, 50000, 100000, 200000, 500000)
+
+request_duration = registry.histogram(
+    "http_request_duration_seconds", "chat_completions latency until the full response is sent",
+    ("stream", "cached"), buckets=REQUEST_BUCKETS)
+time_to_first_token = registry.histogram(
+    "http_time_to_first_token_seconds", "Latency until the first streamed content chunk", buckets=REQUEST_BUCKETS)
+node_duration = registry.histogram(
+    "graph_node_duration_seconds", "Duration of each graph node run", ("node",), buckets=REQUEST_BUCKETS)
+tool_duration = registry.histogram(
+    "tool_call_duration_seconds", "Tool call latency including time queued", ("tool",))
+tool_wait = registry.histogram(
+    "tool_call_wait_seconds", "Time a tool call waited for the per-tool concurrency limit", ("tool",))
+llm_duration = registry.histogram(
+    "llm_call_duration_seconds", "LLM call latency", ("model", "cached"), buckets=REQUEST_BUCKETS)
+llm_tokens = registry.counter(
+    "llm_tokens", "LLM tokens by direction", ("model", "type"))
+request_tokens = registry.histogram(
+    "request_llm_tokens", "LLM tokens used by one chat request", ("type",), buckets=TOKEN_BUCKETS)
+budget_stops = registry.counter(
+    "request_budget_exhausted", "Requests stopped early because the token or time budget ran out")
+checkpoint_duration = registry.histogram(
+    "checkpoint_write_duration_seconds", "Postgres checkpoint write latency", ("kind",))
+errors = registry.counter(
+    "agent_errors", "Errors by source", ("source",))
+
+
+def _on_node_end(node, elapsed, error):
+    node_duration.observe(elapsed, node)
+    if error:
+        errors.inc("node")
+
+
+def _on_tool_call(tool, elapsed, wait, error):
+    tool_duration.observe(elapsed, tool)
+    tool_wait.observe(wait, tool)
+    if error:
+        errors.inc("tool")
+
+
+def _on_llm_call(model, elapsed, input_tokens, output_tokens, cached, error):
+    if error:
+        errors.inc("llm")
+        return
+    llm_duration.observe(elapsed, model, "true" if cached else "false")
+    if input_tokens:
+        llm_tokens.inc(model, "input", amount=input_tokens)
+    if output_tokens:
+        llm_tokens.inc(model, "output", amount=output_tokens)
+
+
+def _on_request_usage(user_id, input_tokens, output_tokens, calls, exhausted):
+    request_tokens.observe(input_tokens, "input")
+    request_tokens.observe(output_tokens, "output")
+    if exhausted:
+        budget_stops.inc()
+
+
+def _on_checkpoint_write(kind, elapsed, error):
+    checkpoint_duration.observe(elapsed, kind)
+    if error:
+        errors.inc("checkpoint")
+
+
+def _on_first_token(elapsed):
+    time_to_first_token.observe(elapsed)
+
+
+def _on_request_end(stream, cached, elapsed, error):
+    request_duration.observe(elapsed, "true" if stream else "false", "true" if cached else "false")
+    if error:
+        errors.inc("request")
+
+
+# 组件统计中的瞬时值（命中率、队列长度、熔断状态、延迟分位数等），作为 gauge 导出；其余都是自启动以来的累计值，作为 counter 导出
+POINT_IN_TIME_KEYS = {"max_tokens_sent", "hit_rate", "pending", "http2", "chat_models", "error_rate", "circuit_open"}
+
+
+def _is_point_in_time(key: str) -> bool:
+    return key in POINT_IN_TIME_KEYS or "_latency_" in key
+
+
+def _cumulative(callback):
+    """只保留 callback 结果中的累计值，标签的最后一项为统计项名称"""
+    return lambda: {labels: value for labels, value in callback().items() if not _is_point_in_time(labels[-1])}
+
+
+def _point_in_time(callback):
+    """只保留 callback 结果中的瞬时值"""
+    return lambda: {labels: value for labels, value in callback().items() if _is_point_in_time(labels[-1])}
+
+
+def _planner_metrics() -> Dict[Tuple[str, ...], float]:
+    from graph.advanced_agent.nodes import get_planner_metrics
+    return {(key,): value for key, value in get_planner_metrics().items()}
+
+
+def _escalation_metrics() -> Dict[Tuple[str, ...], float]:
+    from graph.advanced_agent.nodes import get_escalation_metrics
+    return {(node,): value for node, value in get_escalation_metrics().items()}
+
+
+def _limit_metrics() -> Dict[Tuple[str, ...], float]:
+    from graph.advanced_agent.nodes import get_limit_metrics
+    return {(reason,): value for reason, value in get_limit_metrics().items()}
+
+
+def _context_window_metrics() -> Dict[Tuple[str, ...], float]:
+    from utils.context_window import context_window
+    return {(node, key): value for node, metrics in context_window.get_metrics().items()
+            for key, value in metrics.items()}
+
+
+def _cache_metrics() -> Dict[Tuple[str, ...], float]:
+    from utils.llm_cache import get_llm_cache
+    from utils.llm_clients import get_metrics as get_llm_http_metrics
+    from utils.log_utils import get_log_metrics
+    from utils.memory_writer import get_memory_writer
+    from utils.semantic_cache import get_semantic_cache
+    values = {}
+    for name, component in (("llm_cache", get_llm_cache()), ("semantic_cache", get_semantic_cache()),
+                            ("memory_writer", get_memory_writer())):
+        if component is not None:
+            values.update({(name, key): value for key, value in component.get_metrics().items()})
+    values.update({("log_sampler", key): value for key, value in get_log_metrics().items()})
+    values.update({("llm_http", key): value for key, value in get_llm_http_metrics().items()})
+    return values
+
+
+def _usage_metrics() -> Dict[Tuple[str, ...], float]:
+    # 只按节点导出；用户数不受限制，按用户的用量通过 /v1/usage/{user_id} 查询，不作为指标标签
+    from utils.usage import usage_accounting
+    return {(node, key): value for node, usage in usage_accounting.get_metrics()['node'].items()
+            for key, value in usage.items()}
+
+
+def _llm_router_metrics() -> Dict[Tuple[str, ...], float]:
+    from utils.llm_router import get_router_metrics
+    return get_router_metrics()
+
+
+def install_metrics_hooks() -> None:
+    """订阅 hooks 事件并注册各组件统计信息的导出，重复调用无副作用"""
+    register_hook("node_end", _on_node_end)
+    register_hook("tool_call", _on_tool_call)
+    register_hook("llm_call", _on_llm_call)
+    register_hook("checkpoint_write", _on_checkpoint_write)
+    register_hook("first_token", _on_first_token)
+    register_hook("request_end", _on_request_end)
+    register_hook("request_usage", _on_request_usage)
+    registry.counter("planner_parse", "Plan parsing outcomes and retry time", ("metric",), callback=_planner_metrics)
+    registry.counter("model_escalations", "Calls retried on the escalation model after failed validation", ("node",),
+                     callback=_escalation_metrics)
+    registry.counter("execution_limits", "Steps, plan updates and reports cut short by iteration limits, deadlines or "
+                     "budgets", ("reason",), callback=_limit_metrics)
+    registry.counter("context_window", "Context window calls, tokens and summaries by node", ("node", "metric"),
+                     callback=_cumulative(_context_window_metrics))
+    registry.gauge("context_window_state", "Largest context sent to the LLM by node", ("node", "metric"),
+                   callback=_point_in_time(_context_window_metrics))
+    registry.counter("component_events", "Cache, background writer, log sampling and LLM HTTP pool event counts",
+                     ("component", "metric"), callback=_cumulative(_cache_metrics))
+    registry.gauge("component_stats", "Cache hit rates, pending writes and LLM HTTP client settings",
+                   ("component", "metric"), callback=_point_in_time(_cache_metrics))
+    registry.counter("llm_backend_events", "LLM router calls, errors and hedges by backend", ("backend", "metric"),
+                     callback=_cumulative(_llm_router_metrics))
+    registry.gauge("llm_backend", "LLM router latency, error rate and circuit state by backend", ("backend", "metric"),
+                   callback=_point_in_time(_llm_router_metrics))
+    registry.counter("llm_usage", "LLM tokens and calls by node", ("node", "metric"), callback=_usage_metrics)
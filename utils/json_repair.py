@@ -0,0 +1,103 @@
+import json
+import re
+from typing import Any
+
+_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_WORD = re.compile(r"[A-Za-z]+")
+
+
+def _strip_dangling(buffer: list, key_start) -> None:
+    """
+    去掉输出末尾不完整的部分：只有键没有值的键（带或不带冒号），以及末尾的空白和多余的逗号。
+    只从末尾弹出元素，每个元素最多被删除一次，整个修复过程仍是线性的。
+    """
+    if key_start is not None:
+        del buffer[key_start:]
+    while buffer and (buffer[-1].isspace() or buffer[-1] == ","):
+        buffer.pop()
+
+
+def repair_json(text: str) -> str:
+    """
+    单遍扫描修复LLM输出中常见的JSON格式问题：
+
+    - 忽略第一个 { 或 [ 之前以及顶层值结束之后的文本（代码块标记、解释性文字）
+    - 删除 } 和 ] 前多余的逗号
+    - 将 Python 风格的 True/False/None 转换为 JSON 字面量
+    - 输出被截断时补全未闭合的字符串、括号，并去掉悬空的键
+    """
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if not starts:
+        return text
+    buffer = []
+    stack = []
+    in_string = False
+    escaped = False
+    # 当前对象中还没有值的键在 buffer 中的起始位置，值开始后清空
+    key_start = None
+    # 字符串外最后一个非空白字符，用于判断字符串是键还是值
+    last = ""
+    i = min(starts)
+    while i < len(text):
+        ch = text[i]
+        if in_string:
+            buffer.append(ch)
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+                last = ch
+            i += 1
+            continue
+        if ch in "}]":
+            _strip_dangling(buffer, key_start)
+            key_start = None
+            if stack:
+                buffer.append(stack.pop())
+            if not stack:
+                break
+            last = ch
+            i += 1
+            continue
+        if ch.isspace():
+            buffer.append(ch)
+            i += 1
+            continue
+        if ch == '"' and stack and stack[-1] == "}" and last in "{,":
+            key_start = len(buffer)
+        elif ch != ":":
+            key_start = None
+        if ch == '"':
+            in_string = True
+            buffer.append(ch)
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+            buffer.append(ch)
+        elif "A" <= ch <= "Z" or "a" <= ch <= "z":
+            word = _WORD.match(text, i).group(0)
+            buffer.append(_LITERALS.get(word, word))
+            last = word[-1]
+            i += len(word)
+            continue
+        else:
+            buffer.append(ch)
+        last = ch
+        i += 1
+    if in_string:
+        if escaped:
+            buffer.pop()
+        buffer.append('"')
+    if stack:
+        _strip_dangling(buffer, key_start)
+        buffer.extend(reversed(stack))
+    return "".join(buffer)
+
+
+def loads_tolerant(text: str) -> Any:
+    """先按标准JSON解析，失败后修复一次再解析，仍然失败时抛出 json.JSONDecodeError"""
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return json.loads(repair_json(text))
@@ -1,24 +1,28 @@
 import logging
-import os
-from typing import Dict, Any, List
+import time
+from typing import Dict, Any, List, Optional, Tuple, Type
 
 from langchain_core.language_models import BaseChatModel
 from langchain_core.messages import BaseMessage
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langgraph.config import get_config
 from langgraph.graph import MessagesState
+from pydantic import BaseModel
 
-from utils.tools import load_yaml_config, message_to_dict
+from utils.config_utils import Config
+from utils.hooks import emit
+from utils.llm_clients import get_chat_model, get_embeddings
+from utils.llm_cache import base_chat_model, cache_key, dump_response, get_llm_cache, is_cacheable, load_response
+from utils.tools import message_to_dict
+from utils.transcript import current_message_refs, ensure_message, ensure_message_id, get_transcript_store
+from utils.usage import record_llm_usage
 
 # 设置日志模版
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# 模型配置字典
-MODEL_CONFIGS = load_yaml_config()
-
 # 默认配置
-DEFAULT_LLM_TYPE = "openai"
-DEFAULT_TEMPERATURE = 0.7
+DEFAULT_LLM_TYPE = Config.LLM_TYPE
 
 
 class LLMInitializationError(Exception):
@@ -28,7 +32,8 @@ class LLMInitializationError(Exception):
 
 def initialize_llm(llm_type: str = DEFAULT_LLM_TYPE) -> tuple[ChatOpenAI, OpenAIEmbeddings]:
     """
-    初始化LLM实例
+    初始化LLM实例，模型、温度和连接池配置见 config.yaml 的 llm_client 配置，
+    返回的实例共享进程内的HTTP连接池，重复调用返回同一个实例
 
     Args:
         llm_type (str): LLM类型，可选值为 'openai', 'oneapi', 'qwen', 'ollama'
@@ -40,33 +45,8 @@ def initialize_llm(llm_type: str = DEFAULT_LLM_TYPE) -> tuple[ChatOpenAI, OpenAI
         LLMInitializationError: 当LLM初始化失败时抛出
     """
     try:
-        # 检查llm_type是否有效
-        if llm_type not in MODEL_CONFIGS["llm"]:
-            raise ValueError(f"不支持的LLM类型: {llm_type}. 可用的类型: {list(MODEL_CONFIGS["llm"].keys())}")
-
-        config = MODEL_CONFIGS["llm"][llm_type]
-
-        # 特殊处理ollama类型
-        if llm_type == "ollama":
-            os.environ["OPENAI_API_KEY"] = "NA"
-
-        # 创建LLM实例
-        llm_chat = ChatOpenAI(
-            base_url=config["OPENAI_API_BASE"],
-            api_key=config["OPENAI_API_KEY"],
-            model=config["DEFAULT_MODEL"],
-            temperature=DEFAULT_TEMPERATURE,
-            timeout=30,  # 添加超时配置（秒）
-            max_retries=2  # 添加重试次数
-        )
-        embeddings_config = MODEL_CONFIGS['embeddings'][llm_type] if MODEL_CONFIGS['embedding'][
-            'ENABLE_SEPARATE_EMBEDDING'] else MODEL_CONFIGS['llm'][llm_type]
-        llm_embedding = OpenAIEmbeddings(
-            base_url=embeddings_config["OPENAI_API_BASE"],
-            api_key=embeddings_config["OPENAI_API_KEY"],
-            model=embeddings_config["DEFAULT_EMBEDDING_MODEL"],
-            deployment=embeddings_config["DEFAULT_EMBEDDING_MODEL"],
-        )
+        llm_chat = get_chat_model(llm_type)
+        llm_embedding = get_embeddings(llm_type)
 
         logger.info(f"成功初始化 {llm_type} LLM")
         return llm_chat, llm_embedding
@@ -98,10 +78,73 @@ def get_llm(llm_type: str = DEFAULT_LLM_TYPE) -> ChatOpenAI:
         raise  # 如果默认配置也失败，则抛出异常
 
 
+def _current_thread_id() -> str:
+    """获取当前graph运行的thread_id，不在graph中运行时返回default"""
+    try:
+        return get_config()["configurable"].get("thread_id", "default")
+    except (RuntimeError, KeyError):
+        return "default"
+
+
+def _collect_new_messages(state: MessagesState, input: List[BaseMessage] | str | BaseMessage,
+                          response: BaseMessage) -> List[BaseMessage]:
+    """
+    为本次调用的输入和输出分配消息ID，返回 state['all_messages'] 和当前节点都还没有记录过的新消息。
+    新消息的ID加入当前节点的 current_message_refs()，由节点返回给 all_messages 的 reducer，不修改 state。
+    """
+    messages = [ensure_message(m) for m in (input if isinstance(input, List) else [input])] + [response]
+    refs = current_message_refs()
+    known = set(state.get('all_messages') or [])
+    known.update(refs or [])
+    new_messages = []
+    for message in messages:
+        message_id = ensure_message_id(message)
+        if message_id not in known:
+            known.add(message_id)
+            new_messages.append(message)
+            if refs is not None:
+                refs.append(message_id)
+    return new_messages
+
+
+def _cache_for(llm: BaseChatModel):
+    """返回本次调用可用的响应缓存，未启用缓存或调用不是确定性的时返回None"""
+    cache = get_llm_cache()
+    if cache is not None and is_cacheable(llm):
+        return cache
+    return None
+
+
+def emit_llm_call(llm: BaseChatModel, start: float, response: Optional[BaseMessage], cached: bool = False,
+                   error: bool = False) -> None:
+    """触发 llm_call 事件并计入当前请求的用量，token数量取自响应的 usage_metadata，命中缓存时不计入token"""
+    usage = (getattr(response, "usage_metadata", None) or {}) if response is not None and not cached else {}
+    if response is not None and not cached:
+        record_llm_usage(usage.get("input_tokens", 0), usage.get("output_tokens", 0))
+    model = base_chat_model(llm)
+    emit("llm_call", model=getattr(model, "model_name", None) or type(model).__name__,
+         elapsed=time.perf_counter() - start, input_tokens=usage.get("input_tokens", 0),
+         output_tokens=usage.get("output_tokens", 0), cached=cached, error=error)
+
+
 def llm_invoke(state: MessagesState, llm: BaseChatModel, input: List[BaseMessage] | str | BaseMessage,
                return_dict: bool = True) -> Dict[Any, Any]:
-    response = llm.invoke(input)
-    state['all_messages'] += (input + [response]) if isinstance(input, List) else [input]
+    start = time.perf_counter()
+    cache = _cache_for(llm)
+    key = cache_key(llm, input) if cache else None
+    record = cache.lookup(key) if cache else None
+    if record is not None:
+        response = load_response(record)
+    else:
+        try:
+            response = llm.invoke(input)
+        except Exception:
+            emit_llm_call(llm, start, None, error=True)
+            raise
+        if cache:
+            cache.update(key, dump_response(response))
+    emit_llm_call(llm, start, response, cached=record is not None)
+    get_transcript_store().append(_current_thread_id(), _collect_new_messages(state, input, response))
     if return_dict:
         response = message_to_dict(response)
     return response
@@ -109,13 +152,56 @@ def llm_invoke(state: MessagesState, llm: BaseChatModel, input: List[BaseMessage
 
 async def llm_ainvoke(state: MessagesState, llm: BaseChatModel, input: List[BaseMessage] | str | BaseMessage,
                       return_dict: bool = True) -> Dict[Any, Any]:
-    response = await llm.ainvoke(input)
-    state['all_messages'] += (input + [response]) if isinstance(input, List) else [input]
+    start = time.perf_counter()
+    cache = _cache_for(llm)
+    key = cache_key(llm, input) if cache else None
+    record = await cache.alookup(key) if cache else None
+    if record is not None:
+        response = load_response(record)
+    else:
+        try:
+            response = await llm.ainvoke(input)
+        except Exception:
+            emit_llm_call(llm, start, None, error=True)
+            raise
+        if cache:
+            await cache.aupdate(key, dump_response(response))
+    emit_llm_call(llm, start, response, cached=record is not None)
+    await get_transcript_store().aappend(_current_thread_id(), _collect_new_messages(state, input, response))
     if return_dict:
         response = message_to_dict(response)
     return response
 
 
+async def llm_ainvoke_structured(state: MessagesState, llm: BaseChatModel, input: List[BaseMessage],
+                                 schema: Type[BaseModel], method: str = "function_calling"
+                                 ) -> Tuple[BaseMessage, Optional[BaseModel]]:
+    """
+    以结构化输出方式调用LLM，返回原始消息和按 schema 解析后的对象（解析失败时为 None）。
+    只缓存解析成功的结果，解析失败时仍会走容错解析和重试。
+    """
+    start = time.perf_counter()
+    cache = _cache_for(llm)
+    key = cache_key(llm, input, schema=schema.model_json_schema(), method=method) if cache else None
+    record = await cache.alookup(key) if cache else None
+    if record is not None:
+        response, parsed = load_response(record["raw"]), schema.model_validate(record["parsed"])
+    else:
+        try:
+            result = await llm.with_structured_output(schema, method=method, include_raw=True).ainvoke(input)
+        except Exception:
+            emit_llm_call(llm, start, None, error=True)
+            raise
+        response, parsed = result["raw"], result.get("parsed")
+        if cache and parsed is not None:
+            # 只保存模型给出的字段，读取缓存时与直接解析的结果一致（如区分未给出的字段和默认值）
+            await cache.aupdate(key, {"raw": dump_response(response),
+                                      "parsed": parsed.model_dump(exclude_unset=True)})
+    emit_llm_call(llm, start, response, cached=record is not None)
+    await get_transcript_store().aappend(_current_thread_id(), _collect_new_messages(state, input, response))
+    return response, parsed
+
+
 # 示例使用
 if __name__ == "__main__":
     try:
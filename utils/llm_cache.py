@@ -0,0 +1,280 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from langchain_core.load import dumpd
+from langchain_core.messages import BaseMessage, messages_from_dict
+from langchain_core.messages import message_to_dict as lc_message_to_dict
+from langchain_core.runnables import RunnableBinding
+
+from utils.config_utils import Config
+from utils.transcript import ensure_message
+
+logger = logging.getLogger(__name__)
+
+
+def base_chat_model(llm: Any) -> Any:
+    """返回 bind_tools 等绑定之后的底层模型"""
+    while isinstance(llm, RunnableBinding):
+        llm = llm.bound
+    return llm
+
+
+def is_cacheable(llm: Any) -> bool:
+    """只缓存确定性的调用：底层模型的 temperature 不高于 Config.LLM_CACHE_MAX_TEMPERATURE"""
+    temperature = getattr(base_chat_model(llm), "temperature", None)
+    return temperature is not None and temperature <= Config.LLM_CACHE_MAX_TEMPERATURE
+
+
+def _canonical_message(message: Any) -> Dict[str, Any]:
+    """只保留影响模型输出的字段，消息ID和响应元数据不参与计算缓存键"""
+    message = ensure_message(message)
+    return {
+        "type": message.type,
+        "content": message.content,
+        "name": getattr(message, "name", None),
+        "tool_calls": [{"name": c["name"], "args": c["args"], "id": c.get("id")}
+                       for c in getattr(message, "tool_calls", None) or []],
+        "tool_call_id": getattr(message, "tool_call_id", None),
+    }
+
+
+def _llm_identity(llm: Any) -> Any:
+    """
+    参与缓存键计算的模型标识。可序列化的模型（如 ChatOpenAI）使用 dumpd；不可序列化的模型（如 LLMRouter）
+    dumpd 会退化为包含内存地址的 repr，每个进程都不同，改用 _llm_type、_identifying_params 及绑定的参数。
+    """
+    model = base_chat_model(llm)
+    if getattr(model, "is_lc_serializable", lambda: False)():
+        return dumpd(llm)
+    kwargs = {}
+    while isinstance(llm, RunnableBinding):
+        # 外层绑定的参数覆盖内层的同名参数，与调用时的合并顺序一致
+        kwargs = {**llm.kwargs, **kwargs}
+        llm = llm.bound
+    return {"llm_type": getattr(model, "_llm_type", type(model).__name__),
+            "params": getattr(model, "_identifying_params", {}), "kwargs": kwargs}
+
+
+def cache_key(llm: Any, input: Any, **extra: Any) -> str:
+    """
+    按模型及其参数、绑定的工具和输入消息计算缓存键。
+
+    Args:
+        llm: 模型实例，可以是 bind_tools 之后的 RunnableBinding。
+        input: 输入的消息列表、单条消息或字符串。
+        extra: 其他影响输出的参数，如结构化输出的 schema。
+    """
+    messages = input if isinstance(input, list) else [input]
+    payload = json.dumps({
+        "llm": _llm_identity(llm),
+        "messages": [_canonical_message(m) for m in messages],
+        "extra": extra,
+    }, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def dump_response(response: BaseMessage) -> Dict[str, Any]:
+    record = lc_message_to_dict(response)
+    # 去掉本次调用的消息ID，命中缓存时按内容重新生成
+    record["data"].pop("id", None)
+    return record
+
+
+def load_response(record: Dict[str, Any]) -> BaseMessage:
+    return messages_from_dict([record])[0]
+
+
+class LLMCache:
+    """
+    LLM响应缓存，超过 ttl 秒的记录视为过期，记录数超过 max_entries 时淘汰最久未使用的记录。
+    """
+
+    def __init__(self, ttl: float = Config.LLM_CACHE_TTL, max_entries: int = Config.LLM_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._metrics = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+    def _record(self, **values: int) -> None:
+        with self._lock:
+            for key, value in values.items():
+                self._metrics[key] += value
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """返回命中、未命中、写入和淘汰次数，以及命中率"""
+        with self._lock:
+            metrics = dict(self._metrics)
+        lookups = metrics["hits"] + metrics["misses"]
+        metrics["hit_rate"] = metrics["hits"] / lookups if lookups else 0.0
+        return metrics
+
+    def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        payload = self._get(key)
+        self._record(**{"hits" if payload is not None else "misses": 1})
+        return payload
+
+    async def alookup(self, key: str) -> Optional[Dict[str, Any]]:
+        payload = await self._aget(key)
+        self._record(**{"hits" if payload is not None else "misses": 1})
+        return payload
+
+    def update(self, key: str, payload: Dict[str, Any]) -> None:
+        self._record(writes=1, evictions=self._set(key, payload))
+
+    async def aupdate(self, key: str, payload: Dict[str, Any]) -> None:
+        self._record(writes=1, evictions=await self._aset(key, payload))
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def _set(self, key: str, payload: Dict[str, Any]) -> int:
+        """写入记录，返回淘汰的记录数"""
+        raise NotImplementedError
+
+    async def _aget(self, key: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def _aset(self, key: str, payload: Dict[str, Any]) -> int:
+        return await asyncio.to_thread(self._set, key, payload)
+
+
+class SQLiteLLMCache(LLMCache):
+    """本地SQLite文件缓存，适合单机部署"""
+
+    def __init__(self, path: str = Config.LLM_CACHE_PATH, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db_lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_access ON llm_cache (last_access)")
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._db_lock:
+            row = self._conn.execute("SELECT payload, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self.ttl and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def _set(self, key: str, payload: Dict[str, Any]) -> int:
+        now = time.time()
+        with self._db_lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, payload, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(payload, ensure_ascii=False), now, now))
+            evicted = 0
+            if self.ttl:
+                evicted += self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?",
+                                              (now - self.ttl,)).rowcount
+            count = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            if count > self.max_entries:
+                evicted += self._conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN "
+                    "(SELECT key FROM llm_cache ORDER BY last_access LIMIT ?)",
+                    (count - self.max_entries,)).rowcount
+        return evicted
+
+    def close(self) -> None:
+        with self._db_lock:
+            self._conn.close()
+
+
+class PostgresLLMCache(LLMCache):
+    """
+    复用服务的异步数据库连接池，多个服务实例共享缓存。过期和超量记录每 prune_interval 次写入清理一次。
+    """
+
+    def __init__(self, db_connection_pool, prune_interval: int = 100, **kwargs):
+        super().__init__(**kwargs)
+        self.db_connection_pool = db_connection_pool
+        self.prune_interval = prune_interval
+        self._writes_since_prune = 0
+
+    async def setup(self) -> None:
+        async with self.db_connection_pool.connection() as conn:
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    payload JSONB NOT NULL,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    last_access TIMESTAMPTZ NOT NULL DEFAULT now()
+                )""")
+            await conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_access ON llm_cache (last_access)")
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        # 同步调用无法使用异步连接池，直接视为未命中
+        return None
+
+    def _set(self, key: str, payload: Dict[str, Any]) -> int:
+        return 0
+
+    async def _aget(self, key: str) -> Optional[Dict[str, Any]]:
+        async with self.db_connection_pool.connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    "UPDATE llm_cache SET last_access = now() "
+                    "WHERE key = %s AND (%s = 0 OR created_at > now() - make_interval(secs => %s)) "
+                    "RETURNING payload", (key, self.ttl, self.ttl))
+                row = await cursor.fetchone()
+        return row[0] if row else None
+
+    async def _aset(self, key: str, payload: Dict[str, Any]) -> int:
+        async with self.db_connection_pool.connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    "INSERT INTO llm_cache (key, payload) VALUES (%s, %s) "
+                    "ON CONFLICT (key) DO UPDATE SET payload = EXCLUDED.payload, "
+                    "created_at = now(), last_access = now()",
+                    (key, json.dumps(payload, ensure_ascii=False)))
+                self._writes_since_prune += 1
+                if self._writes_since_prune < self.prune_interval:
+                    return 0
+                self._writes_since_prune = 0
+                evicted = 0
+                if self.ttl:
+                    await cursor.execute("DELETE FROM llm_cache WHERE created_at < now() - make_interval(secs => %s)",
+                                         (self.ttl,))
+                    evicted += cursor.rowcount
+                await cursor.execute(
+                    "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY last_access DESC "
+                    "OFFSET %s)", (self.max_entries,))
+                evicted += cursor.rowcount
+        return evicted
+
+
+_llm_cache: Optional[LLMCache] = None
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """获取进程级的LLM响应缓存，未启用时返回None；sqlite 后端在首次使用时创建"""
+    global _llm_cache
+    if _llm_cache is None and Config.LLM_CACHE_ENABLED and Config.LLM_CACHE_BACKEND == "sqlite":
+        _llm_cache = SQLiteLLMCache()
+    return _llm_cache
+
+
+def set_llm_cache(cache: Optional[LLMCache]) -> None:
+    global _llm_cache
+    _llm_cache = cache
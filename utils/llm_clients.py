@@ -0,0 +1,182 @@
+import logging
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+from utils.config_utils import Config
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:  # h2 未安装时只能使用 HTTP/1.1
+    HTTP2_AVAILABLE = False
+
+# 共享HTTP连接池的统计：requests 发出的请求数，connections_opened 新建的TCP连接数，tls_handshakes TLS握手次数
+http_metrics = {'requests': 0, 'connections_opened': 0, 'tls_handshakes': 0}
+
+
+def _count_event(event_name: str) -> None:
+    if event_name == "connection.connect_tcp.complete":
+        http_metrics['connections_opened'] += 1
+    elif event_name == "connection.start_tls.complete":
+        http_metrics['tls_handshakes'] += 1
+
+
+def _trace(event_name: str, info: Dict[str, Any]) -> None:
+    _count_event(event_name)
+
+
+async def _atrace(event_name: str, info: Dict[str, Any]) -> None:
+    _count_event(event_name)
+
+
+def _on_request(request: httpx.Request) -> None:
+    http_metrics['requests'] += 1
+    request.extensions["trace"] = _trace
+
+
+async def _on_arequest(request: httpx.Request) -> None:
+    http_metrics['requests'] += 1
+    request.extensions["trace"] = _atrace
+
+
+def _client_kwargs(**overrides) -> Dict[str, Any]:
+    http2 = overrides.pop("http2", Config.LLM_HTTP2)
+    if http2 and not HTTP2_AVAILABLE:
+        logger.warning("HTTP/2 is enabled but h2 is not installed, falling back to HTTP/1.1")
+        http2 = False
+    kwargs = {
+        "http2": http2,
+        "limits": httpx.Limits(max_connections=Config.LLM_MAX_CONNECTIONS,
+                               max_keepalive_connections=Config.LLM_MAX_KEEPALIVE_CONNECTIONS,
+                               keepalive_expiry=Config.LLM_KEEPALIVE_EXPIRY),
+        "timeout": httpx.Timeout(Config.LLM_TIMEOUT),
+    }
+    kwargs.update(overrides)
+    return kwargs
+
+
+def create_http_client(**overrides) -> httpx.Client:
+    """按 Config 的连接池配置创建同步HTTP客户端，overrides 覆盖 httpx.Client 的参数"""
+    return httpx.Client(event_hooks={"request": [_on_request]}, **_client_kwargs(**overrides))
+
+
+def create_async_http_client(**overrides) -> httpx.AsyncClient:
+    """按 Config 的连接池配置创建异步HTTP客户端，overrides 覆盖 httpx.AsyncClient 的参数"""
+    return httpx.AsyncClient(event_hooks={"request": [_on_arequest]}, **_client_kwargs(**overrides))
+
+
+_lock = threading.Lock()
+_http_client: Optional[httpx.Client] = None
+_async_http_client: Optional[httpx.AsyncClient] = None
+# (服务商, 模型, 温度, 重试次数) -> ChatOpenAI，服务商 -> OpenAIEmbeddings
+_chat_models: Dict[Tuple[str, str, float, int], ChatOpenAI] = {}
+_embeddings: Dict[str, OpenAIEmbeddings] = {}
+
+
+def get_http_client() -> httpx.Client:
+    """进程内共享的同步HTTP客户端，所有LLM和Embedding的同步调用复用其中的keep-alive连接"""
+    global _http_client
+    with _lock:
+        if _http_client is None or _http_client.is_closed:
+            _http_client = create_http_client()
+        return _http_client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """进程内共享的异步HTTP客户端；连接绑定创建它们的事件循环，服务只在一个事件循环中运行"""
+    global _async_http_client
+    with _lock:
+        if _async_http_client is None or _async_http_client.is_closed:
+            _async_http_client = create_async_http_client()
+        return _async_http_client
+
+
+def get_provider_config(provider: str, section: str = "llm") -> Dict[str, Any]:
+    """返回 config.yaml 中 llm（或 embeddings）下指定服务商的配置，服务商不存在时抛出 ValueError"""
+    providers = {name: value for name, value in (Config.config.get(section) or {}).items() if isinstance(value, dict)}
+    if provider not in providers:
+        raise ValueError(f"不支持的LLM类型: {provider}. 可用的类型: {list(providers)}")
+    return providers[provider]
+
+
+def _api_key(provider: str, config: Dict[str, Any]) -> str:
+    # ollama 不校验密钥
+    return "NA" if provider == "ollama" else config["OPENAI_API_KEY"]
+
+
+def get_chat_model(provider: Optional[str] = None, model: Optional[str] = None,
+                   temperature: Optional[float] = None, max_retries: Optional[int] = None) -> ChatOpenAI:
+    """
+    获取共享连接池的Chat模型，相同的 (服务商, 模型, 温度, 重试次数) 返回同一个实例。
+
+    Args:
+        provider: llm 配置中的服务商，默认 Config.LLM_TYPE。
+        model: 模型名称，默认该服务商的 DEFAULT_MODEL。
+        temperature: 温度，默认 Config.LLM_TEMPERATURE。
+        max_retries: 失败重试次数，默认 Config.LLM_MAX_RETRIES。
+    """
+    provider = provider or Config.LLM_TYPE
+    config = get_provider_config(provider)
+    model = model or config["DEFAULT_MODEL"]
+    temperature = Config.LLM_TEMPERATURE if temperature is None else temperature
+    max_retries = Config.LLM_MAX_RETRIES if max_retries is None else max_retries
+    key = (provider, model, temperature, max_retries)
+    if key not in _chat_models:
+        chat_model = ChatOpenAI(
+            base_url=config["OPENAI_API_BASE"],
+            api_key=_api_key(provider, config),
+            model=model,
+            temperature=temperature,
+            timeout=Config.LLM_TIMEOUT,
+            max_retries=max_retries,
+            # 自定义 base_url 时 langchain 默认不请求流式用量，报告节点的流式调用也需要计入请求用量
+            stream_usage=Config.LLM_STREAM_USAGE,
+            http_client=get_http_client(),
+            http_async_client=get_async_http_client(),
+        )
+        with _lock:
+            _chat_models.setdefault(key, chat_model)
+    return _chat_models[key]
+
+
+def get_embeddings(provider: Optional[str] = None) -> OpenAIEmbeddings:
+    """获取共享连接池的Embedding模型，embedding.ENABLE_SEPARATE_EMBEDDING 为true时使用 embeddings 下的服务商配置"""
+    provider = provider or Config.LLM_TYPE
+    if provider not in _embeddings:
+        separate = (Config.config.get('embedding') or {}).get('ENABLE_SEPARATE_EMBEDDING', False)
+        config = get_provider_config(provider, "embeddings" if separate else "llm")
+        embeddings = OpenAIEmbeddings(
+            base_url=config["OPENAI_API_BASE"],
+            api_key=_api_key(provider, config),
+            model=config["DEFAULT_EMBEDDING_MODEL"],
+            deployment=config["DEFAULT_EMBEDDING_MODEL"],
+            max_retries=Config.LLM_MAX_RETRIES,
+            http_client=get_http_client(),
+            http_async_client=get_async_http_client(),
+        )
+        with _lock:
+            _embeddings.setdefault(provider, embeddings)
+    return _embeddings[provider]
+
+
+async def aclose_http_clients() -> None:
+    """关闭共享的HTTP客户端，服务退出时调用"""
+    global _http_client, _async_http_client
+    with _lock:
+        http_client, async_http_client = _http_client, _async_http_client
+        _http_client = _async_http_client = None
+        _chat_models.clear()
+        _embeddings.clear()
+    if async_http_client is not None:
+        await async_http_client.aclose()
+    if http_client is not None:
+        http_client.close()
+
+
+def get_metrics() -> Dict[str, float]:
+    return {**http_metrics, 'http2': float(Config.LLM_HTTP2 and HTTP2_AVAILABLE), 'chat_models': len(_chat_models)}
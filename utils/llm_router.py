@@ -0,0 +1,386 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple, Union
+
+import httpx
+import openai
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import ConfigDict, Field
+
+from utils.config_utils import Config
+from utils.llm_clients import get_chat_model
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+def is_retryable(error: BaseException) -> bool:
+    """连接失败、超时、限流和5xx错误可以换一个服务商重试，请求本身的错误（如400）在其他服务商同样会失败"""
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 429) or error.status_code >= 500
+    return isinstance(error, (openai.APIConnectionError, httpx.TransportError, asyncio.TimeoutError))
+
+
+def _percentile(values: Sequence[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+class BackendStats:
+    """
+    单个后端最近 window 次调用的延迟和成败，以及熔断器状态。
+
+    连续失败 failure_threshold 次，或最近至少 min_samples 次调用的错误率达到 error_rate_threshold 时熔断，
+    cooldown 秒后放行一次试探调用（half_open），成功则恢复，失败则继续熔断。
+    延迟按调用方式分别统计：invoke 为完整响应的耗时，stream 为首个数据块的耗时。
+    """
+
+    def __init__(self, name: str, window: int = Config.LLM_ROUTER_WINDOW,
+                 min_samples: int = Config.LLM_ROUTER_MIN_SAMPLES,
+                 failure_threshold: int = Config.LLM_ROUTER_FAILURE_THRESHOLD,
+                 error_rate_threshold: float = Config.LLM_ROUTER_ERROR_RATE_THRESHOLD,
+                 cooldown: float = Config.LLM_ROUTER_COOLDOWN):
+        self.name = name
+        self.min_samples = min_samples
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.cooldown = cooldown
+        self.latencies = {"invoke": deque(maxlen=window), "stream": deque(maxlen=window)}
+        self.outcomes = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.counters = {'calls': 0, 'failures': 0, 'hedges': 0, 'hedge_wins': 0, 'circuit_opens': 0}
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        """是否可以向该后端发送请求；熔断冷却结束后只放行一次试探调用"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+                return True
+            return False
+
+    def available(self) -> bool:
+        with self._lock:
+            return self.state == CLOSED or (self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown)
+
+    def record_success(self, kind: str, latency: float) -> None:
+        with self._lock:
+            self.counters['calls'] += 1
+            self.latencies[kind].append(latency)
+            self.consecutive_failures = 0
+            if self.state != CLOSED:
+                logger.info(f"LLM backend {self.name} recovered, closing circuit")
+                self.state = CLOSED
+                self.outcomes.clear()
+            self.outcomes.append(True)
+
+    def record_latency(self, kind: str, latency: float) -> None:
+        with self._lock:
+            self.latencies[kind].append(latency)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.counters['calls'] += 1
+            self.counters['failures'] += 1
+            self.consecutive_failures += 1
+            self.outcomes.append(False)
+            errors = self.outcomes.count(False)
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold or (
+                    len(self.outcomes) >= self.min_samples and errors / len(self.outcomes) >= self.error_rate_threshold):
+                if self.state != OPEN:
+                    self.counters['circuit_opens'] += 1
+                    logger.warning(f"LLM backend {self.name} is failing, opening circuit for {self.cooldown}s")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """试探调用被取消（对冲请求输掉）时恢复为可以再次试探"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.state = OPEN
+
+    def latency(self, kind: str, q: float) -> Optional[float]:
+        """延迟的 q 分位数，样本不足 min_samples 时返回None"""
+        with self._lock:
+            samples = list(self.latencies[kind])
+        return _percentile(samples, q) if len(samples) >= self.min_samples else None
+
+    def get_metrics(self) -> Dict[str, float]:
+        with self._lock:
+            errors = self.outcomes.count(False)
+            metrics = {**self.counters, 'error_rate': errors / len(self.outcomes) if self.outcomes else 0.0,
+                       'circuit_open': float(self.state != CLOSED)}
+        for kind in self.latencies:
+            for name, q in (("p50", 0.5), ("p95", 0.95)):
+                value = self.latency(kind, q)
+                if value is not None:
+                    metrics[f"{kind}_latency_{name}"] = value
+        return metrics
+
+
+# 后端名称 -> 统计信息，同一后端被多个路由共享时健康状态也共享
+_backend_stats: Dict[str, BackendStats] = {}
+_stats_lock = threading.Lock()
+
+
+def get_backend_stats(name: str) -> BackendStats:
+    with _stats_lock:
+        if name not in _backend_stats:
+            _backend_stats[name] = BackendStats(name)
+        return _backend_stats[name]
+
+
+def get_router_metrics() -> Dict[Tuple[str, str], float]:
+    with _stats_lock:
+        stats = list(_backend_stats.values())
+    return {(s.name, key): value for s in stats for key, value in s.get_metrics().items()}
+
+
+class LLMRouter(BaseChatModel):
+    """
+    在多个 OpenAI 兼容的后端之间路由的Chat模型。
+
+    每次调用按最近的中位延迟选择最快的可用后端；请求超过该后端延迟的 p95（不低于 hedge_min 秒）仍未返回时，
+    向次快的后端发送一个对冲请求，先返回的结果胜出并取消另一个。可重试的错误（连接失败、超时、429、5xx）
+    立即转到下一个后端，并计入熔断统计。流式调用以首个数据块为准，开始输出之后不再切换后端。
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    # 后端名称 -> 模型，名称用于共享统计信息，顺序为延迟相同时的优先级
+    backends: Dict[str, BaseChatModel]
+    model_name: str = "router"
+    temperature: Optional[float] = None
+    hedge: bool = Field(default_factory=lambda: Config.LLM_ROUTER_HEDGE)
+    hedge_min: float = Field(default_factory=lambda: Config.LLM_ROUTER_HEDGE_MIN_MS / 1000)
+
+    @property
+    def _llm_type(self) -> str:
+        return "router"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        """与进程无关的标识：后端名称及其模型、温度，用于响应缓存的键"""
+        return {"model_name": self.model_name, "temperature": self.temperature,
+                "backends": sorted((name, getattr(model, "model_name", None) or type(model).__name__)
+                                   for name, model in self.backends.items())}
+
+    def bind_tools(self, tools, *, tool_choice=None, **kwargs):
+        """按 OpenAI 的格式绑定工具，各后端都是 OpenAI 兼容接口"""
+        formatted = [convert_to_openai_tool(tool) for tool in tools]
+        if tool_choice is not None and tool_choice is not False:
+            if tool_choice is True or tool_choice == "any":
+                tool_choice = "required" if tool_choice == "any" or len(formatted) != 1 else \
+                    {"type": "function", "function": {"name": formatted[0]["function"]["name"]}}
+            elif isinstance(tool_choice, str) and tool_choice not in ("auto", "none", "required"):
+                tool_choice = {"type": "function", "function": {"name": tool_choice}}
+            kwargs["tool_choice"] = tool_choice
+        return super().bind(tools=formatted, **kwargs)
+
+    def with_structured_output(self, schema, *, method: str = "function_calling", include_raw: bool = False,
+                               **kwargs):
+        if method != "function_calling":
+            logger.warning(f"LLMRouter only supports function_calling structured output, ignoring method={method}")
+        return super().with_structured_output(schema, include_raw=include_raw, **kwargs)
+
+    def _ranked(self, kind: str) -> List[str]:
+        """可用的后端按中位延迟排序，样本不足的后端排在前面以便获得样本；全部熔断时按熔断时间先后全部尝试"""
+        names = list(self.backends)
+        available = [name for name in names if get_backend_stats(name).available()]
+        if not available:
+            return sorted(names, key=lambda name: get_backend_stats(name).opened_at)
+        return sorted(available, key=lambda name: (get_backend_stats(name).latency(kind, 0.5) or 0.0,
+                                                   names.index(name)))
+
+    def _hedge_after(self, name: str, kind: str) -> Optional[float]:
+        p95 = get_backend_stats(name).latency(kind, 0.95)
+        return None if p95 is None else max(p95, self.hedge_min)
+
+    @staticmethod
+    def _tag(result: ChatResult, name: str) -> ChatResult:
+        for generation in result.generations:
+            generation.message.response_metadata["llm_backend"] = name
+        return result
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        # 同步调用只做按延迟选择和故障转移，不发送对冲请求
+        last_error = None
+        for name in self._ranked("invoke"):
+            stats = get_backend_stats(name)
+            if not stats.acquire():
+                continue
+            start = time.perf_counter()
+            try:
+                result = self.backends[name]._generate(messages, stop=stop, **kwargs)
+            except Exception as e:
+                if not is_retryable(e):
+                    stats.release()
+                    raise
+                stats.record_failure()
+                logger.warning(f"LLM backend {name} failed, trying the next one: {e}")
+                last_error = e
+                continue
+            stats.record_success("invoke", time.perf_counter() - start)
+            return self._tag(result, name)
+        raise last_error or RuntimeError("No LLM backend available")
+
+    async def _race(self, kind: str, attempt) -> Tuple[str, Any]:
+        """
+        按排序依次调用 attempt(name)，超过对冲时间时额外调用下一个后端，可重试的错误转到下一个后端。
+        返回最先成功的 (后端名称, 结果)，其余仍在进行的调用被取消。
+        """
+        candidates = self._ranked(kind)
+        pending: Dict[asyncio.Task, Tuple[str, float]] = {}
+        hedged = False
+        last_error = None
+
+        def launch() -> bool:
+            while candidates:
+                name = candidates.pop(0)
+                if get_backend_stats(name).acquire():
+                    pending[asyncio.ensure_future(attempt(name))] = (name, time.perf_counter())
+                    return True
+            return False
+
+        launch()
+        try:
+            while pending:
+                timeout = None
+                if self.hedge and not hedged and candidates and len(pending) == 1:
+                    name, started = next(iter(pending.values()))
+                    hedge_after = self._hedge_after(name, kind)
+                    if hedge_after is not None:
+                        timeout = max(0.0, started + hedge_after - time.perf_counter())
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    slow = next(iter(pending.values()))[0]
+                    if launch():
+                        get_backend_stats(slow).counters['hedges'] += 1
+                        logger.info(f"LLM backend {slow} exceeded its p95 latency, hedging")
+                    continue
+                for task in done:
+                    name, started = pending.pop(task)
+                    stats = get_backend_stats(name)
+                    error = task.exception()
+                    if error is None:
+                        stats.record_success(kind, time.perf_counter() - started)
+                        if hedged:
+                            stats.counters['hedge_wins'] += 1
+                        return name, task.result()
+                    if not is_retryable(error):
+                        stats.release()
+                        raise error
+                    stats.record_failure()
+                    logger.warning(f"LLM backend {name} failed, trying the next one: {error}")
+                    last_error = error
+                if not pending:
+                    launch()
+            raise last_error or RuntimeError("No LLM backend available")
+        finally:
+            for task, (name, started) in pending.items():
+                stats = get_backend_stats(name)
+                if task.done():
+                    if not task.cancelled():
+                        task.exception()
+                else:
+                    task.cancel()
+                    # 被取消的慢请求至少耗时这么久，计入延迟以免一直被优先选择
+                    stats.record_latency(kind, time.perf_counter() - started)
+                stats.release()
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        async def attempt(name: str) -> ChatResult:
+            return await self.backends[name]._agenerate(messages, stop=stop, **kwargs)
+
+        name, result = await self._race("invoke", attempt)
+        return self._tag(result, name)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        async def attempt(name: str):
+            stream = self.backends[name]._astream(messages, stop=stop, **kwargs)
+            try:
+                return stream, await stream.__anext__()
+            except StopAsyncIteration:
+                return stream, None
+            except BaseException:
+                await stream.aclose()
+                raise
+
+        name, (stream, first) = await self._race("stream", attempt)
+        try:
+            chunk = first
+            while chunk is not None:
+                chunk.message.response_metadata["llm_backend"] = name
+                if run_manager:
+                    await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+                chunk = await anext(stream, None)
+        except Exception as e:
+            # 已经开始输出，不能切换后端，只记录失败
+            if is_retryable(e):
+                get_backend_stats(name).record_failure()
+            raise
+        finally:
+            await stream.aclose()
+
+
+_routers: Dict[Tuple, BaseChatModel] = {}
+
+
+def router_providers() -> List[str]:
+    """参与路由的服务商：llm_router.PROVIDERS，为空时为 llm 下配置的全部服务商"""
+    return Config.LLM_ROUTER_PROVIDERS or [name for name, value in (Config.config.get("llm") or {}).items()
+                                           if isinstance(value, dict)]
+
+
+def _model_for(provider: str, model: Optional[Union[str, Dict[str, str]]]) -> Optional[str]:
+    """model 可以是所有服务商共用的模型名称，也可以是 服务商 -> 模型 的映射，未列出的服务商使用 DEFAULT_MODEL"""
+    return model.get(provider) if isinstance(model, dict) else model
+
+
+def get_routed_chat_model(model: Optional[Union[str, Dict[str, str]]] = None,
+                          temperature: Optional[float] = None) -> BaseChatModel:
+    """
+    获取在多个服务商之间路由的Chat模型。未启用路由或只配置了一个服务商时返回 Config.LLM_TYPE 的Chat模型。
+
+    Args:
+        model: 模型名称或 服务商 -> 模型 的映射，默认各服务商的 DEFAULT_MODEL。
+        temperature: 温度，默认 Config.LLM_TEMPERATURE。
+    """
+    providers = router_providers()
+    if not Config.LLM_ROUTER_ENABLED or len(providers) < 2:
+        return get_chat_model(model=_model_for(Config.LLM_TYPE, model), temperature=temperature)
+    temperature = Config.LLM_TEMPERATURE if temperature is None else temperature
+    key = (tuple(providers), tuple(sorted(model.items())) if isinstance(model, dict) else model, temperature)
+    if key not in _routers:
+        backends = {}
+        for provider in providers:
+            # 由路由负责重试其他服务商，后端不再自行重试
+            chat_model = get_chat_model(provider, _model_for(provider, model), temperature, max_retries=0)
+            backends[f"{provider}:{chat_model.model_name}"] = chat_model
+        _routers[key] = LLMRouter(backends=backends, temperature=temperature)
+        logger.info(f"LLM router over {list(backends)}")
+    return _routers[key]
+
+
+def get_tier_model(tier: str) -> BaseChatModel:
+    """按 config.yaml 的 models.TIERS 获取档位对应的Chat模型，启用 llm_router 时同样在多个服务商之间路由"""
+    if tier not in Config.MODEL_TIERS:
+        raise ValueError(f"未配置的模型档位: {tier}. 可用的档位: {list(Config.MODEL_TIERS)}")
+    config = Config.MODEL_TIERS[tier] or {}
+    return get_routed_chat_model(model=config.get('MODEL') or None, temperature=config.get('TEMPERATURE'))
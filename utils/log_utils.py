@@ -0,0 +1,197 @@
+import atexit
+import copy
+import datetime
+import json
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+from concurrent_log_handler import ConcurrentRotatingFileHandler
+
+from utils.config_utils import Config
+
+try:
+    import orjson
+
+
+    def _dumps(entry: dict) -> str:
+        return orjson.dumps(entry, default=str).decode("utf-8")
+except ImportError:  # orjson 未安装时使用标准库
+    def _dumps(entry: dict) -> str:
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# LogRecord 的标准属性，其余属性视为通过 extra 传入的结构化字段
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "sampled_out"}
+
+
+def truncate(text: str, limit: int) -> str:
+    """超过 limit 个字符的文本只保留开头，并注明原始长度"""
+    if limit <= 0 or len(text) <= limit:
+        return text
+    return f"{text[:limit]}...[truncated {len(text) - limit} of {len(text)} chars]"
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行JSON，extra 传入的字段原样保留"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if getattr(record, "sampled_out", 0):
+            entry["sampled_out"] = record.sampled_out
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return _dumps(entry)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    对高频日志采样：WARNING 以下的日志按调用位置（文件和行号）计数，每个位置每秒保留前 burst 条，
+    超出部分每 every 条保留一条，被丢弃的条数记录在下一条保留日志的 sampled_out 字段中。
+    WARNING 及以上级别的日志全部保留。
+    """
+
+    def __init__(self, burst: int, every: int):
+        super().__init__()
+        self.burst = burst
+        self.every = every
+        self._lock = threading.Lock()
+        # (文件, 行号) -> [当前窗口开始时间, 窗口内条数, 累计丢弃条数]
+        self._sites: Dict[tuple, list] = {}
+        self.kept = 0
+        self.dropped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.burst <= 0:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None or now - site[0] >= 1.0:
+                site = self._sites[key] = [now, 0, site[2] if site else 0]
+            site[1] += 1
+            if site[1] > self.burst and (self.every <= 1 or (site[1] - self.burst) % self.every):
+                site[2] += 1
+                self.dropped += 1
+                return False
+            if site[2]:
+                record.sampled_out = site[2]
+                site[2] = 0
+            self.kept += 1
+            return True
+
+    def get_metrics(self) -> Dict[str, float]:
+        return {"kept": self.kept, "dropped": self.dropped}
+
+
+class TruncatingFilter(logging.Filter):
+    """截断过长的日志消息，如完整的工具输出和提示词"""
+
+    def __init__(self, max_chars: int):
+        super().__init__()
+        self.max_chars = max_chars
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        message = record.getMessage()
+        if self.max_chars > 0 and len(message) > self.max_chars:
+            record.msg = truncate(message, self.max_chars)
+            record.args = None
+        return True
+
+
+class RecordQueueHandler(QueueHandler):
+    """
+    入队时不格式化日志，格式化及写文件由 QueueListener 的后台线程完成。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # 异常对象引用的栈帧不能跨线程保留，在入队前转换为文本
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_handler: Optional[logging.Handler] = None
+_listener: Optional[QueueListener] = None
+_sampler: Optional[SamplingFilter] = None
+_lock = threading.Lock()
+
+
+def _file_handler() -> logging.Handler:
+    handler = ConcurrentRotatingFileHandler(
+        # 日志文件
+        Config.LOG_FILE,
+        # 日志文件最大允许大小为5MB，达到上限后触发轮转
+        maxBytes=Config.MAX_BYTES,
+        # 在轮转时，最多保留3个历史日志文件
+        backupCount=Config.BACKUP_COUNT
+    )
+    handler.setLevel(logging.DEBUG)
+    handler.setFormatter(JsonFormatter() if Config.LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+    return handler
+
+
+def get_log_handler() -> logging.Handler:
+    """
+    获取进程内共享的日志处理器。LOG_ASYNC 启用时返回 QueueHandler，写文件由后台线程完成，
+    进程退出时自动停止后台线程并写出剩余日志；否则直接返回文件处理器。
+    """
+    global _handler, _listener, _sampler
+    with _lock:
+        if _handler is not None:
+            return _handler
+        file_handler = _file_handler()
+        if Config.LOG_ASYNC:
+            log_queue = queue.Queue(-1)
+            _handler = RecordQueueHandler(log_queue)
+            _listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+            _listener.start()
+            atexit.register(stop_logging)
+        else:
+            _handler = file_handler
+        _handler.setLevel(logging.DEBUG)
+        _sampler = SamplingFilter(Config.LOG_SAMPLE_BURST, Config.LOG_SAMPLE_EVERY)
+        _handler.addFilter(_sampler)
+        _handler.addFilter(TruncatingFilter(Config.LOG_MAX_MESSAGE_CHARS))
+        return _handler
+
+
+def configure_logger(logger: logging.Logger, level: int = logging.DEBUG) -> logging.Logger:
+    """清空 logger 已有的处理器，并使用共享的日志处理器"""
+    logger.setLevel(level)
+    logger.handlers = [get_log_handler()]
+    return logger
+
+
+def stop_logging() -> None:
+    """停止后台写日志线程，队列中剩余的日志会先写出"""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+            _listener = None
+
+
+def get_log_metrics() -> Dict[str, float]:
+    return _sampler.get_metrics() if _sampler is not None else {}
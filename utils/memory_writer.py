@@ -0,0 +1,160 @@
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from langgraph.store.base import BaseStore, PutOp, SearchOp
+
+from utils.config_utils import Config
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split()).casefold()
+
+
+class MemoryWriter:
+    """
+    记忆写入的后台队列（write-behind）。
+
+    submit 立即返回，后台线程在 max_wait_ms 内收集记忆并通过一次 store.batch 批量写入。
+    写入前去掉同一批内规范化后相同的记忆，以及与已有记忆相似度不低于 dedup_threshold 的记忆。
+    尚未写入的记忆可通过 pending 读取，保证同一用户在对话中能读到自己刚写入的记忆。
+    """
+
+    def __init__(self, max_batch_size: int = Config.MEMORY_WRITE_BATCH_SIZE,
+                 max_wait_ms: float = Config.MEMORY_WRITE_MAX_WAIT_MS,
+                 dedup_threshold: float = Config.MEMORY_DEDUP_THRESHOLD):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.dedup_threshold = dedup_threshold
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        # (id(store), namespace) -> {规范化文本: 记忆}，写入完成后移除
+        self._pending = {}
+        self._unfinished = 0
+        self._idle = threading.Condition(self._lock)
+        self._worker = None
+        self._metrics = {"submitted": 0, "written": 0, "duplicates": 0, "batches": 0, "errors": 0}
+
+    def get_metrics(self) -> Dict[str, int]:
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics["pending"] = self._unfinished
+        return metrics
+
+    def _ensure_worker(self) -> None:
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="memory-writer", daemon=True)
+                self._worker.start()
+
+    def submit(self, store: BaseStore, namespace: Tuple[str, ...], memory: str) -> None:
+        """提交一条记忆，立即返回"""
+        key = (id(store), namespace)
+        with self._lock:
+            pending = self._pending.setdefault(key, OrderedDict())
+            if _normalize(memory) in pending:
+                self._metrics["duplicates"] += 1
+                return
+            pending[_normalize(memory)] = memory
+            self._metrics["submitted"] += 1
+            self._unfinished += 1
+        self._ensure_worker()
+        self._queue.put((store, namespace, memory))
+
+    def pending(self, store: BaseStore, namespace: Tuple[str, ...]) -> List[str]:
+        """返回该命名空间中已提交但尚未写入的记忆"""
+        with self._lock:
+            return list(self._pending.get((id(store), namespace), {}).values())
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待已提交的记忆全部写入，超时返回False"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._unfinished:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def _collect(self) -> List[tuple]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _duplicates(self, store: BaseStore, entries: List[Tuple[Tuple[str, ...], str]]) -> List[bool]:
+        """通过一次批量检索判断每条记忆是否与已写入的记忆语义相似度达到阈值"""
+        if not self.dedup_threshold:
+            return [False] * len(entries)
+        results = store.batch([SearchOp(namespace, query=memory, limit=1) for namespace, memory in entries])
+        return [bool(items) and items[0].score is not None and items[0].score >= self.dedup_threshold
+                for items in results]
+
+    def _write(self, store: BaseStore, entries: List[Tuple[Tuple[str, ...], str]]) -> int:
+        ops = []
+        for (namespace, memory), duplicate in zip(entries, self._duplicates(store, entries)):
+            if duplicate:
+                with self._lock:
+                    self._metrics["duplicates"] += 1
+                continue
+            # 只对记忆文本建立向量索引，与去重时的查询文本直接可比
+            ops.append(PutOp(namespace, str(uuid.uuid4()), {"data": memory}, index=["data"]))
+        if ops:
+            store.batch(ops)
+        return len(ops)
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            # 按存储实例分组，每组一次批量写入
+            groups = OrderedDict()
+            for store, namespace, memory in batch:
+                groups.setdefault(id(store), (store, []))[1].append((namespace, memory))
+            for store, entries in groups.values():
+                try:
+                    written = self._write(store, entries)
+                    with self._lock:
+                        self._metrics["written"] += written
+                        self._metrics["batches"] += 1
+                    logger.info(f"Stored {written} memories in one batch")
+                except Exception as e:
+                    logger.error(f"Error writing memories: {e}")
+                    with self._lock:
+                        self._metrics["errors"] += 1
+                finally:
+                    with self._idle:
+                        for namespace, memory in entries:
+                            pending = self._pending.get((id(store), namespace))
+                            if pending is not None:
+                                pending.pop(_normalize(memory), None)
+                                if not pending:
+                                    del self._pending[(id(store), namespace)]
+                        self._unfinished -= len(entries)
+                        self._idle.notify_all()
+
+
+_memory_writer: Optional[MemoryWriter] = None
+_memory_writer_lock = threading.Lock()
+
+
+def get_memory_writer() -> MemoryWriter:
+    """获取进程级的记忆写入队列"""
+    global _memory_writer
+    with _memory_writer_lock:
+        if _memory_writer is None:
+            _memory_writer = MemoryWriter()
+        return _memory_writer
@@ -0,0 +1,108 @@
+import hashlib
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from langgraph.store.base import BaseStore
+
+from utils.config_utils import Config
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticCache:
+    """
+    基于 PostgresStore 向量索引的语义答案缓存。
+
+    用户问题与已缓存问题的相似度不低于 threshold 时直接返回缓存的最终报告，
+    跳过计划和执行流程。缓存按用户隔离（scope=user）或全局共享（scope=global），
+    超过 ttl 秒的记录视为过期并在命中时删除。
+    """
+
+    def __init__(self, store: BaseStore, threshold: float = Config.SEMANTIC_CACHE_THRESHOLD,
+                 ttl: float = Config.SEMANTIC_CACHE_TTL, scope: str = Config.SEMANTIC_CACHE_SCOPE,
+                 namespace: str = Config.SEMANTIC_CACHE_NAMESPACE):
+        self.store = store
+        self.threshold = threshold
+        self.ttl = ttl
+        self.scope = scope
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._metrics = {"hits": 0, "misses": 0, "writes": 0, "expired": 0}
+
+    def _record(self, **values: int) -> None:
+        with self._lock:
+            for key, value in values.items():
+                self._metrics[key] += value
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """返回命中、未命中、写入和过期次数，以及命中率"""
+        with self._lock:
+            metrics = dict(self._metrics)
+        lookups = metrics["hits"] + metrics["misses"]
+        metrics["hit_rate"] = metrics["hits"] / lookups if lookups else 0.0
+        return metrics
+
+    def _namespace(self, user_id: Optional[str]) -> Tuple[str, str]:
+        if self.scope == "global":
+            return self.namespace, "global"
+        return self.namespace, str(user_id or "unknown")
+
+    @staticmethod
+    def _key(query: str) -> str:
+        return hashlib.sha1(query.strip().encode("utf-8")).hexdigest()
+
+    def _expired(self, value: Dict[str, Any]) -> bool:
+        return bool(self.ttl) and time.time() - value.get("created_at", 0) > self.ttl
+
+    async def alookup(self, query: str, user_id: Optional[str] = None) -> Optional[str]:
+        """
+        查找语义相近问题的缓存答案。
+
+        Returns:
+            str: 相似度达到阈值且未过期的缓存答案，没有时返回None。
+        """
+        namespace = self._namespace(user_id)
+        try:
+            items = await self.store.asearch(namespace, query=query, limit=1)
+        except Exception as e:
+            logger.error(f"Semantic cache lookup failed: {e}")
+            self._record(misses=1)
+            return None
+        if items and items[0].score is not None and items[0].score >= self.threshold:
+            item = items[0]
+            if not self._expired(item.value):
+                self._record(hits=1)
+                logger.info(f"Semantic cache hit (score={item.score:.4f}): {item.value.get('query')}")
+                return item.value.get("answer")
+            self._record(expired=1)
+            await self.store.adelete(namespace, item.key)
+        self._record(misses=1)
+        return None
+
+    async def aupdate(self, query: str, answer: str, user_id: Optional[str] = None) -> None:
+        """缓存问题的最终答案，只对问题文本建立向量索引"""
+        try:
+            await self.store.aput(self._namespace(user_id), self._key(query),
+                                  {"query": query, "answer": answer, "created_at": time.time()}, index=["query"])
+            self._record(writes=1)
+        except Exception as e:
+            logger.error(f"Semantic cache update failed: {e}")
+
+    async def ainvalidate(self, query: str, user_id: Optional[str] = None) -> None:
+        """删除问题对应的缓存答案"""
+        await self.store.adelete(self._namespace(user_id), self._key(query))
+
+
+_semantic_cache: Optional[SemanticCache] = None
+
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """获取语义缓存，未启用时返回None"""
+    return _semantic_cache
+
+
+def set_semantic_cache(cache: Optional[SemanticCache]) -> None:
+    global _semantic_cache
+    _semantic_cache = cache
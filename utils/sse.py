@@ -0,0 +1,95 @@
+import json
+import time
+from typing import Any, Optional
+
+try:
+    import orjson
+
+
+    def _dumps(value: Any) -> bytes:
+        return orjson.dumps(value)
+except ImportError:  # orjson 未安装时使用标准库
+    def _dumps(value: Any) -> bytes:
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class ChunkEncoder:
+    """
+    预先生成 chat.completion.chunk 的字节前缀和后缀，每个数据块只需转义并插入 delta 内容。
+    同一个流的 id 和 created 保持不变。
+    """
+
+    def __init__(self, chunk_id: str, created: Optional[int] = None):
+        self.chunk_id = chunk_id
+        self.created = created if created is not None else int(time.time())
+        head = b'data: {"id":' + _dumps(chunk_id) + b',"object":"chat.completion.chunk","created":' + \
+            str(self.created).encode() + b',"choices":[{"index":0,"delta":'
+        self._content_prefix = head + b'{"content":'
+        self._content_suffix = b'},"finish_reason":null}]}\n\n'
+        self._role = head + b'{"role":"assistant"},"finish_reason":null}]}\n\n'
+        self._stop = head + b'{},"finish_reason":"stop"}]}\n\n'
+        self._usage_prefix = b'data: {"id":' + _dumps(chunk_id) + b',"object":"chat.completion.chunk","created":' + \
+            str(self.created).encode() + b',"choices":[],"usage":'
+
+    def role(self) -> bytes:
+        return self._role
+
+    def content(self, text: str) -> bytes:
+        return self._content_prefix + _dumps(text) + self._content_suffix
+
+    def stop(self) -> bytes:
+        return self._stop
+
+    def usage(self, usage: Any) -> bytes:
+        """stream_options.include_usage 时在结束块之后发送的用量数据块，choices 为空"""
+        return self._usage_prefix + _dumps(usage) + b"}\n\n"
+
+    @staticmethod
+    def event(name: str, payload: Any) -> bytes:
+        """自定义类型的SSE事件，只读取 data 的客户端会忽略"""
+        return b"event: " + name.encode() + b"\ndata: " + _dumps(payload) + b"\n\n"
+
+    @staticmethod
+    def error(message: str) -> bytes:
+        return b'data: {"error":' + _dumps(message) + b"}\n\n"
+
+
+class ChunkCoalescer:
+    """
+    合并过小的文本增量：缓冲的文本达到 max_chars 个字符，或最早的缓冲已等待 max_delay 秒时输出一帧。
+    第一个增量立即输出，不影响首个token的延迟。
+
+    只在新的增量到达时检查等待时间，不额外创建定时任务；报告生成期间token连续到达，
+    上游停顿时缓冲的文本最迟在流结束时通过 flush 输出。
+    """
+
+    def __init__(self, max_chars: int, max_delay: float):
+        self.max_chars = max_chars
+        self.max_delay = max_delay
+        self._buffer = []
+        self._buffered = 0
+        self._since = 0.0
+        self._first = True
+
+    def add(self, text: str) -> Optional[str]:
+        """加入一个增量，需要输出一帧时返回合并后的文本，否则返回None"""
+        if self._first or self.max_chars <= 1:
+            self._first = False
+            return text
+        now = time.monotonic()
+        if not self._buffer:
+            self._since = now
+        self._buffer.append(text)
+        self._buffered += len(text)
+        if self._buffered >= self.max_chars or now - self._since >= self.max_delay:
+            return self.flush()
+        return None
+
+    def flush(self) -> Optional[str]:
+        """取出缓冲的全部文本，没有缓冲时返回None"""
+        if not self._buffer:
+            return None
+        text = "".join(self._buffer)
+        self._buffer.clear()
+        self._buffered = 0
+        return text
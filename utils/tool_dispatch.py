@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import time
+import weakref
+from typing import Any, Dict, List, Optional
+
+from utils.config_utils import Config
+from utils.hooks import emit
+from utils.tool_idempotency import IdempotencyScope, get_tool_result_store
+
+logger = logging.getLogger(__name__)
+
+# 事件循环 -> {工具名称: 信号量}，信号量只能在创建它的事件循环中使用
+_loop_semaphores = weakref.WeakKeyDictionary()
+
+
+def _get_semaphore(tool_name: str, max_concurrency: int) -> asyncio.Semaphore:
+    """获取当前事件循环中指定工具的并发信号量"""
+    semaphores = _loop_semaphores.setdefault(asyncio.get_running_loop(), {})
+    if tool_name not in semaphores:
+        semaphores[tool_name] = asyncio.Semaphore(max_concurrency)
+    return semaphores[tool_name]
+
+
+async def _run_tool_call(tool_call: Dict[str, Any], tools_dict: Dict[str, Any], timeout: float,
+                         max_concurrency: int, idempotency_key: Optional[str] = None,
+                         thread_id: str = "") -> Dict[str, Any]:
+    """
+    执行单个工具调用，异常和超时都会转换为错误结果返回，不会影响同一轮的其他工具调用。
+    传入幂等键时，已成功执行过的调用直接返回记录的结果，成功的结果会被记录。
+
+    Returns:
+        dict: 包含 tool_call、result、error（是否出错）、elapsed（秒，包含排队时间）、wait（排队秒数）
+        和 replayed（是否为记录的结果）
+    """
+    tool_name = tool_call['name']
+    store = get_tool_result_store() if idempotency_key else None
+    if store is not None:
+        try:
+            found, result = await store.aget(idempotency_key)
+        except Exception as e:
+            logger.error(f"Failed to look up idempotent result of {tool_name}: {e}")
+            found = False
+        if found:
+            logger.info(f"Tool call {tool_name} already completed, returning the recorded result")
+            return {'tool_call': tool_call, 'result': result, 'error': False, 'elapsed': 0.0, 'wait': 0.0,
+                    'replayed': True}
+    start = time.perf_counter()
+    wait = 0.0
+    try:
+        tool = tools_dict.get(tool_name)
+        if tool is None:
+            raise ValueError(f"Tool {tool_name} not found")
+        async with _get_semaphore(tool_name, max_concurrency):
+            wait = time.perf_counter() - start
+            result = await asyncio.wait_for(tool.ainvoke(tool_call['args']), timeout)
+        error = False
+    except asyncio.TimeoutError:
+        result = f"Error: tool {tool_name} timed out after {timeout:.3g}s"
+        error = True
+    except Exception as e:
+        result = f"Error: {str(e)}"
+        error = True
+    elapsed = time.perf_counter() - start
+    emit("tool_call", tool=tool_name, elapsed=elapsed, wait=wait, error=error)
+    if error:
+        logger.error(f"Tool call {tool_name} failed in {elapsed:.3f}s: {result}")
+    else:
+        logger.info(f"Tool call {tool_name} finished in {elapsed:.3f}s (queued {wait:.3f}s)")
+        if store is not None:
+            try:
+                # 工具已经执行完成，请求在此时被取消也要写入记录，恢复运行时才不会重复执行
+                await asyncio.shield(store.aput(idempotency_key, thread_id, tool_name, result))
+            except Exception as e:
+                logger.error(f"Failed to record idempotent result of {tool_name}: {e}")
+    return {'tool_call': tool_call, 'result': result, 'error': error, 'elapsed': elapsed, 'wait': wait,
+            'replayed': False}
+
+
+async def dispatch_tool_calls(tool_calls: List[Dict[str, Any]], tools_dict: Dict[str, Any],
+                              timeout: float = Config.TOOL_CALL_TIMEOUT,
+                              max_concurrency: int = Config.TOOL_MAX_CONCURRENCY,
+                              scope: Optional[IdempotencyScope] = None,
+                              thread_id: str = "") -> List[Dict[str, Any]]:
+    """
+    并发执行LLM一轮返回的全部工具调用。
+
+    Args:
+        tool_calls: LLM返回的工具调用列表，每项包含 name、args 和 id。
+        tools_dict: 工具名称到工具实例的映射。
+        timeout: 单个工具调用的超时时间（秒）。
+        max_concurrency: 同一个工具在当前事件循环中的最大并发调用数。
+        scope: 当前STEP的幂等键生成器，为None时不做幂等处理。
+        thread_id: 记录结果时关联的线程ID。
+
+    Returns:
+        list: 与 tool_calls 顺序一致的执行结果。
+    """
+    # 幂等键按 tool_calls 的顺序生成，恢复运行时与首次执行一致
+    keys = [scope.key_for(tool_call) if scope is not None else None for tool_call in tool_calls]
+    return list(await asyncio.gather(
+        *(_run_tool_call(tool_call, tools_dict, timeout, max_concurrency, key, thread_id)
+          for tool_call, key in zip(tool_calls, keys))))
@@ -0,0 +1,126 @@
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from utils.config_utils import Config
+
+logger = logging.getLogger(__name__)
+
+
+class IdempotencyScope:
+    """
+    一次STEP执行中工具调用的幂等键生成器。
+
+    键由 thread_id、本轮对话的 run_id、STEP id、工具名称、规范化的参数，以及相同调用在本STEP中第几次出现组成。
+    恢复运行时重新执行的STEP会按相同顺序生成相同的键，已成功的工具调用直接返回记录的结果；
+    同一STEP中重复的相同调用（如写入前后两次读取同一文件）按出现次数区分，不会互相复用。
+    """
+
+    def __init__(self, thread_id: str, run_id: str, step_id: str):
+        self.prefix = f"{thread_id}|{run_id}|{step_id}"
+        self._occurrences: Dict[str, int] = {}
+
+    def key_for(self, tool_call: Dict[str, Any]) -> str:
+        call = f"{tool_call['name']}|{json.dumps(tool_call.get('args') or {}, sort_keys=True, ensure_ascii=False, default=str)}"
+        occurrence = self._occurrences.get(call, 0)
+        self._occurrences[call] = occurrence + 1
+        return hashlib.sha256(f"{self.prefix}|{call}|{occurrence}".encode("utf-8")).hexdigest()
+
+
+class ToolResultStore:
+    """按幂等键记录成功的工具调用结果"""
+
+    async def aget(self, key: str) -> Tuple[bool, Any]:
+        """返回 (是否命中, 结果)"""
+        raise NotImplementedError
+
+    async def aput(self, key: str, thread_id: str, tool_name: str, result: Any) -> None:
+        raise NotImplementedError
+
+
+class MemoryToolResultStore(ToolResultStore):
+    """进程内的结果记录，请求超时或取消后在同一进程中恢复时有效"""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def aget(self, key: str) -> Tuple[bool, Any]:
+        with self._lock:
+            if key not in self._results:
+                return False, None
+            self._results.move_to_end(key)
+            return True, self._results[key]
+
+    async def aput(self, key: str, thread_id: str, tool_name: str, result: Any) -> None:
+        with self._lock:
+            self._results[key] = result
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+
+
+class PostgresToolResultStore(ToolResultStore):
+    """
+    复用服务的异步数据库连接池，进程崩溃后恢复运行时同样有效。超过 ttl 秒的记录每 prune_interval 次写入清理一次。
+    """
+
+    def __init__(self, db_connection_pool, ttl: float = Config.TOOL_IDEMPOTENCY_TTL, prune_interval: int = 100):
+        self.db_connection_pool = db_connection_pool
+        self.ttl = ttl
+        self.prune_interval = prune_interval
+        self._writes_since_prune = 0
+
+    async def setup(self) -> None:
+        async with self.db_connection_pool.connection() as conn:
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS tool_results (
+                    key TEXT PRIMARY KEY,
+                    thread_id TEXT NOT NULL,
+                    tool_name TEXT NOT NULL,
+                    result JSONB NOT NULL,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )""")
+            await conn.execute("CREATE INDEX IF NOT EXISTS tool_results_created_at ON tool_results (created_at)")
+
+    async def aget(self, key: str) -> Tuple[bool, Any]:
+        async with self.db_connection_pool.connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    "SELECT result FROM tool_results "
+                    "WHERE key = %s AND (%s = 0 OR created_at > now() - make_interval(secs => %s))",
+                    (key, self.ttl, self.ttl))
+                row = await cursor.fetchone()
+        return (True, row[0]) if row else (False, None)
+
+    async def aput(self, key: str, thread_id: str, tool_name: str, result: Any) -> None:
+        async with self.db_connection_pool.connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    "INSERT INTO tool_results (key, thread_id, tool_name, result) VALUES (%s, %s, %s, %s) "
+                    "ON CONFLICT (key) DO NOTHING",
+                    (key, thread_id, tool_name, json.dumps(result, ensure_ascii=False, default=str)))
+                self._writes_since_prune += 1
+                if self.ttl and self._writes_since_prune >= self.prune_interval:
+                    self._writes_since_prune = 0
+                    await cursor.execute("DELETE FROM tool_results WHERE created_at < now() - make_interval(secs => %s)",
+                                         (self.ttl,))
+
+
+_tool_result_store: Optional[ToolResultStore] = None
+
+
+def get_tool_result_store() -> Optional[ToolResultStore]:
+    """获取进程级的工具结果记录，未启用幂等时返回None；postgres 记录由 set_tool_result_store 在服务启动时设置"""
+    global _tool_result_store
+    if _tool_result_store is None and Config.TOOL_IDEMPOTENCY_ENABLED:
+        _tool_result_store = MemoryToolResultStore()
+    return _tool_result_store
+
+
+def set_tool_result_store(store: Optional[ToolResultStore]) -> None:
+    global _tool_result_store
+    _tool_result_store = store
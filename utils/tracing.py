@@ -0,0 +1,191 @@
+import contextvars
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from utils.config_utils import Config
+from utils.hooks import register_hook
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    """一次操作的耗时记录，字段与 OpenTelemetry 的 span 对应"""
+
+    __slots__ = ("trace_id", "span_id", "parent", "name", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, start_ns: Optional[int] = None,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.trace_id = parent.trace_id if parent is not None else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent = parent
+        self.name = name
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes or {}
+        self.error = False
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """转换为 OTLP/JSON 格式的 span"""
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent.span_id if self.parent is not None else "",
+            "name": self.name,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": 2 if self.error else 1},
+        }
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class FileSpanExporter:
+    """
+    后台线程批量写出 span，每行一个 OTLP/JSON 的 resourceSpans 对象，
+    可直接交给 OpenTelemetry Collector 的 file receiver 或自行分析。
+    """
+
+    def __init__(self, path: str = Config.TRACING_FILE, service_name: str = "multi-agent",
+                 max_batch_size: int = 256, flush_interval: float = 1.0):
+        self.path = path
+        self.service_name = service_name
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._worker.start()
+
+    def export(self, span: Span) -> None:
+        self._queue.put(span)
+
+    def _write(self, spans: List[Span]) -> None:
+        record = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": [span.to_otlp() for span in spans]}],
+        }]}
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+    def _run(self) -> None:
+        while True:
+            spans = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(spans) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    spans.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write(spans)
+            except Exception as e:
+                logger.error(f"Failed to export {len(spans)} spans: {e}")
+            finally:
+                for _ in spans:
+                    self._queue.task_done()
+
+    def flush(self) -> None:
+        """等待已提交的 span 全部写出"""
+        self._queue.join()
+
+
+class Tracer:
+    """
+    通过 hooks 事件生成 span：请求和graph节点是区间 span，当前 span 保存在 contextvars 中，
+    LLM调用、工具调用和检查点写入在结束时根据耗时补记为当前 span 的子 span。
+    """
+
+    def __init__(self, exporter: FileSpanExporter):
+        self.exporter = exporter
+        self._current = contextvars.ContextVar("current_span", default=None)
+
+    def current_span(self) -> Optional[Span]:
+        return self._current.get()
+
+    def _start(self, name: str, **attributes) -> None:
+        self._current.set(Span(name, parent=self._current.get(), attributes=attributes))
+
+    def _end(self, name: str, error: bool = False, **attributes) -> None:
+        span = self._current.get()
+        # 只结束同名的 span，避免 tracing 启用前已开始的操作导致嵌套错位
+        if span is None or span.name != name:
+            return
+        span.end_ns = time.time_ns()
+        span.error = error
+        span.attributes.update(attributes)
+        self._current.set(span.parent)
+        self.exporter.export(span)
+
+    def _record(self, name: str, elapsed: float, error: bool = False, **attributes) -> None:
+        end_ns = time.time_ns()
+        span = Span(name, parent=self._current.get(), start_ns=end_ns - int(elapsed * 1e9), attributes=attributes)
+        span.end_ns = end_ns
+        span.error = error
+        self.exporter.export(span)
+
+    def on_request_start(self, stream):
+        self._start("chat_completions", stream=stream)
+
+    def on_request_end(self, stream, cached, elapsed, error):
+        self._end("chat_completions", error=error, cached=cached)
+
+    def on_node_start(self, node):
+        self._start(f"node {node}", node=node)
+
+    def on_node_end(self, node, elapsed, error):
+        self._end(f"node {node}", error=error)
+
+    def on_llm_call(self, model, elapsed, input_tokens, output_tokens, cached, error):
+        self._record("llm", elapsed, error, model=model, input_tokens=input_tokens, output_tokens=output_tokens,
+                     cached=cached)
+
+    def on_tool_call(self, tool, elapsed, wait, error):
+        self._record(f"tool {tool}", elapsed, error, tool=tool, wait_seconds=wait)
+
+    def on_checkpoint_write(self, kind, elapsed, error):
+        self._record(f"checkpoint {kind}", elapsed, error, kind=kind)
+
+    def install(self) -> None:
+        register_hook("request_start", self.on_request_start)
+        register_hook("request_end", self.on_request_end)
+        register_hook("node_start", self.on_node_start)
+        register_hook("node_end", self.on_node_end)
+        register_hook("llm_call", self.on_llm_call)
+        register_hook("tool_call", self.on_tool_call)
+        register_hook("checkpoint_write", self.on_checkpoint_write)
+
+
+_tracer: Optional[Tracer] = None
+
+
+def install_tracing() -> Optional[Tracer]:
+    """按 Config 启用追踪，未启用时返回None"""
+    global _tracer
+    if _tracer is None and Config.TRACING_ENABLED:
+        _tracer = Tracer(FileSpanExporter())
+        _tracer.install()
+    return _tracer
+
+
+def get_tracer() -> Optional[Tracer]:
+    return _tracer
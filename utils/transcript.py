@@ -0,0 +1,274 @@
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Callable, Iterable, List, Optional
+
+from langchain_core.messages import BaseMessage, HumanMessage, messages_from_dict
+from langchain_core.messages import message_to_dict as lc_message_to_dict
+
+from utils.config_utils import Config
+
+logger = logging.getLogger(__name__)
+
+
+def ensure_message(message: Any) -> BaseMessage:
+    """将字符串观察转换为消息，其余消息原样返回"""
+    if isinstance(message, BaseMessage):
+        return message
+    return HumanMessage(content=str(message))
+
+
+def ensure_message_id(message: BaseMessage) -> str:
+    """
+    返回消息ID，没有ID的消息按内容哈希生成确定性的ID并写回消息，
+    相同内容的提示消息因此只会被记录一次。
+    """
+    if not message.id:
+        payload = json.dumps(lc_message_to_dict(message), ensure_ascii=False, sort_keys=True, default=str)
+        message.id = f"msg-{hashlib.sha1(payload.encode('utf-8')).hexdigest()[:24]}"
+    return message.id
+
+
+# 当前节点本次运行新增的消息ID，由 record_message_refs 设置，节点结束时作为 all_messages 的状态更新返回
+_message_refs: ContextVar[Optional[List[str]]] = ContextVar("message_refs", default=None)
+
+
+def current_message_refs() -> Optional[List[str]]:
+    """当前节点本次运行新增的消息ID列表，不在 record_message_refs 包装的节点中运行时返回None"""
+    return _message_refs.get()
+
+
+def record_message_refs(func: Callable) -> Callable:
+    """
+    异步graph节点的装饰器：节点中LLM调用新增的消息ID通过 all_messages 的 reducer 返回，
+    不直接修改并行STEP共享的状态列表。
+    """
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        refs: List[str] = []
+        token = _message_refs.set(refs)
+        try:
+            result = await func(*args, **kwargs)
+        finally:
+            _message_refs.reset(token)
+        if refs and isinstance(result, dict):
+            result = {**result, 'all_messages': refs}
+        return result
+
+    return wrapper
+
+
+def _compact_record(message: BaseMessage) -> str:
+    record = lc_message_to_dict(message)
+    # 去掉空字段，减少每条记录的体积
+    record["data"] = {k: v for k, v in record["data"].items() if v not in (None, "", [], {})}
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+class TranscriptStore:
+    """
+    只追加的对话记录存储，每条消息按ID只写入一次，graph状态中只保存消息ID。
+    写入失败只记录日志，不影响已经成功的LLM调用；失败的消息不标记为已写入，再次出现时重新写入。
+    """
+
+    def __init__(self, seen_cache_size: int = 10000):
+        # (thread_id, message_id) 的最近写入缓存，避免重复写入
+        self._seen = OrderedDict()
+        self._seen_cache_size = seen_cache_size
+        self._lock = threading.Lock()
+
+    def _filter_new(self, thread_id: str, messages: Iterable[BaseMessage]) -> List[BaseMessage]:
+        """返回尚未写入的消息，写入成功后才由 _mark_seen 标记"""
+        new_messages = {}
+        with self._lock:
+            for message in messages:
+                if (thread_id, message.id) not in self._seen:
+                    new_messages.setdefault(message.id, message)
+        return list(new_messages.values())
+
+    def _mark_seen(self, thread_id: str, messages: List[BaseMessage]) -> None:
+        with self._lock:
+            for message in messages:
+                self._seen[(thread_id, message.id)] = True
+            while len(self._seen) > self._seen_cache_size:
+                self._seen.popitem(last=False)
+
+    def append(self, thread_id: str, messages: List[BaseMessage]) -> None:
+        new_messages = self._filter_new(thread_id, messages)
+        if not new_messages:
+            return
+        try:
+            self._write(thread_id, new_messages)
+        except Exception as e:
+            logger.error(f"Failed to write {len(new_messages)} transcript messages of thread {thread_id}: {e}")
+            return
+        self._mark_seen(thread_id, new_messages)
+
+    async def aappend(self, thread_id: str, messages: List[BaseMessage]) -> None:
+        new_messages = self._filter_new(thread_id, messages)
+        if not new_messages:
+            return
+        try:
+            await self._awrite(thread_id, new_messages)
+        except Exception as e:
+            logger.error(f"Failed to write {len(new_messages)} transcript messages of thread {thread_id}: {e}")
+            return
+        self._mark_seen(thread_id, new_messages)
+
+    def _write(self, thread_id: str, messages: List[BaseMessage]) -> None:
+        raise NotImplementedError
+
+    async def _awrite(self, thread_id: str, messages: List[BaseMessage]) -> None:
+        await asyncio.to_thread(self._write, thread_id, messages)
+
+    def _load(self, thread_id: str, message_ids: Optional[List[str]] = None) -> List[BaseMessage]:
+        raise NotImplementedError
+
+    async def aload(self, thread_id: str, message_ids: Optional[List[str]] = None) -> List[BaseMessage]:
+        """读取线程的对话记录，传入 message_ids 时按该顺序返回其中存在的消息"""
+        return await asyncio.to_thread(self._load, thread_id, message_ids)
+
+
+class NullTranscriptStore(TranscriptStore):
+    """不持久化对话记录"""
+
+    def _write(self, thread_id: str, messages: List[BaseMessage]) -> None:
+        pass
+
+    def _load(self, thread_id: str, message_ids: Optional[List[str]] = None) -> List[BaseMessage]:
+        return []
+
+
+class FileTranscriptStore(TranscriptStore):
+    """
+    每个线程一个JSONL文件，一行一条紧凑的消息记录。
+    文件数超过 max_files 时删除最久未写入的文件，单个文件超过 max_file_bytes 后不再追加，0 为不限制。
+    """
+
+    def __init__(self, directory: str = Config.TRANSCRIPT_DIRECTORY, max_files: int = Config.TRANSCRIPT_MAX_FILES,
+                 max_file_bytes: int = Config.TRANSCRIPT_MAX_FILE_BYTES, **kwargs):
+        super().__init__(**kwargs)
+        self.directory = directory
+        self.max_files = max_files
+        self.max_file_bytes = max_file_bytes
+        self._file_lock = threading.Lock()
+
+    def _path(self, thread_id: str) -> str:
+        safe_name = "".join(ch if ch.isalnum() or ch in "-_@." else "_" for ch in thread_id)
+        return os.path.join(self.directory, f"{safe_name}.jsonl")
+
+    def _prune(self) -> None:
+        """删除最久未写入的文件，只保留 max_files 个"""
+        paths = [entry for entry in os.scandir(self.directory) if entry.name.endswith(".jsonl")]
+        if len(paths) <= self.max_files:
+            return
+        paths.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in paths[:len(paths) - self.max_files]:
+            try:
+                os.remove(entry.path)
+            except OSError as e:
+                logger.error(f"Failed to remove transcript {entry.path}: {e}")
+
+    def _write(self, thread_id: str, messages: List[BaseMessage]) -> None:
+        lines = "".join(_compact_record(message) + "\n" for message in messages)
+        path = self._path(thread_id)
+        with self._file_lock:
+            os.makedirs(self.directory, exist_ok=True)
+            size = os.path.getsize(path) if os.path.exists(path) else None
+            if size is not None and 0 < self.max_file_bytes <= size:
+                logger.warning(f"Transcript {path} exceeds {self.max_file_bytes} bytes, dropping {len(messages)} messages")
+                return
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(lines)
+            # 只在新建文件时检查文件数
+            if size is None and self.max_files > 0:
+                self._prune()
+
+    def _load(self, thread_id: str, message_ids: Optional[List[str]] = None) -> List[BaseMessage]:
+        path = self._path(thread_id)
+        if not os.path.exists(path):
+            return []
+        records = OrderedDict()
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                records.setdefault(record["data"].get("id"), record)
+        if message_ids is not None:
+            return messages_from_dict([records[i] for i in message_ids if i in records])
+        return messages_from_dict(list(records.values()))
+
+
+class PostgresTranscriptStore(TranscriptStore):
+    """
+    基于异步连接池的Postgres对话记录，(thread_id, message_id) 为主键，重复写入会被忽略。
+    """
+
+    def __init__(self, db_connection_pool, **kwargs):
+        super().__init__(**kwargs)
+        self.db_connection_pool = db_connection_pool
+
+    async def setup(self) -> None:
+        async with self.db_connection_pool.connection() as conn:
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS transcript_messages (
+                    thread_id TEXT NOT NULL,
+                    message_id TEXT NOT NULL,
+                    seq BIGSERIAL,
+                    payload JSONB NOT NULL,
+                    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    PRIMARY KEY (thread_id, message_id)
+                )""")
+
+    def _write(self, thread_id: str, messages: List[BaseMessage]) -> None:
+        raise RuntimeError("PostgresTranscriptStore only supports async writes, use aappend")
+
+    async def _awrite(self, thread_id: str, messages: List[BaseMessage]) -> None:
+        rows = [(thread_id, message.id, _compact_record(message)) for message in messages]
+        async with self.db_connection_pool.connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.executemany(
+                    "INSERT INTO transcript_messages (thread_id, message_id, payload) VALUES (%s, %s, %s) "
+                    "ON CONFLICT (thread_id, message_id) DO NOTHING", rows)
+
+    async def aload(self, thread_id: str, message_ids: Optional[List[str]] = None) -> List[BaseMessage]:
+        async with self.db_connection_pool.connection() as conn:
+            async with conn.cursor() as cursor:
+                if message_ids is None:
+                    await cursor.execute(
+                        "SELECT message_id, payload FROM transcript_messages WHERE thread_id = %s ORDER BY seq",
+                        (thread_id,))
+                else:
+                    await cursor.execute(
+                        "SELECT message_id, payload FROM transcript_messages "
+                        "WHERE thread_id = %s AND message_id = ANY(%s)", (thread_id, message_ids))
+                rows = await cursor.fetchall()
+        records = {message_id: payload for message_id, payload in rows}
+        order = message_ids if message_ids is not None else list(records)
+        return messages_from_dict([records[i] for i in order if i in records])
+
+
+_transcript_store: Optional[TranscriptStore] = None
+
+
+def get_transcript_store() -> TranscriptStore:
+    """获取进程级的对话记录存储，默认按 Config.TRANSCRIPT_BACKEND 创建"""
+    global _transcript_store
+    if _transcript_store is None:
+        if Config.TRANSCRIPT_BACKEND == "file":
+            _transcript_store = FileTranscriptStore()
+        else:
+            # postgres 后端需要连接池，由 set_transcript_store 在服务启动时设置
+            _transcript_store = NullTranscriptStore()
+    return _transcript_store
+
+
+def set_transcript_store(store: TranscriptStore) -> None:
+    global _transcript_store
+    _transcript_store = store
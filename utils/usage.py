@@ -0,0 +1,140 @@
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Dict, Optional, Set
+
+from utils.config_utils import Config
+
+# 当前正在执行的graph节点，由 node_hook 设置，用于按节点统计LLM用量
+current_node: ContextVar[str] = ContextVar("current_node", default="")
+
+
+class RequestUsage:
+    """
+    单个请求的LLM用量及预算。graph 并发执行的STEP共享同一个实例（任务复制上下文时引用同一对象），
+    用量在所有STEP之间累计。
+    """
+
+    def __init__(self, user_id: str = "", token_budget: Optional[int] = None, time_budget: Optional[float] = None):
+        self.user_id = user_id
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.calls = 0
+        # 节点 -> {'input_tokens', 'output_tokens', 'calls'}
+        self.by_node: Dict[str, Dict[str, int]] = {}
+        self.token_budget = Config.REQUEST_TOKEN_BUDGET if token_budget is None else token_budget
+        time_budget = Config.REQUEST_TIME_BUDGET if time_budget is None else time_budget
+        self.started = time.perf_counter()
+        self.deadline = self.started + time_budget if time_budget > 0 else None
+        # 因执行上限或预算提前结束的原因（STEP、计划更新或报告），非空时最终答案只基于部分结果
+        self.cut_short: Set[str] = set()
+        self._lock = threading.Lock()
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    def add(self, node: str, input_tokens: int, output_tokens: int) -> None:
+        with self._lock:
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+            self.calls += 1
+            usage = self.by_node.setdefault(node, {'input_tokens': 0, 'output_tokens': 0, 'calls': 0})
+            usage['input_tokens'] += input_tokens
+            usage['output_tokens'] += output_tokens
+            usage['calls'] += 1
+
+    def remaining_time(self) -> Optional[float]:
+        """距离请求截止时间的秒数，未设置耗时预算时返回None"""
+        return None if self.deadline is None else self.deadline - time.perf_counter()
+
+    def exhausted(self) -> Optional[str]:
+        """预算用尽时返回原因，否则返回None"""
+        if self.token_budget > 0 and self.total_tokens >= self.token_budget:
+            return f"token budget exhausted ({self.total_tokens}/{self.token_budget})"
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            return f"time budget exhausted ({self.deadline - self.started:.0f}s)"
+        return None
+
+    def to_openai(self) -> Dict[str, int]:
+        """OpenAI 兼容响应的 usage 字段"""
+        return {'prompt_tokens': self.input_tokens, 'completion_tokens': self.output_tokens,
+                'total_tokens': self.total_tokens}
+
+
+_request_usage: ContextVar[Optional[RequestUsage]] = ContextVar("request_usage", default=None)
+
+
+def start_request_usage(user_id: str = "", token_budget: Optional[int] = None,
+                        time_budget: Optional[float] = None) -> RequestUsage:
+    """开始统计当前请求（当前上下文及其中创建的任务）的LLM用量，预算默认取 Config 的 budget 配置"""
+    usage = RequestUsage(user_id, token_budget, time_budget)
+    _request_usage.set(usage)
+    return usage
+
+
+def get_request_usage() -> Optional[RequestUsage]:
+    return _request_usage.get()
+
+
+def mark_cut_short(reason: str) -> None:
+    """记录当前请求有部分执行因 reason 提前结束，不在请求中运行时忽略"""
+    usage = _request_usage.get()
+    if usage is not None:
+        usage.cut_short.add(reason)
+
+
+def budget_exhausted() -> Optional[str]:
+    """当前请求的预算用尽时返回原因；不在请求中运行（如离线脚本）时不限制"""
+    usage = _request_usage.get()
+    return usage.exhausted() if usage is not None else None
+
+
+class UsageAccounting:
+    """进程内按用户和节点累计的LLM用量，用户数超过 max_users 时淘汰最久未使用的用户"""
+
+    def __init__(self, max_users: int):
+        self.max_users = max_users
+        self.by_user: OrderedDict[str, Dict[str, int]] = OrderedDict()
+        self.by_node: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _add(totals: Dict[str, int], input_tokens: int, output_tokens: int) -> None:
+        totals['input_tokens'] = totals.get('input_tokens', 0) + input_tokens
+        totals['output_tokens'] = totals.get('output_tokens', 0) + output_tokens
+        totals['calls'] = totals.get('calls', 0) + 1
+
+    def record(self, input_tokens: int, output_tokens: int) -> None:
+        """计入一次LLM调用的用量，节点和用户取自当前上下文"""
+        node = current_node.get() or "other"
+        usage = _request_usage.get()
+        if usage is not None:
+            usage.add(node, input_tokens, output_tokens)
+        user_id = usage.user_id if usage is not None and usage.user_id else "anonymous"
+        with self._lock:
+            self._add(self.by_node.setdefault(node, {}), input_tokens, output_tokens)
+            totals = self.by_user.pop(user_id, None) or {}
+            self._add(totals, input_tokens, output_tokens)
+            self.by_user[user_id] = totals
+            while len(self.by_user) > self.max_users:
+                self.by_user.popitem(last=False)
+
+    def get_user_usage(self, user_id: str) -> Optional[Dict[str, int]]:
+        """返回用户累计的用量，用户未调用过LLM或已被淘汰时返回None"""
+        with self._lock:
+            totals = self.by_user.get(user_id)
+            return dict(totals) if totals is not None else None
+
+    def get_metrics(self) -> Dict[str, Dict[str, Dict[str, int]]]:
+        with self._lock:
+            return {'node': {node: dict(totals) for node, totals in self.by_node.items()},
+                    'user': {user: dict(totals) for user, totals in self.by_user.items()}}
+
+
+usage_accounting = UsageAccounting(Config.USAGE_MAX_TRACKED_USERS)
+
+
+def record_llm_usage(input_tokens: int, output_tokens: int) -> None:
+    usage_accounting.record(input_tokens, output_tokens)